@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Cold-start cost: how long `import server` takes, and how long a fresh uvicorn worker takes to answer.
+
+Each run is a new interpreter, so nothing is cached between repeats except the OS page cache.
+Time-to-first-request needs a reachable mongod (MONGO_URL, default localhost) since readiness waits for it.
+    cd backend && python benchmarks/bench_cold_start.py --repeat 5
+    python benchmarks/bench_cold_start.py --import-only --top 15   # also list the slowest imports
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import server; print(time.perf_counter() - t)"
+
+
+def bench_env():
+    env = dict(os.environ)
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "pulse_coldstart")
+    env.setdefault("JWT_SECRET", "coldstart-secret")
+    env["RUN_BACKGROUND_TASKS"] = "0"
+    return env
+
+
+def import_seconds(env):
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(env, top):
+    """Parse `python -X importtime` into (cumulative us, module), slowest first"""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import server"], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), module.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, deadline):
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.01)
+    return False
+
+
+def first_request_seconds(env, timeout):
+    """Spawn a worker and time until /api/health/ready, then until a real Mongo-backed request, returns 200"""
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for(f"http://127.0.0.1:{port}/api/health/ready", start + timeout):
+            raise RuntimeError(f"worker not ready within {timeout}s (is mongod reachable?)")
+        ready = time.perf_counter() - start
+        wait_for(f"http://127.0.0.1:{port}/api/events", start + timeout)
+        return ready, time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def summary(values):
+    return f"median {statistics.median(values) * 1000:8.1f} ms   min {min(values) * 1000:8.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and time-to-first-request for server.py")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--import-only", action="store_true", help="skip the uvicorn measurement (no mongod needed)")
+    parser.add_argument("--top", type=int, default=0, help="list the N slowest imports")
+    args = parser.parse_args()
+    env = bench_env()
+
+    print(f"import server:        {summary([import_seconds(env) for _ in range(args.repeat)])}")
+    if args.top:
+        for cumulative, module in slowest_imports(env, args.top):
+            print(f"    {cumulative / 1000:8.1f} ms  {module}")
+    if args.import_only:
+        return 0
+
+    runs = [first_request_seconds(env, args.timeout) for _ in range(args.repeat)]
+    print(f"spawn -> ready:       {summary([ready for ready, _ in runs])}")
+    print(f"spawn -> first GET:   {summary([first for _, first in runs])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
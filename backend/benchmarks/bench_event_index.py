@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Memory and query latency of the in-memory event index at catalog sizes no test database holds.
+
+Synthetic events are indexed directly (no Mongo); each query shape is timed over random parameters.
+    cd backend && python benchmarks/bench_event_index.py --events 100000
+    python benchmarks/bench_event_index.py --events 2000000 --queries 200
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+CITIES = [f"city{i}" for i in range(40)]
+GENRES = ["dancehall", "hiphop", "rnb", "soca", "afrobeat", "edm", "reggae", "latin", "jazz", "house"]
+VIBES = ["chill", "lit", "upscale", "street", "underground", "rooftop"]
+
+
+def synthetic_events(count, days, rng):
+    start = datetime.now(timezone.utc)
+    dates = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+    for _ in range(count):
+        yield {
+            "id": str(uuid.uuid4()),
+            "city": rng.choice(CITIES),
+            "genre": rng.sample(GENRES, rng.randint(1, 3)),
+            "vibe": rng.choice(VIBES),
+            "date": rng.choice(dates),
+            "is_featured": rng.random() < 0.05,
+            "price_cents": rng.choice([None, 0] + list(range(500, 15000, 500))),
+            "created_at": start.isoformat(),
+        }
+
+
+def query_shapes(rng, days):
+    today = datetime.now(timezone.utc)
+    weekend = [(today + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(4)]
+    return {
+        "all, by date": lambda: {},
+        "city": lambda: {"city": rng.choice(CITIES)},
+        "city+genre+vibe": lambda: {"city": rng.choice(CITIES), "genre": rng.choice(GENRES), "vibe": rng.choice(VIBES)},
+        "city+weekend": lambda: {"city": rng.choice(CITIES), "dates": weekend},
+        "featured": lambda: {"featured": True},
+        "city, price<$30": lambda: {"city": rng.choice(CITIES), "max_cents": 3000},
+        "city, by price": lambda: {"city": rng.choice(CITIES), "sort": "price"},
+        "genre, by -price": lambda: {"genre": rng.choice(GENRES), "sort": "-price"},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event index memory and latency")
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=120, help="distinct event dates")
+    parser.add_argument("--batch", type=int, default=server.EVENT_INDEX_PAGE_SIZE, help="rows per add_many, as in load")
+    parser.add_argument("--queries", type=int, default=500, help="timed queries per shape")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    index = server.EventIndex()
+    built = 0.0
+    events = synthetic_events(args.events, args.days, rng)
+    while True:
+        batch = list(islice(events, args.batch))
+        if not batch:
+            break
+        started = time.perf_counter()
+        index.add_many(batch)
+        built += time.perf_counter() - started
+    started = time.perf_counter()
+    index.price_orders()
+    sorted_in = time.perf_counter() - started
+    size = index.memory_bytes()
+    print(f"{args.events:,} events indexed in {built:.2f}s, price orders sorted in {sorted_in:.2f}s")
+    print(f"memory: {size / 1e6:.1f} MB total, {size / args.events * 100_000 / 1e6:.2f} MB per 100k events")
+
+    extra = list(synthetic_events(100, args.days, rng))
+    started = time.perf_counter()
+    for event in extra:
+        index.add(event)
+    print(f"single add: {(time.perf_counter() - started) / len(extra) * 1e6:.0f} us")
+
+    print(f"{'query':<20}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, params in query_shapes(rng, args.days).items():
+        timings = []
+        for _ in range(args.queries):
+            kwargs = params()
+            started = time.perf_counter()
+            index.search(limit=args.limit, **kwargs)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        p99 = timings[max(0, int(len(timings) * 0.99) - 1)]
+        print(f"{name:<20}{statistics.median(timings) * 1000:>10.3f}{p99 * 1000:>10.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
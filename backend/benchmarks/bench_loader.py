@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Mongo commands per 1k requests with and without the coalescing id loaders.
+
+Boots the app in-process against a scratch database, then fires bursts of concurrent requests that look up a
+few hot events and users, the pattern a popular event page produces. The same traffic runs with the loaders
+off, then on; commands are counted by the app's own Mongo command metrics.
+    cd backend && python benchmarks/bench_loader.py --requests 5000 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def find_commands(server):
+    """find commands sent so far on events and users"""
+    total = 0
+    for collection in ("events", "users"):
+        value = server.metrics_registry.get_sample_value(
+            "pulse_mongo_command_duration_seconds_count", {"collection": collection, "command": "find"}
+        )
+        total += value or 0
+    return total
+
+
+async def burst(client, requests, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(path, token):
+        async with slots:
+            start = time.perf_counter()
+            response = await client.get(path, headers={"Authorization": f"Bearer {token}"})
+            latencies.append(time.perf_counter() - start)
+            return response.status_code
+
+    codes = await asyncio.gather(*(one(path, token) for path, token in requests))
+    latencies.sort()
+    return codes, latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Coalesced id lookups: Mongo commands per 1k requests")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="pulse_bench_loader")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--events", type=int, default=20, help="distinct events requested")
+    parser.add_argument("--users", type=int, default=50, help="distinct users making requests")
+    parser.add_argument("--hot", type=float, default=0.8, help="share of requests for the 3 hottest events")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+    import server
+    from stripe_standin import StripeStandIn
+
+    scratch = AsyncIOMotorClient(args.mongo_url)
+    await scratch.drop_database(args.db_name)
+    scratch.close()
+
+    app = server.create_app(server.Settings(
+        mongo_url=args.mongo_url,
+        db_name=args.db_name,
+        jwt_secret="bench-secret",
+        stripe_integration=StripeStandIn().integration(),
+        run_background_tasks=False,
+        admission_control=False
+    ))
+    async with app.router.lifespan_context(app):
+        db = app.state.context.db
+        now = datetime.now(timezone.utc).isoformat()
+        users = [{"id": str(uuid.uuid4()), "email": f"u{i}@example.com", "username": f"u{i}", "city": "kingston",
+                  "password": "x", "created_at": now} for i in range(args.users)]
+        await db.users.insert_many([dict(u) for u in users])
+        tokens = [server.create_access_token({"sub": u["id"]}) for u in users]
+        event_ids = [str(uuid.uuid4()) for _ in range(args.events)]
+        await db.events.insert_many([{
+            "id": event_id, "title": f"Event {i}", "description": "d", "city": "kingston", "venue_name": "v",
+            "venue_address": "a", "date": now[:10], "time": "10 PM", "genre": ["dancehall"], "vibe": "lit",
+            "price": "$20", "price_cents": 2000, "currency": "usd", "is_featured": False, "attendee_count": 0,
+            "created_at": now
+        } for i, event_id in enumerate(event_ids)])
+
+        requests = []
+        for _ in range(args.requests):
+            hot = rng.random() < args.hot
+            event_id = rng.choice(event_ids[:3] if hot else event_ids)
+            path = rng.choice([f"/api/events/{event_id}", "/api/auth/me"])
+            requests.append((path, rng.choice(tokens)))
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench.test", timeout=None) as client:
+            await burst(client, requests[:200], args.concurrency)  # warm the pool and code paths
+            print(f"{'loaders':<10}{'find cmds':>12}{'per 1k req':>12}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+            for enabled in (False, True):
+                server.LOADER_ENABLED = enabled
+                before = find_commands(server)
+                started = time.perf_counter()
+                codes, latencies = await burst(client, requests, args.concurrency)
+                elapsed = time.perf_counter() - started
+                commands = find_commands(server) - before
+                if any(code != 200 for code in codes):
+                    print(f"non-200 responses: {sorted(set(codes))}")
+                    return 1
+                print(f"{'on' if enabled else 'off':<10}{commands:>12.0f}{commands / len(requests) * 1000:>12.1f}"
+                      f"{statistics.median(latencies) * 1000:>10.2f}{latencies[int(len(latencies) * 0.99) - 1] * 1000:>10.2f}"
+                      f"{len(requests) / elapsed:>10.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
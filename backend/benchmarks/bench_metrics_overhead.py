@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""Cost of the /metrics instrumentation relative to the request it measures.
+
+Times GET /api/events/{id} through the bare router and through MetricsMiddleware (Mongo stubbed out, so this
+is the worst case: the handler does almost no work), plus the per-command cost of the Mongo listener.
+    cd backend && python benchmarks/bench_metrics_overhead.py
+"""
+
+import sys
+
+from microbench import run
+
+
+def main():
+    results = run(["asgi.get_event", "metrics."], min_time=0.3, repeat=7)
+    plain = results["asgi.get_event"]["ns_per_op"]
+    instrumented = results["asgi.get_event_instrumented"]["ns_per_op"]
+    listener = results["metrics.mongo_command_listener"]["ns_per_op"]
+    print(f"GET /api/events/{{id}} bare router:       {plain / 1000:8.2f} us")
+    print(f"GET /api/events/{{id}} with middleware:   {instrumented / 1000:8.2f} us")
+    print(f"middleware overhead:                    {(instrumented - plain) / 1000:8.2f} us ({instrumented / plain - 1:+.1%})")
+    print(f"Mongo listener per command:             {listener / 1000:8.2f} us")
+    print(f"request + 1 Mongo command, total:       {(instrumented + listener) / plain - 1:+.1%} vs uninstrumented")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
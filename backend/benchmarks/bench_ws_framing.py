@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Bytes per message and CPU per broadcast for each /ws/chat framing mode.
+
+Runs against ConnectionManager with in-memory sockets, so no server or Mongo is needed:
+    cd backend && python benchmarks/bench_ws_framing.py --sockets 1000 --messages 500
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from server import ConnectionManager, WS_PROTOCOL_JSON, WS_PROTOCOL_MSGPACK  # noqa: E402
+
+WORDS = "yo who pulling up tonight the dancehall set at fiction was crazy link me later vibes lit soca".split()
+
+
+class FakeWebSocket:
+    """Just enough of starlette's WebSocket for ConnectionManager; optionally deflates like permessage-deflate"""
+
+    def __init__(self, subprotocol=None, deflate=False):
+        self.scope = {"subprotocols": [subprotocol] if subprotocol else []}
+        self.compressor = zlib.compressobj(wbits=-15) if deflate else None
+        self.frames = 0
+        self.wire_bytes = 0
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    def _record(self, data: bytes):
+        if self.compressor is not None:
+            # Context takeover across frames, trailing 00 00 ff ff stripped as RFC 7692 specifies
+            data = (self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH))[:-4]
+        self.frames += 1
+        self.wire_bytes += len(data)
+
+    async def send_text(self, data: str):
+        self._record(data.encode("utf-8"))
+
+    async def send_bytes(self, data: bytes):
+        self._record(data)
+
+    async def send_json(self, data):
+        self._record(json.dumps(data).encode("utf-8"))
+
+
+def build_messages(count: int, users: int):
+    people = [
+        {
+            "user_id": str(uuid.uuid4()),
+            "username": f"viber{i}",
+            "user_avatar": f"https://images.unsplash.com/photo-{random.randint(10**12, 10**13)}?w=200",
+        }
+        for i in range(users)
+    ]
+    start = datetime.now(timezone.utc)
+    messages = []
+    for i in range(count):
+        messages.append({
+            "id": str(uuid.uuid4()),
+            "city": "kingston",
+            **random.choice(people),
+            "content": " ".join(random.choices(WORDS, k=random.randint(3, 20))),
+            "created_at": (start + timedelta(seconds=i)).isoformat(),
+        })
+    return messages
+
+
+async def run_mode(name, subprotocol, deflate, messages, sockets):
+    manager = ConnectionManager()
+    fakes = [FakeWebSocket(subprotocol, deflate) for _ in range(sockets)]
+    for ws in fakes:
+        await manager.connect(ws, "kingston")
+
+    start = time.perf_counter()
+    for message in messages:
+        await manager.broadcast(message, "kingston")
+    elapsed = time.perf_counter() - start
+
+    sample = fakes[0]
+    return {
+        "mode": name,
+        "bytes_per_message": round(sample.wire_bytes / sample.frames, 1),
+        "us_per_broadcast": round(elapsed / len(messages) * 1e6, 1),
+        "us_per_send": round(elapsed / (len(messages) * sockets) * 1e6, 3),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sockets", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--users", type=int, default=40, help="distinct senders in the room")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    random.seed(7)
+    messages = build_messages(args.messages, args.users)
+    modes = [
+        ("json", None, False),
+        ("json+deflate", WS_PROTOCOL_JSON, True),
+        ("msgpack", WS_PROTOCOL_MSGPACK, False),
+        ("msgpack+deflate", WS_PROTOCOL_MSGPACK, True),
+    ]
+    results = [await run_mode(name, proto, deflate, messages, args.sockets) for name, proto, deflate in modes]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{args.messages} messages from {args.users} users broadcast to {args.sockets} sockets")
+    print(f"{'mode':<18}{'bytes/msg':>12}{'us/broadcast':>15}{'us/send':>10}")
+    for r in results:
+        print(f"{r['mode']:<18}{r['bytes_per_message']:>12}{r['us_per_broadcast']:>15}{r['us_per_send']:>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
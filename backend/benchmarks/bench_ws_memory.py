@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Per-connection memory of the chat connection bookkeeping at N sockets.
+
+Counts what ConnectionManager allocates per socket (ChatConnection, ChatSession, presence and heartbeat
+entries); the ASGI server's own WebSocket objects are excluded by creating the stand-ins before tracing:
+    cd backend && python benchmarks/bench_ws_memory.py --sockets 50000
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import tracemalloc
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from server import ChatSession, ConnectionManager, CITIES  # noqa: E402
+
+
+class FakeWebSocket:
+    __slots__ = ("scope",)
+
+    def __init__(self):
+        self.scope = {"subprotocols": []}
+
+    async def accept(self, subprotocol=None):
+        pass
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sockets", type=int, default=50000)
+    parser.add_argument("--tabs-per-user", type=int, default=2)
+    args = parser.parse_args()
+
+    manager = ConnectionManager()
+    sockets = [FakeWebSocket() for _ in range(args.sockets)]
+    users = [
+        (str(uuid.uuid4()), f"viber{i}", f"https://images.unsplash.com/photo-{i}?w=200")
+        for i in range(args.sockets // args.tabs_per_user + 1)
+    ]
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for i, ws in enumerate(sockets):
+        user_id, username, avatar = users[i // args.tabs_per_user]
+        await manager.connect(ws, CITIES[i % len(CITIES)], ChatSession(user_id, username, avatar))
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = after - before
+    print(json.dumps({
+        "sockets": args.sockets,
+        "online_users": sum(manager.online_count(city) for city in CITIES),
+        "total_bytes": total,
+        "bytes_per_connection": round(total / args.sockets, 1),
+        "peak_bytes": peak - before,
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the per-request CPU work in server.py, with stored baselines.
+
+    cd backend
+    python benchmarks/microbench.py run                     # print timings
+    python benchmarks/microbench.py save                    # record benchmarks/baseline.json
+    python benchmarks/microbench.py compare --tolerance 0.15  # exit 1 if anything got >15% slower
+
+Baselines are machine-specific; re-save them on the box that runs the comparison.
+Each benchmark reports the best of several repeats in nanoseconds per operation.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.security import HTTPAuthorizationCredentials  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+import server  # noqa: E402
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+# ---------- fixtures ----------
+
+def event_doc(i):
+    return {
+        "id": str(uuid.uuid4()),
+        "title": f"Dancehall Fridays #{i}",
+        "description": "The biggest dancehall party in Kingston. Live DJs, bottle service, and the hottest vibes.",
+        "city": "kingston",
+        "venue_name": "Fiction Nightclub",
+        "venue_address": "67 Knutsford Blvd, Kingston",
+        "date": (datetime.now(timezone.utc) + timedelta(days=i % 7)).strftime("%Y-%m-%d"),
+        "time": "10:00 PM",
+        "genre": ["dancehall", "reggae"],
+        "vibe": "lit",
+        "image_url": "https://images.unsplash.com/photo-1574155331040-87b9dae81218?w=800",
+        "price": "$20 USD",
+        "promoter_id": str(uuid.uuid4()),
+        "promoter_name": "promoter",
+        "is_featured": i % 3 == 0,
+        "attendee_count": 234,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def feed_doc(i):
+    return {
+        "id": str(uuid.uuid4()),
+        "content": "Kingston heating up tonight! Fiction is PACKED",
+        "city": "kingston",
+        "post_type": "vibe_check",
+        "user_id": str(uuid.uuid4()),
+        "username": f"viber{i}",
+        "user_avatar": None,
+        "is_verified": True,
+        "likes": 45,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+USER = {
+    "id": str(uuid.uuid4()),
+    "email": "bench@example.com",
+    "username": "bench",
+    "city": "kingston",
+    "is_verified": False,
+    "is_promoter": False,
+    "created_at": datetime.now(timezone.utc).isoformat(),
+}
+TOKEN = server.create_access_token({"sub": USER["id"]})
+EVENTS = [event_doc(i) for i in range(50)]
+POSTS = [feed_doc(i) for i in range(50)]
+EVENT_LIST = TypeAdapter(List[server.Event])
+FEED_LIST = TypeAdapter(List[server.FeedPost])
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length=None):
+        return self.docs
+
+
+class FakeCollection:
+    def __init__(self, doc):
+        self.doc = doc
+
+    async def find_one(self, query, projection=None):
+        return dict(self.doc)
+
+    def find(self, query, projection=None):
+        # What the batch loaders send: {"id": {"$in": [...]}}
+        return FakeCursor([dict(self.doc, id=key) for key in query["id"]["$in"]])
+
+
+class FakeDB:
+    users = FakeCollection(USER)
+    events = FakeCollection(EVENTS[0])
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+class FakeWebSocket:
+    def __init__(self, subprotocol=None):
+        self.scope = {"subprotocols": [subprotocol] if subprotocol else []}
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, data):
+        pass
+
+    async def send_bytes(self, data):
+        pass
+
+    async def send_json(self, data):
+        pass
+
+
+# ---------- benchmarks: each returns a callable (sync) or coroutine function (async) doing one op ----------
+
+@benchmark("jwt.create_access_token")
+def bench_jwt_encode():
+    return lambda: server.create_access_token({"sub": USER["id"]})
+
+
+@benchmark("jwt.get_current_user")
+def bench_get_current_user():
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=TOKEN)
+
+    async def op():
+        return await server.get_current_user(credentials)
+    return op
+
+
+@benchmark("model.Event")
+def bench_event_model():
+    doc = EVENTS[0]
+    return lambda: server.Event(**doc)
+
+
+@benchmark("model.FeedPost")
+def bench_feed_model():
+    doc = POSTS[0]
+    return lambda: server.FeedPost(**doc)
+
+
+@benchmark("serialize.events_x50")
+def bench_event_list():
+    return lambda: json.dumps(jsonable_encoder(EVENT_LIST.validate_python(EVENTS)))
+
+
+@benchmark("serialize.feed_x50")
+def bench_feed_list():
+    return lambda: json.dumps(jsonable_encoder(FEED_LIST.validate_python(POSTS)))
+
+
+@benchmark("event.price_components")
+def bench_price_components():
+    return lambda: server.price_components("$1,250 USD")
+
+
+@benchmark("admission.rate_limit_acquire")
+def bench_rate_limit_acquire():
+    limiter = server.RateLimiter({"default": (1e9, 10)}, 100000)
+    key = f"user:{USER['id']}"
+    return lambda: limiter.acquire("default", key)
+
+
+def broadcast_bench(subprotocol, sockets=1000):
+    manager = server.ConnectionManager()
+    loop = asyncio.get_event_loop()
+    for _ in range(sockets):
+        loop.run_until_complete(manager.connect(FakeWebSocket(subprotocol), "kingston"))
+    message = {
+        "id": str(uuid.uuid4()),
+        "city": "kingston",
+        "user_id": USER["id"],
+        "username": "bench",
+        "user_avatar": None,
+        "content": "yo who pulling up tonight",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+    async def op():
+        await manager.broadcast(message, "kingston")
+    return op
+
+
+@benchmark("ws.broadcast_json_x1000")
+def bench_broadcast_json():
+    return broadcast_bench(None)
+
+
+@benchmark("ws.broadcast_msgpack_x1000")
+def bench_broadcast_msgpack():
+    return broadcast_bench(server.WS_PROTOCOL_MSGPACK)
+
+
+def asgi_request(app, path):
+    """One GET through an ASGI app with no server or network around it"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "", "headers": [],
+        "server": ("bench", 80), "client": ("127.0.0.1", 5000), "app": server.app,
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    async def op():
+        await app(dict(scope), receive, send)
+    return op
+
+
+@benchmark("asgi.get_event")
+def bench_asgi_get_event():
+    return asgi_request(server.app.router, f"/api/events/{EVENTS[0]['id']}")
+
+
+@benchmark("asgi.get_event_instrumented")
+def bench_asgi_get_event_instrumented():
+    return asgi_request(server.MetricsMiddleware(server.app.router), f"/api/events/{EVENTS[0]['id']}")
+
+
+@benchmark("metrics.mongo_command_listener")
+def bench_mongo_listener():
+    listener = server.MongoCommandMetrics()
+    started = SimpleNamespace(command={"find": "events", "filter": {}}, command_name="find",
+                              request_id=1, connection_id=("localhost", 27017))
+    succeeded = SimpleNamespace(command_name="find", request_id=1, connection_id=("localhost", 27017),
+                                duration_micros=850)
+
+    def op():
+        listener.started(started)
+        listener.succeeded(succeeded)
+    return op
+
+
+# ---------- harness ----------
+
+def time_op(op, loop, number):
+    if asyncio.iscoroutinefunction(op):
+        async def runner():
+            start = time.perf_counter_ns()
+            for _ in range(number):
+                await op()
+            return time.perf_counter_ns() - start
+        return loop.run_until_complete(runner())
+    start = time.perf_counter_ns()
+    for _ in range(number):
+        op()
+    return time.perf_counter_ns() - start
+
+
+def measure(op, loop, min_time=0.2, repeat=5):
+    """Autorange like timeit, then keep the best repeat to filter scheduler noise"""
+    number = 1
+    while True:
+        elapsed = time_op(op, loop, number)
+        if elapsed >= min_time * 1e9 or number >= 10 ** 7:
+            break
+        number *= 2 if elapsed > min_time * 1e8 else 10
+    best = min(time_op(op, loop, number) for _ in range(repeat))
+    return best / number
+
+
+def run(selected, min_time, repeat):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    original_db = server.db
+    server.db = FakeDB()
+    results = {}
+    try:
+        for name, factory in BENCHMARKS.items():
+            if selected and not any(s in name for s in selected):
+                continue
+            results[name] = {"ns_per_op": round(measure(factory(), loop, min_time, repeat), 1)}
+    finally:
+        server.db = original_db
+        loop.close()
+    return results
+
+
+def machine():
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or platform.machine(),
+    }
+
+
+def print_table(results, baseline=None, tolerance=None):
+    print(f"{'benchmark':<30}{'ns/op':>14}" + (f"{'baseline':>14}{'change':>10}" if baseline else ""))
+    for name, result in results.items():
+        line = f"{name:<30}{result['ns_per_op']:>14,.1f}"
+        if baseline and name in baseline:
+            base = baseline[name]["ns_per_op"]
+            change = result["ns_per_op"] / base - 1
+            flag = "  REGRESSED" if change > tolerance else ""
+            line += f"{base:>14,.1f}{change:>+10.1%}{flag}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-path micro-benchmarks for server.py")
+    parser.add_argument("command", choices=["run", "save", "compare"])
+    parser.add_argument("-k", "--filter", action="append", help="only benchmarks whose name contains this")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown vs baseline (0.15 = 15%%)")
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.filter, args.min_time, args.repeat)
+
+    if args.command == "save":
+        stored = {}
+        if args.baseline.exists() and args.filter:
+            stored = json.loads(args.baseline.read_text())["benchmarks"]
+        stored.update(results)
+        args.baseline.write_text(json.dumps({"machine": machine(), "benchmarks": stored}, indent=2) + "\n")
+        print_table(results)
+        print(f"Saved {len(results)} baselines to {args.baseline}")
+        return 0
+
+    if args.command == "run":
+        if args.json:
+            print(json.dumps({"machine": machine(), "benchmarks": results}, indent=2))
+        else:
+            print_table(results)
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run `save` first")
+        return 2
+    baseline = json.loads(args.baseline.read_text())["benchmarks"]
+    print_table(results, baseline, args.tolerance)
+    regressed = [
+        name for name, result in results.items()
+        if name in baseline and result["ns_per_op"] > baseline[name]["ns_per_op"] * (1 + args.tolerance)
+    ]
+    if regressed:
+        print(f"\n{len(regressed)} benchmark(s) regressed beyond {args.tolerance:.0%}: {', '.join(regressed)}")
+        return 1
+    print(f"\nAll benchmarks within {args.tolerance:.0%} of baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
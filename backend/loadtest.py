@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""Load generator for the Pulse API: a realistic REST mix plus chat WebSocket fan-out.
+
+By default boots server.py under uvicorn inside this process, against a local mongod and the Stripe stand-in,
+so runs are reproducible and comparable. Use --target to hit a server that is already running instead.
+
+    cd backend && python loadtest.py --duration 60 --users 200 --sockets 3000 --out results/run.json
+
+Reports RPS and p50/p95/p99 per route plus chat broadcast fan-out latency as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+import websockets
+
+CITIES = ["kingston", "miami", "nyc"]
+GENRES = ["dancehall", "hiphop", "rnb", "soca", "afrobeat", "edm", "reggae", "latin"]
+VIBES = ["chill", "lit", "upscale", "street", "underground", "rooftop"]
+PASSWORD = "loadtest-password"
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def latency_summary(seconds):
+    values = sorted(seconds)
+    return {
+        "p50_ms": round(percentile(values, 50) * 1000, 2) if values else None,
+        "p95_ms": round(percentile(values, 95) * 1000, 2) if values else None,
+        "p99_ms": round(percentile(values, 99) * 1000, 2) if values else None,
+        "max_ms": round(values[-1] * 1000, 2) if values else None,
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route, seconds, ok):
+        self.latencies[route].append(seconds)
+        if not ok:
+            self.errors[route] += 1
+
+    def summary(self, elapsed):
+        routes = {}
+        for route in sorted(self.latencies):
+            samples = self.latencies[route]
+            routes[route] = {
+                "count": len(samples),
+                "errors": self.errors[route],
+                "rps": round(len(samples) / elapsed, 2),
+                **latency_summary(samples),
+            }
+        total = sum(len(s) for s in self.latencies.values())
+        return {
+            "totals": {
+                "requests": total,
+                "errors": sum(self.errors.values()),
+                "rps": round(total / elapsed, 2),
+            },
+            "routes": routes,
+        }
+
+
+class LoadTest:
+    def __init__(self, args, base_url):
+        self.args = args
+        self.base_url = base_url
+        self.ws_url = base_url.replace("https://", "wss://").replace("http://", "ws://")
+        self.recorder = Recorder()
+        self.accounts = []
+        self.event_ids = []
+        self.post_ids = []
+        # Chat fan-out bookkeeping: nonce -> send time, nonce -> receive times
+        self.sent = {}
+        self.received = defaultdict(list)
+        self.sockets_open = 0
+        self.socket_errors = 0
+
+    async def call(self, client, route, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response = None
+            ok = False
+        self.recorder.record(route, time.perf_counter() - start, ok)
+        return response
+
+    # ---------- setup ----------
+
+    async def setup(self, client):
+        await client.post("/api/seed")
+        for i in range(self.args.accounts):
+            email = f"loadtest{i}@example.com"
+            response = await client.post("/api/auth/register", json={
+                "email": email, "password": PASSWORD, "username": f"loadtest{i}", "city": random.choice(CITIES)
+            })
+            if response.status_code == 400:
+                response = await client.post("/api/auth/login", json={"email": email, "password": PASSWORD})
+            response.raise_for_status()
+            self.accounts.append({"email": email, "token": response.json()["token"]})
+        self.event_ids = [e["id"] for e in (await client.get("/api/events", params={"limit": 100})).json()]
+        for city in CITIES:
+            self.post_ids += [p["id"] for p in (await client.get(f"/api/feed/{city}")).json()]
+
+    def auth(self):
+        return {"Authorization": f"Bearer {random.choice(self.accounts)['token']}"}
+
+    # ---------- REST scenarios ----------
+
+    async def browse_events(self, client):
+        params = {"city": random.choice(CITIES)}
+        if random.random() < 0.4:
+            params["genre"] = random.choice(GENRES)
+        if random.random() < 0.3:
+            params["vibe"] = random.choice(VIBES)
+        if random.random() < 0.4:
+            params["date_filter"] = random.choice(["tonight", "weekend", "all"])
+        if random.random() < 0.2:
+            params["featured"] = "true"
+        await self.call(client, "GET /api/events", "GET", "/api/events", params=params)
+
+    async def event_detail(self, client):
+        if self.event_ids:
+            event_id = random.choice(self.event_ids)
+            await self.call(client, "GET /api/events/{event_id}", "GET", f"/api/events/{event_id}")
+
+    async def feed_read(self, client):
+        await self.call(client, "GET /api/feed/{city}", "GET", f"/api/feed/{random.choice(CITIES)}")
+
+    async def feed_like(self, client):
+        if self.post_ids:
+            post_id = random.choice(self.post_ids)
+            await self.call(client, "POST /api/feed/{post_id}/like", "POST", f"/api/feed/{post_id}/like",
+                            headers=self.auth())
+
+    async def login(self, client):
+        account = random.choice(self.accounts)
+        await self.call(client, "POST /api/auth/login", "POST", "/api/auth/login",
+                        json={"email": account["email"], "password": PASSWORD})
+
+    async def chat_history(self, client):
+        city = random.choice(CITIES)
+        await self.call(client, "GET /api/chat/{city}/messages", "GET", f"/api/chat/{city}/messages")
+
+    async def venues(self, client):
+        await self.call(client, "GET /api/venues", "GET", "/api/venues", params={"city": random.choice(CITIES)})
+
+    async def ticket_checkout(self, client):
+        if self.event_ids:
+            await self.call(client, "POST /api/payments/ticket", "POST", "/api/payments/ticket", headers=self.auth(),
+                            json={"event_id": random.choice(self.event_ids), "quantity": random.randint(1, 4),
+                                  "origin_url": "https://pulse.test"})
+
+    def scenarios(self):
+        return [
+            (self.browse_events, 30),
+            (self.event_detail, 15),
+            (self.feed_read, 20),
+            (self.feed_like, 10),
+            (self.chat_history, 8),
+            (self.venues, 5),
+            (self.login, 5),
+            (self.ticket_checkout, 7),
+        ]
+
+    async def virtual_user(self, client, deadline):
+        actions, weights = zip(*self.scenarios())
+        while time.perf_counter() < deadline:
+            await random.choices(actions, weights)[0](client)
+            if self.args.think:
+                await asyncio.sleep(random.expovariate(1 / self.args.think))
+
+    # ---------- chat ----------
+
+    async def listen(self, city, token, deadline, ready, sender=False):
+        url = f"{self.ws_url}/ws/chat/{city}" + (f"?token={token}" if token else "")
+        try:
+            async with websockets.connect(url, max_size=None, open_timeout=30) as ws:
+                self.sockets_open += 1
+                ready.release()
+                send_task = asyncio.create_task(self.send_chat(ws, deadline)) if sender else None
+                try:
+                    while time.perf_counter() < deadline:
+                        try:
+                            frame = await asyncio.wait_for(ws.recv(), timeout=20)
+                        except asyncio.TimeoutError:
+                            await ws.send(json.dumps({"type": "ping"}))
+                            continue
+                        now = time.perf_counter()
+                        message = json.loads(frame)
+                        content = message.get("content", "") if isinstance(message, dict) else ""
+                        if content.startswith("lt:"):
+                            self.received[content].append(now)
+                finally:
+                    if send_task:
+                        send_task.cancel()
+        except (OSError, websockets.WebSocketException, asyncio.TimeoutError):
+            self.socket_errors += 1
+            ready.release()
+
+    async def send_chat(self, ws, deadline):
+        interval = len(CITIES) / self.args.chat_rate
+        while time.perf_counter() < deadline - 2:
+            nonce = f"lt:{uuid.uuid4().hex}"
+            self.sent[nonce] = time.perf_counter()
+            await ws.send(json.dumps({"content": nonce}))
+            await asyncio.sleep(interval)
+
+    def chat_summary(self):
+        deliveries = []
+        complete = []
+        for nonce, sent_at in self.sent.items():
+            received = self.received.get(nonce)
+            if not received:
+                continue
+            deliveries += [t - sent_at for t in received]
+            complete.append(max(received) - sent_at)
+        return {
+            "sockets_open": self.sockets_open,
+            "socket_errors": self.socket_errors,
+            "messages_sent": len(self.sent),
+            "deliveries": len(deliveries),
+            "delivery": latency_summary(deliveries),
+            "fanout_complete": latency_summary(complete),
+        }
+
+    # ---------- run ----------
+
+    async def run(self):
+        limits = httpx.Limits(max_connections=self.args.users, max_keepalive_connections=self.args.users)
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=30) as client:
+            await self.setup(client)
+
+            deadline = time.perf_counter() + self.args.warmup + self.args.duration
+            ready = asyncio.Semaphore(0)
+            listeners = []
+            for i in range(self.args.sockets):
+                city = CITIES[i % len(CITIES)]
+                token = self.accounts[i % len(self.accounts)]["token"] if i % 2 == 0 else None
+                listeners.append(asyncio.create_task(self.listen(city, token, deadline, ready, sender=i < len(CITIES))))
+                # Open sockets in waves so the handshake storm itself doesn't dominate the run
+                if i % 200 == 199:
+                    for _ in range(200):
+                        await ready.acquire()
+
+            await asyncio.sleep(self.args.warmup)
+            self.recorder = Recorder()
+            start = time.perf_counter()
+            users = [asyncio.create_task(self.virtual_user(client, deadline)) for _ in range(self.args.users)]
+            await asyncio.gather(*users)
+            elapsed = time.perf_counter() - start
+            await asyncio.gather(*listeners, return_exceptions=True)
+
+        return {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "target": self.base_url,
+            "duration_s": round(elapsed, 2),
+            "config": {k: v for k, v in vars(self.args).items() if k not in ("out",)},
+            **self.recorder.summary(elapsed),
+            "chat": self.chat_summary(),
+        }
+
+
+def raise_fd_limit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+async def boot_server(args):
+    """Build the app with load-test settings and serve it on a local port from this event loop"""
+    import uvicorn
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from server import Settings, create_app
+    from stripe_standin import StripeStandIn
+
+    scratch = AsyncIOMotorClient(args.mongo_url)
+    await scratch.drop_database(args.db_name)
+    scratch.close()
+
+    app = create_app(Settings(
+        mongo_url=args.mongo_url,
+        db_name=args.db_name,
+        jwt_secret=os.environ.get("JWT_SECRET", "loadtest-secret"),
+        stripe_integration=StripeStandIn(
+            latency=args.stripe_latency,
+            failure_rate=args.stripe_failure_rate,
+            hang_rate=args.stripe_hang_rate
+        ).integration(),
+        admission_control=args.admission_control
+    ))
+    config = uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning", ws="websockets")
+    uv = uvicorn.Server(config)
+    task = asyncio.create_task(uv.serve())
+    while not uv.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return uv, task
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Pulse API load test")
+    parser.add_argument("--target", help="Base URL of a running server; omit to boot one in-process")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="pulse_loadtest")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--users", type=int, default=100, help="concurrent REST virtual users")
+    parser.add_argument("--think", type=float, default=0, help="mean think time between requests (s)")
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--sockets", type=int, default=1000, help="chat sockets across all cities")
+    parser.add_argument("--chat-rate", type=float, default=6, help="chat messages per second, all rooms")
+    parser.add_argument("--stripe-latency", type=float, default=0.15)
+    parser.add_argument("--stripe-failure-rate", type=float, default=0, help="fraction of Stripe calls that error")
+    parser.add_argument("--stripe-hang-rate", type=float, default=0, help="fraction of Stripe calls that hang")
+    parser.add_argument("--admission-control", action="store_true",
+                        help="keep rate limits and load shedding on (all traffic comes from one address)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    raise_fd_limit()
+
+    uv = task = None
+    if args.target:
+        base_url = args.target.rstrip("/")
+    else:
+        uv, task = await boot_server(args)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        report = await LoadTest(args, base_url).run()
+    finally:
+        if uv is not None:
+            uv.should_exit = True
+            await task
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            f.write(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Backfill price_cents/currency on events created before they were stored. Safe to re-run.
+
+Prices that can't be read unambiguously ("Free before 11pm, $15 after", a bare "$" outside the known cities) are
+stored without cents and listed at the end for someone to price by hand.
+
+Usage:
+    python migrate_event_prices.py
+    python migrate_event_prices.py --batch-size 2000
+"""
+
+import argparse
+import asyncio
+import sys
+
+from server import PRICE_BACKFILL_BATCH, Settings, backfill_event_prices, close_app_context, open_app_context
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Backfill numeric event prices")
+    parser.add_argument("--batch-size", type=int, default=PRICE_BACKFILL_BATCH)
+    args = parser.parse_args()
+
+    context = open_app_context(Settings.from_env())
+    updated = await backfill_event_prices(args.batch_size)
+    unpriced = await context.db.events.count_documents({"price_cents": None})
+    print(f"Backfilled {updated} events; {unpriced} have no readable price")
+    review = context.db.events.find(
+        {"price_cents": None, "price": {"$nin": [None, ""]}},
+        {"_id": 0, "id": 1, "city": 1, "price": 1}
+    )
+    async for event in review:
+        print(f"  needs review: {event['id']} ({event.get('city')}): {event['price']!r}")
+    close_app_context(context)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""Restore archived chat_messages/notifications for a date range back into Mongo.
+
+Usage:
+    python restore_archive.py chat_messages 2026-01-01 2026-01-31
+    python restore_archive.py notifications 2026-01-01 2026-01-07 --target notifications_audit
+"""
+
+import argparse
+import asyncio
+import sys
+
+from server import RETENTION_DAYS, Settings, close_app_context, open_app_context, restore_archive
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Restore archived documents into Mongo")
+    parser.add_argument("collection", choices=sorted(RETENTION_DAYS))
+    parser.add_argument("start_date", help="First day to restore (YYYY-MM-DD)")
+    parser.add_argument("end_date", help="Last day to restore (YYYY-MM-DD)")
+    parser.add_argument("--target", help="Destination collection (default: <collection>_restored)")
+    args = parser.parse_args()
+
+    context = open_app_context(Settings.from_env())
+    restored = await restore_archive(args.collection, args.start_date, args.end_date, args.target)
+    print(f"Restored {restored} documents into {args.target or args.collection + '_restored'}")
+    close_app_context(context)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
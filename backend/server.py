@@ -1,42 +1,687 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect, Query, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect, Query, Request, Response, Header
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from prometheus_client import CollectorRegistry, Counter, Histogram, ProcessCollector, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict
+from pydantic import BaseModel, Field, EmailStr, ValidationError
+from typing import Any, List, Optional, Dict
 import uuid
+import hashlib
+import ipaddress
+import re
 from datetime import datetime, timezone, timedelta
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 import json
-from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
+import random
+import csv
+import io
+import codecs
+import msgpack
+import gzip
+import asyncio
+import time
+import math
+import threading
+import sys
+import traceback
+from contextvars import ContextVar
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+from collections import deque, defaultdict, OrderedDict
+from itertools import islice
+from array import array
+import bisect
+import heapq
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# ============== METRICS ==============
+
+metrics_registry = CollectorRegistry()
+ProcessCollector(registry=metrics_registry)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "pulse_http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route"], registry=metrics_registry
+)
+HTTP_RESPONSES = Counter(
+    "pulse_http_responses_total", "HTTP responses by route template and status code",
+    ["method", "route", "status"], registry=metrics_registry
+)
+MONGO_COMMAND_SECONDS = Histogram(
+    "pulse_mongo_command_duration_seconds", "Mongo command duration by collection and operation",
+    ["collection", "command"], registry=metrics_registry,
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, float("inf"))
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "pulse_mongo_command_failures_total", "Failed Mongo commands by collection and operation",
+    ["collection", "command"], registry=metrics_registry
+)
+STRIPE_CALL_SECONDS = Histogram(
+    "pulse_stripe_call_duration_seconds", "Stripe call latency by operation and outcome",
+    ["operation", "outcome"], registry=metrics_registry
+)
+WS_BROADCAST_SECONDS = Histogram(
+    "pulse_ws_broadcast_duration_seconds", "Time to fan one chat frame out to every socket in a room",
+    registry=metrics_registry,
+    buckets=(.0001, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, float("inf"))
+)
+
+# ASGI scope of the request being served; Motor copies the context into its executor threads
+current_request_scope: ContextVar[Optional[dict]] = ContextVar("current_request_scope", default=None)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command Motor sends; registered on the client so no call site needs wrapping.
+
+    Commands over the slow-query threshold are also handed to slow_query_log.
+    """
+    def __init__(self):
+        self.pending: dict[tuple, tuple] = {}
+    
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.command.get("collection", "")
+        self.pending[(event.request_id, event.connection_id)] = (
+            collection, event.command_name, event.command, current_request_scope.get()
+        )
+    
+    def succeeded(self, event):
+        started = self.pending.pop((event.request_id, event.connection_id), None)
+        if started is not None:
+            collection, command_name, command, scope = started
+            MONGO_COMMAND_SECONDS.labels(collection, command_name).observe(event.duration_micros / 1e6)
+            if event.duration_micros >= slow_query_log.threshold_micros and command_name != "explain":
+                slow_query_log.record(collection, command_name, command, event.duration_micros, scope)
+    
+    def failed(self, event):
+        started = self.pending.pop((event.request_id, event.connection_id), None)
+        if started is not None:
+            MONGO_COMMAND_SECONDS.labels(started[0], started[1]).observe(event.duration_micros / 1e6)
+            MONGO_COMMAND_FAILURES.labels(started[0], started[1]).inc()
+
+mongo_command_metrics = MongoCommandMetrics()
+
+class MetricsMiddleware:
+    """Per-route latency and status counts; labels use the matched route template, never the raw path"""
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        current_request_scope.set(scope)
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route_path).observe(time.perf_counter() - start)
+            HTTP_RESPONSES.labels(scope["method"], route_path, str(status)).inc()
+
+class WebSocketCollector:
+    """Socket and presence gauges read from ConnectionManager at scrape time"""
+    def collect(self):
+        sockets = GaugeMetricFamily("pulse_ws_active_sockets", "Open chat sockets per city", labels=["city"])
+        online = GaugeMetricFamily("pulse_ws_online_users", "Distinct online chat users per city", labels=["city"])
+        for city, connections in manager.active_connections.items():
+            sockets.add_metric([city], len(connections))
+            online.add_metric([city], manager.online_count(city))
+        yield sockets
+        yield online
+        notifications = GaugeMetricFamily("pulse_ws_notification_sockets", "Open notification sockets")
+        notifications.add_metric([], sum(len(c) for c in notification_manager.active_connections.values()))
+        yield notifications
+
+metrics_registry.register(WebSocketCollector())
+
+# ============== STRIPE RESILIENCE ==============
+
+# Per-operation deadlines: past these the caller gets a 504 instead of holding a worker slot
+STRIPE_TIMEOUTS = {
+    "create_checkout_session": float(os.environ.get('STRIPE_CHECKOUT_TIMEOUT_SECONDS', 10)),
+    "get_checkout_status": float(os.environ.get('STRIPE_STATUS_TIMEOUT_SECONDS', 5)),
+    "handle_webhook": float(os.environ.get('STRIPE_WEBHOOK_TIMEOUT_SECONDS', 5))
+}
+# Bulkhead: Stripe calls in flight per worker; the rest of the API keeps the remaining capacity
+STRIPE_MAX_CONCURRENCY = int(os.environ.get('STRIPE_MAX_CONCURRENCY', 32))
+STRIPE_BREAKER_WINDOW_SECONDS = float(os.environ.get('STRIPE_BREAKER_WINDOW_SECONDS', 30))
+STRIPE_BREAKER_MIN_CALLS = int(os.environ.get('STRIPE_BREAKER_MIN_CALLS', 10))
+STRIPE_BREAKER_ERROR_RATIO = float(os.environ.get('STRIPE_BREAKER_ERROR_RATIO', 0.5))
+STRIPE_BREAKER_COOLDOWN_SECONDS = float(os.environ.get('STRIPE_BREAKER_COOLDOWN_SECONDS', 30))
+
+STRIPE_REJECTIONS = Counter(
+    "pulse_stripe_rejections_total", "Stripe calls refused without reaching Stripe, by reason",
+    ["reason"], registry=metrics_registry
+)
+
+class CircuitBreaker:
+    """Closed -> open when the failure ratio over a sliding window crosses the threshold; after the cooldown a
+    single probe call is let through (half-open) and its outcome closes or re-opens the circuit."""
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, window: float, min_calls: int, error_ratio: float, cooldown: float):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_ratio = error_ratio
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.outcomes = deque()  # (monotonic time, failed)
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self, now: float) -> Optional[float]:
+        """None if a call may go ahead, otherwise seconds the caller should wait before retrying"""
+        if self.state == self.OPEN:
+            remaining = self.cooldown - (now - self.opened_at)
+            if remaining > 0:
+                return remaining
+            self.state = self.HALF_OPEN
+            self.probing = False
+        if self.state == self.HALF_OPEN:
+            if self.probing:
+                return 1.0
+            self.probing = True
+        return None
+
+    def record(self, now: float, failed: bool):
+        if self.state == self.OPEN:
+            return  # a call that started before the trip; the cooldown decides what happens next
+        if self.state == self.HALF_OPEN:
+            self.probing = False
+            if failed:
+                self.trip(now)
+            else:
+                self.reset()
+            return
+        self.outcomes.append((now, failed))
+        self.failures += failed
+        cutoff = now - self.window
+        while self.outcomes and self.outcomes[0][0] < cutoff:
+            self.failures -= self.outcomes.popleft()[1]
+        if len(self.outcomes) >= self.min_calls and self.failures >= self.error_ratio * len(self.outcomes):
+            self.trip(now)
+
+    def release(self):
+        """The call ended without telling us anything about Stripe (e.g. the client went away)"""
+        if self.state == self.HALF_OPEN:
+            self.probing = False
+
+    def trip(self, now: float):
+        logger.warning(f"Stripe circuit opened for {self.cooldown:.0f}s")
+        self.state = self.OPEN
+        self.opened_at = now
+        self.outcomes.clear()
+        self.failures = 0
+
+    def reset(self):
+        logger.info("Stripe circuit closed")
+        self.state = self.CLOSED
+        self.outcomes.clear()
+        self.failures = 0
+
+stripe_breaker = CircuitBreaker(
+    STRIPE_BREAKER_WINDOW_SECONDS, STRIPE_BREAKER_MIN_CALLS, STRIPE_BREAKER_ERROR_RATIO, STRIPE_BREAKER_COOLDOWN_SECONDS
+)
+stripe_in_flight = 0
+
+def stripe_unavailable(reason: str, retry_after: float, awaitable) -> HTTPException:
+    if asyncio.iscoroutine(awaitable):
+        awaitable.close()  # never started; closing avoids a "never awaited" warning
+    STRIPE_REJECTIONS.labels(reason).inc()
+    return HTTPException(
+        status_code=503,
+        detail="Payments are temporarily unavailable, please retry shortly",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+def stripe_outage(error: Exception) -> bool:
+    """Whether an error means Stripe itself is unhealthy: network failures and 5xx responses. Client errors
+    (unknown sessions, invalid requests) are answers from a working Stripe and don't count against the breaker."""
+    if isinstance(error, OSError) or type(error).__name__ in ("APIConnectionError", "ServiceUnavailableError"):
+        return True
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    return isinstance(status, int) and status >= 500
+
+async def stripe_call(operation: str, awaitable):
+    """Await an outbound Stripe call inside the bulkhead, behind the circuit breaker, with a deadline"""
+    global stripe_in_flight
+    if stripe_in_flight >= STRIPE_MAX_CONCURRENCY:
+        raise stripe_unavailable("bulkhead_full", 1, awaitable)
+    retry_after = stripe_breaker.allow(time.monotonic())
+    if retry_after is not None:
+        raise stripe_unavailable("circuit_open", retry_after, awaitable)
+
+    stripe_in_flight += 1
+    start = time.perf_counter()
+    outcome = "error"
+    failed = None
+    try:
+        result = await asyncio.wait_for(awaitable, STRIPE_TIMEOUTS[operation])
+        outcome = "ok"
+        failed = False
+        return result
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        failed = True
+        raise HTTPException(status_code=504, detail="Payment provider timed out, please retry", headers={"Retry-After": "5"})
+    except Exception as e:
+        failed = stripe_outage(e)
+        raise
+    finally:
+        stripe_in_flight -= 1
+        if failed is None:
+            stripe_breaker.release()
+        else:
+            stripe_breaker.record(time.monotonic(), failed)
+        STRIPE_CALL_SECONDS.labels(operation, outcome).observe(time.perf_counter() - start)
+
+class StripeCollector:
+    """Breaker state (one series per state, 1 = current) and bulkhead occupancy at scrape time"""
+    def collect(self):
+        state = GaugeMetricFamily("pulse_stripe_circuit_state", "Stripe circuit breaker state", labels=["state"])
+        for name in (CircuitBreaker.CLOSED, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN):
+            state.add_metric([name], 1 if stripe_breaker.state == name else 0)
+        yield state
+        in_flight = GaugeMetricFamily("pulse_stripe_calls_in_flight", "Stripe calls currently inside the bulkhead")
+        in_flight.add_metric([], stripe_in_flight)
+        yield in_flight
+
+metrics_registry.register(StripeCollector())
+
+# ============== SLOW QUERY LOG ==============
+
+# Explain verbosity is queryPlanner only: it never re-executes the query
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+
+def query_shape(value):
+    """Replace literal values with "?" while keeping field names, operators and pipeline order"""
+    if isinstance(value, dict):
+        return {k: query_shape(v) for k, v in value.items()}
+    if isinstance(value, list):
+        if value and all(isinstance(v, dict) for v in value):
+            return [query_shape(v) for v in value]
+        return ["?"]
+    return "?"
+
+def command_shape(command_name: str, command: dict) -> dict:
+    if command_name == "find":
+        return {"filter": query_shape(command.get("filter", {})), "sort": command.get("sort")}
+    if command_name == "aggregate":
+        return {"pipeline": query_shape(command.get("pipeline", []))}
+    if command_name in ("count", "distinct", "findAndModify"):
+        return {"query": query_shape(command.get("query", {})), "sort": command.get("sort")}
+    if command_name in ("update", "delete"):
+        statements = command.get("updates" if command_name == "update" else "deletes") or [{}]
+        return {"q": query_shape(statements[0].get("q", {}))}
+    return {}
+
+class SlowQueryLog:
+    """Records Mongo commands slower than the threshold, ranks shapes by total time and samples explain plans.
+
+    Called from MongoCommandMetrics on Motor's executor threads, hence the lock and the threadsafe hand-off
+    of explain work to the event loop.
+    """
+    def __init__(self, threshold_ms: float, path: Path, max_bytes: int, explain_every_seconds: float,
+                 max_shapes: int = 1000):
+        self.threshold_micros = threshold_ms * 1000
+        self.explain_every_seconds = explain_every_seconds
+        self.max_shapes = max_shapes
+        self.shapes: dict[str, dict] = {}
+        self.lock = threading.Lock()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.logger = logging.getLogger("pulse.slow_queries")
+        self.logger.propagate = False
+        self.path = path
+        self.max_bytes = max_bytes
+    
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        if not self.logger.handlers:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(self.path, maxBytes=self.max_bytes, backupCount=1)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+    
+    def record(self, collection: str, command_name: str, command: dict, duration_micros: int, scope: Optional[dict]):
+        shape = command_shape(command_name, command)
+        key = f"{collection}.{command_name} {json.dumps(shape, sort_keys=True, default=str)}"
+        route = scope.get("route") if scope else None
+        route_path = route.path if route is not None else None
+        duration_ms = duration_micros / 1000
+        now = time.time()
+        explain = False
+        with self.lock:
+            stats = self.shapes.get(key)
+            if stats is None:
+                if len(self.shapes) >= self.max_shapes:
+                    del self.shapes[min(self.shapes, key=lambda k: self.shapes[k]["total_ms"])]
+                stats = self.shapes[key] = {
+                    "collection": collection, "command": command_name, "shape": shape,
+                    "count": 0, "total_ms": 0.0, "max_ms": 0.0, "routes": {}, "explained_at": 0.0, "plan": None
+                }
+            stats["count"] += 1
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            if route_path:
+                stats["routes"][route_path] = stats["routes"].get(route_path, 0) + 1
+            if command_name in EXPLAINABLE_COMMANDS and now - stats["explained_at"] >= self.explain_every_seconds:
+                stats["explained_at"] = now
+                explain = True
+        self.logger.info(json.dumps({
+            "type": "slow_query", "at": datetime.now(timezone.utc).isoformat(), "collection": collection,
+            "command": command_name, "duration_ms": round(duration_ms, 2), "route": route_path, "shape": shape
+        }, default=str))
+        if explain and self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.explain(key, command_name, command), self.loop)
+    
+    async def explain(self, key: str, command_name: str, command: dict):
+        explained = {k: v for k, v in command.items() if not k.startswith("$") and k not in ("lsid", "txnNumber")}
+        try:
+            result = await db.command({"explain": explained, "verbosity": "queryPlanner"})
+        except Exception as e:
+            logger.warning(f"Explain failed for {key}: {e}")
+            return
+        plan = result.get("queryPlanner", {}).get("winningPlan")
+        with self.lock:
+            if key in self.shapes:
+                self.shapes[key]["plan"] = plan
+        self.logger.info(json.dumps({"type": "explain", "at": datetime.now(timezone.utc).isoformat(),
+                                     "shape": key, "plan": plan}, default=str))
+    
+    def summary(self, limit: int) -> List[dict]:
+        with self.lock:
+            ranked = sorted(self.shapes.values(), key=lambda s: s["total_ms"], reverse=True)[:limit]
+            return [{
+                "collection": s["collection"],
+                "command": s["command"],
+                "shape": s["shape"],
+                "count": s["count"],
+                "total_ms": round(s["total_ms"], 2),
+                "avg_ms": round(s["total_ms"] / s["count"], 2),
+                "max_ms": round(s["max_ms"], 2),
+                "routes": dict(s["routes"]),
+                "plan": s["plan"]
+            } for s in ranked]
+
+slow_query_log = SlowQueryLog(
+    threshold_ms=float(os.environ.get('SLOW_QUERY_MS', 100)),
+    path=Path(os.environ.get('SLOW_QUERY_LOG_PATH', ROOT_DIR / 'logs' / 'slow_queries.ndjson')),
+    max_bytes=int(os.environ.get('SLOW_QUERY_LOG_MAX_BYTES', 5 * 1024 * 1024)),
+    explain_every_seconds=float(os.environ.get('SLOW_QUERY_EXPLAIN_SECONDS', 300))
+)
+
+# ============== PROFILING ==============
+
+LOOP_LAG = Histogram(
+    "pulse_event_loop_lag_seconds", "Extra delay before a scheduled loop heartbeat ran",
+    registry=metrics_registry,
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, float("inf"))
+)
+LOOP_STALLS = Counter(
+    "pulse_event_loop_stalls_total", "Times a callback blocked the event loop past the stall threshold",
+    registry=metrics_registry
+)
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+def collapse_stack(frame, max_depth: int = 128) -> str:
+    """Root-first `a;b;c` stack, the format flamegraph.pl and speedscope read"""
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+def sample_stacks(seconds: float, interval: float, thread_ids: Optional[set] = None) -> dict[str, int]:
+    """Sample thread stacks with sys._current_frames() until `seconds` have passed; runs off the loop"""
+    samples: dict[str, int] = defaultdict(int)
+    own = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (thread_ids is not None and thread_id not in thread_ids):
+                continue
+            samples[collapse_stack(frame)] += 1
+        time.sleep(interval)
+    return samples
+
+class LoopMonitor:
+    """Event-loop lag and stall detection.
+
+    A coroutine on the loop records a heartbeat every `interval`; a watchdog thread checks it and, when the
+    loop has been stuck longer than `stall_threshold`, logs the loop thread's stack while it's still blocked.
+    """
+    def __init__(self, interval: float, stall_threshold: float):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.loop_thread_id: Optional[int] = None
+        self.last_beat = time.monotonic()
+        self.reported_beat = 0.0
+        self.stopped = threading.Event()
+    
+    async def heartbeat(self):
+        self.loop_thread_id = threading.get_ident()
+        self.stopped.clear()
+        watchdog = threading.Thread(target=self.watch, name="loop-watchdog", daemon=True)
+        watchdog.start()
+        try:
+            while True:
+                self.last_beat = time.monotonic()
+                await asyncio.sleep(self.interval)
+                LOOP_LAG.observe(max(0.0, time.monotonic() - self.last_beat - self.interval))
+        finally:
+            self.stopped.set()
+    
+    def lag(self) -> float:
+        """How overdue the next heartbeat is right now, i.e. how long work queued on the loop waits; 0 when not running"""
+        if self.loop_thread_id is None or self.stopped.is_set():
+            return 0.0
+        return max(0.0, time.monotonic() - self.last_beat - self.interval)
+    
+    def watch(self):
+        while not self.stopped.wait(self.stall_threshold / 2):
+            beat = self.last_beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < self.stall_threshold or beat == self.reported_beat:
+                continue
+            self.reported_beat = beat
+            LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<unavailable>"
+            logger.warning(f"Event loop blocked for over {blocked * 1000:.0f}ms, loop thread stack:\n{stack}")
+
+loop_monitor = LoopMonitor(
+    interval=float(os.environ.get('LOOP_LAG_INTERVAL_MS', 100)) / 1000,
+    stall_threshold=float(os.environ.get('LOOP_STALL_MS', 250)) / 1000
+)
+profile_lock = asyncio.Lock()
+
+# ============== SETTINGS & APP CONTEXT ==============
+
+class Settings(BaseModel):
+    mongo_url: str
+    db_name: str
+    jwt_secret: str
+    stripe_api_key: Optional[str] = None
+    # Connections opened and pinged before the app reports ready
+    mongo_min_pool_size: int = 10
+    # Module or namespace exposing StripeCheckout and CheckoutSessionRequest; defaults to emergentintegrations
+    stripe_integration: Any = None
+    # Archiver, presence flusher and loop monitor; tests usually turn these off
+    run_background_tasks: bool = True
+    # Rate limits and load shedding; load tests driving everything from one address turn this off
+    admission_control: bool = True
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            mongo_url=os.environ['MONGO_URL'],
+            db_name=os.environ['DB_NAME'],
+            jwt_secret=os.environ['JWT_SECRET'],
+            stripe_api_key=os.environ.get('STRIPE_API_KEY'),
+            mongo_min_pool_size=int(os.environ.get('MONGO_MIN_POOL_SIZE', 10)),
+            run_background_tasks=os.environ.get('RUN_BACKGROUND_TASKS', '1') != '0',
+            admission_control=os.environ.get('ADMISSION_CONTROL', '1') != '0'
+        )
+
+class AppContext:
+    """Settings plus the Mongo client of one app; the client is None until the app has started.
+
+    Per app, through the context: settings, database, event index, batch loaders and the snapshot cache.
+    Still process-wide, and shared by every app in the process: chat history and the socket managers, the waiting
+    room cache, the analytics buffer, the rate limiter, the Stripe breaker and the loop monitor. Several apps in one
+    process (tests) therefore get separate data but share that in-memory state; production runs one per worker.
+    """
+    __slots__ = ("settings", "client", "db")
+
+    def __init__(self, settings: Settings, client: Optional[AsyncIOMotorClient] = None):
+        self.settings = settings
+        self.client = client
+        self.db = client[settings.db_name] if client is not None else None
+
+# Set per request by AppContextMiddleware, and inherited by each app's background tasks
+current_app_context: ContextVar[Optional[AppContext]] = ContextVar("current_app_context", default=None)
+# The most recently started app that is still running; scripts and code outside any request fall back to it
+default_app_context: Optional[AppContext] = None
+
+def app_context() -> AppContext:
+    global default_app_context
+    context = current_app_context.get() or default_app_context
+    if context is None:
+        # Nothing started yet: settings come from the environment, there is no database
+        context = default_app_context = AppContext(Settings.from_env())
+    return context
+
+def get_settings() -> Settings:
+    return app_context().settings
+
+def close_app_context(context: AppContext):
+    """Close the context's client; if it was the default, nothing falls back to it any more"""
+    global default_app_context
+    if default_app_context is context:
+        default_app_context = None
+    context.client.close()
+
+def open_app_context(settings: Settings) -> AppContext:
+    """Create the Motor client for `settings` and make it the default context; no I/O happens until first use"""
+    global default_app_context
+    client = AsyncIOMotorClient(
+        settings.mongo_url,
+        event_listeners=[mongo_command_metrics],
+        minPoolSize=settings.mongo_min_pool_size
+    )
+    default_app_context = AppContext(settings, client)
+    return default_app_context
+
+async def warm_mongo_pool(context: AppContext):
+    """Open the pool's connections up front so the first requests don't pay for TCP + auth handshakes"""
+    await context.db.command("ping")
+    await asyncio.gather(*(context.db.command("ping") for _ in range(context.settings.mongo_min_pool_size)))
+
+class AppDatabase:
+    """`db` as used by the handlers: the database of whichever app is serving the current request"""
+
+    def __getattr__(self, name):
+        return getattr(self._database(), name)
+
+    def __getitem__(self, name):
+        return self._database()[name]
+
+    @staticmethod
+    def _database():
+        database = app_context().db
+        if database is None:
+            raise RuntimeError("No database: start the app (create_app lifespan) or call open_app_context first")
+        return database
+
+db = AppDatabase()
+
+class AppContextMiddleware:
+    """Bind the app's context for the duration of each request and websocket"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        context = getattr(scope["app"].state, "context", None)
+        if context is None:
+            await self.app(scope, receive, send)
+            return
+        token = current_app_context.set(context)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_app_context.reset(token)
+
+@lru_cache(maxsize=None)
+def emergent_stripe_checkout():
+    # Imported on first payment: emergentintegrations pulls in the Stripe SDK and its own dependencies
+    from emergentintegrations.payments.stripe import checkout
+    return checkout
+
+def stripe_integration():
+    return get_settings().stripe_integration or emergent_stripe_checkout()
+
+def stripe_checkout_client(webhook_url: str):
+    return stripe_integration().StripeCheckout(api_key=get_settings().stripe_api_key, webhook_url=webhook_url)
 
 # JWT Config
-SECRET_KEY = os.environ['JWT_SECRET']
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 7
+ADMIN_EMAILS = {e.strip().lower() for e in os.environ.get('ADMIN_EMAILS', '').split(',') if e.strip()}
 
-# Stripe Config
-STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY')
+# Chat Config
+CHAT_HISTORY_SIZE = int(os.environ.get('CHAT_HISTORY_SIZE', 200))
+# How often each worker pulls in messages other workers stored; chat history lags them by at most this much
+CHAT_HISTORY_REFRESH_SECONDS = float(os.environ.get('CHAT_HISTORY_REFRESH_SECONDS', 2))
+
+# Retention Config (days a document stays in Mongo before it is archived to disk)
+RETENTION_DAYS = {
+    "chat_messages": int(os.environ.get('CHAT_RETENTION_DAYS', 30)),
+    "notifications": int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 90))
+}
+ARCHIVE_DIR = Path(os.environ.get('ARCHIVE_DIR', ROOT_DIR / 'archive'))
+ARCHIVE_INTERVAL_SECONDS = int(os.environ.get('ARCHIVE_INTERVAL_SECONDS', 3600))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 1000))
+# TTL backstop: Mongo drops documents this long after their archive cutoff if the archiver stalls
+ARCHIVE_GRACE_DAYS = int(os.environ.get('ARCHIVE_GRACE_DAYS', 7))
+
+# Password hashing (built on first use; passlib probes the bcrypt backend when the context is created)
+@lru_cache(maxsize=None)
+def password_context() -> CryptContext:
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
-app = FastAPI(title="Pulse of the City API")
 api_router = APIRouter(prefix="/api")
+# Routes served outside /api: websockets and the Prometheus scrape endpoint
+root_router = APIRouter()
 
 # ============== SUBSCRIPTION & PRICING ==============
 
@@ -44,12 +689,14 @@ PROMOTER_SUBSCRIPTIONS = {
     "pro": {
         "name": "Pro",
         "price": 49.00,
-        "features": ["Unlimited events", "Verified badge", "Basic analytics", "Priority support"]
+        "features": ["Unlimited events", "Verified badge", "Basic analytics", "Priority support"],
+        "analytics": ["day"]
     },
     "premium": {
         "name": "Premium", 
         "price": 149.00,
-        "features": ["Everything in Pro", "Push notifications", "Featured placement", "Advanced analytics"]
+        "features": ["Everything in Pro", "Push notifications", "Featured placement", "Advanced analytics"],
+        "analytics": ["hour", "day"]
     }
 }
 
@@ -127,7 +774,10 @@ class EventCreate(BaseModel):
     vibe: str
     image_url: Optional[str] = None
     ticket_url: Optional[str] = None
-    price: Optional[str] = None
+    price: Optional[str] = None  # display text; price_cents/currency are derived from it unless given
+    price_cents: Optional[int] = Field(None, ge=0)
+    currency: Optional[str] = Field(None, min_length=3, max_length=3)
+    capacity: Optional[int] = Field(None, ge=0)  # None = unlimited, no holds taken
 
 class Event(BaseModel):
     id: str
@@ -143,10 +793,14 @@ class Event(BaseModel):
     image_url: Optional[str] = None
     ticket_url: Optional[str] = None
     price: Optional[str] = None
+    price_cents: Optional[int] = None
+    currency: Optional[str] = None
     promoter_id: Optional[str] = None
     promoter_name: Optional[str] = None
     is_featured: bool = False
     attendee_count: int = 0
+    capacity: Optional[int] = None
+    tickets_available: Optional[int] = None
     created_at: str
 
 # Feed Post Models
@@ -223,8 +877,13 @@ class Notification(BaseModel):
 # Payment Models
 class TicketPurchaseRequest(BaseModel):
     event_id: str
-    quantity: int = 1
+    quantity: int = Field(1, ge=1, le=20)
     origin_url: str
+    queue_token: Optional[str] = None  # required while the event's waiting room is on
+
+class WaitingRoomConfig(BaseModel):
+    enabled: bool
+    admit_per_minute: int = Field(300, ge=1, le=100000)
 
 class BoostPurchaseRequest(BaseModel):
     event_id: str
@@ -247,21 +906,128 @@ class PaymentTransaction(BaseModel):
     created_at: str
     updated_at: str
 
+# ============== BATCH LOADERS ==============
+
+# How long the first lookup of a batch waits for others to join it while earlier lookups are still in flight
+# (an idle loader sends a plain find_one right away), and the most keys one query carries
+LOADER_WINDOW_SECONDS = float(os.environ.get('LOADER_WINDOW_SECONDS', 0.002))
+LOADER_MAX_BATCH = int(os.environ.get('LOADER_MAX_BATCH', 100))
+LOADER_ENABLED = os.environ.get('LOADER_ENABLED', '1') != '0'
+
+LOADER_BATCH_KEYS = Histogram(
+    "pulse_loader_batch_keys", "Distinct ids fetched per coalesced lookup query",
+    ["collection"], registry=metrics_registry, buckets=(1, 2, 5, 10, 25, 50, 100, 250, float("inf"))
+)
+
+class LoaderBatch:
+    __slots__ = ("futures", "timer")
+
+    def __init__(self):
+        self.futures: Dict[str, asyncio.Future] = {}
+        self.timer = None
+
+class BatchLoader:
+    """Coalesces concurrent `find_one({"id": ...})` reads on one collection into one `$in` query.
+
+    When nothing is pending or in flight, a lookup goes straight out as a plain find_one, so a quiet worker adds
+    no latency. Under load a lookup opens a batch instead; lookups arriving in the next LOADER_WINDOW_SECONDS join
+    it, collecting the requests that pile up behind the queries already out, and a full batch goes out at once.
+    A key that is already waiting or in a batch in flight shares that future, so a hot id is read once however
+    many requests want it. Batches are kept per event loop and app context (futures and Motor clients belong to
+    one loop). Nothing is cached past the query: use this only for reads that don't need to observe a write the
+    caller just made.
+    """
+
+    def __init__(self, collection: str):
+        self.collection = collection
+        self.pending: Dict[tuple, LoaderBatch] = {}
+        self.in_flight: Dict[tuple, Dict[str, asyncio.Future]] = {}
+        self.direct: Dict[tuple, int] = {}  # plain find_one lookups out per scope
+        self.tasks = set()  # the loop only keeps weak references to running tasks
+
+    async def load(self, key: str) -> Optional[dict]:
+        """The document with this id (without _id), or None; each caller gets its own copy"""
+        if not LOADER_ENABLED:
+            return await db[self.collection].find_one({"id": key}, {"_id": 0})
+        loop = asyncio.get_running_loop()
+        scope = (loop, app_context())
+        future = self.in_flight.get(scope, {}).get(key)
+        if future is None and not (scope in self.pending or self.in_flight.get(scope) or scope in self.direct):
+            return await self.load_direct(scope, key)
+        if future is None:
+            batch = self.pending.get(scope)
+            if batch is None:
+                batch = self.pending[scope] = LoaderBatch()
+                batch.timer = loop.call_later(LOADER_WINDOW_SECONDS, self.dispatch, scope)
+            future = batch.futures.get(key)
+            if future is None:
+                future = batch.futures[key] = loop.create_future()
+                if len(batch.futures) >= LOADER_MAX_BATCH:
+                    self.dispatch(scope)
+        # Shielded: one caller giving up must not cancel the lookup for everyone else sharing it
+        doc = await asyncio.shield(future)
+        return dict(doc) if doc is not None else None
+
+    async def load_direct(self, scope: tuple, key: str) -> Optional[dict]:
+        """Nothing to coalesce with: one find_one, counted so lookups arriving meanwhile batch up behind it"""
+        self.direct[scope] = self.direct.get(scope, 0) + 1
+        try:
+            return await db[self.collection].find_one({"id": key}, {"_id": 0})
+        finally:
+            self.direct[scope] -= 1
+            if not self.direct[scope]:
+                del self.direct[scope]
+
+    def dispatch(self, scope: tuple):
+        batch = self.pending.pop(scope, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        self.in_flight.setdefault(scope, {}).update(batch.futures)
+        task = scope[0].create_task(self.fetch(scope, batch.futures))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def fetch(self, scope: tuple, futures: Dict[str, asyncio.Future]):
+        keys = list(futures)
+        LOADER_BATCH_KEYS.labels(self.collection).observe(len(keys))
+        try:
+            docs = await db[self.collection].find({"id": {"$in": keys}}, {"_id": 0}).to_list(len(keys))
+            found = {doc["id"]: doc for doc in docs}
+            for key, future in futures.items():
+                if not future.done():
+                    future.set_result(found.get(key))
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+                    future.exception()  # retrieved here so callers that went away don't leave a warning
+        finally:
+            in_flight = self.in_flight.get(scope, {})
+            for key, future in futures.items():
+                if in_flight.get(key) is future:
+                    del in_flight[key]
+            if not in_flight:
+                self.in_flight.pop(scope, None)
+
+event_loader = BatchLoader("events")
+user_loader = BatchLoader("users")
+
 # ============== AUTH HELPERS ==============
 
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, get_settings().jwt_secret, algorithm=ALGORITHM)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(credentials.credentials, get_settings().jwt_secret, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
+        user = await user_loader.load(user_id)
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
         return user
@@ -272,17 +1038,238 @@ async def get_optional_user(credentials: Optional[HTTPAuthorizationCredentials]
     if credentials is None:
         return None
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(credentials.credentials, get_settings().jwt_secret, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         if user_id:
-            return await db.users.find_one({"id": user_id}, {"_id": 0})
+            return await user_loader.load(user_id)
     except:
         pass
     return None
 
+def is_admin(user: dict) -> bool:
+    return bool(user.get("is_admin")) or user["email"].lower() in ADMIN_EMAILS
+
+async def get_admin_user(user = Depends(get_current_user)):
+    if not is_admin(user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
+async def get_websocket_user(token: Optional[str]):
+    """Resolve a handshake token with the same JWT rules as get_current_user; None if it doesn't check out"""
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, get_settings().jwt_secret, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    user_id = payload.get("sub")
+    if user_id is None:
+        return None
+    user = await user_loader.load(user_id)
+    if user is not None:
+        user.pop("password", None)
+    return user
+
+# ============== ADMISSION CONTROL ==============
+
+# Route classes as (sustained requests per second, burst). Override any of them with
+# RATE_LIMITS="login=0.1/5,chat=2/10"
+RATE_LIMIT_DEFAULTS = {
+    "default": (20.0, 60),     # every API request
+    "login": (0.2, 10),        # a bcrypt verify each
+    "register": (0.05, 5),     # a bcrypt hash each
+    "write": (2.0, 20),        # posts, likes, venues, events, RSVPs
+    "chat": (1.0, 10),         # chat messages, REST and WebSocket share the bucket
+    "checkout": (0.5, 10),     # each one is a Stripe round trip
+    "ws_connect": (1.0, 20),   # handshakes, so a reconnect storm can't pin the workers
+    "ws_message": (10.0, 40)   # every inbound frame on one socket, pings included
+}
+# Classes keyed by client address even when the caller sends a token
+RATE_LIMIT_BY_IP = {"login", "register", "ws_connect"}
+# Proxies (addresses or CIDRs, comma-separated) whose X-Forwarded-For names the client. Behind an ingress or
+# load balancer this must list it, or every caller shares the proxy's address and its per-IP buckets
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(proxy.strip(), strict=False)
+    for proxy in os.environ.get('TRUSTED_PROXIES', '127.0.0.1,::1').split(",") if proxy.strip()
+]
+# Keys tracked per class; past this the least recently seen are dropped (a dropped key just starts full again)
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100000))
+# Requests handled at once per worker; past this new ones are shed with a 503
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('MAX_CONCURRENT_REQUESTS', 512))
+# Also shed while the event loop is this far behind (needs the loop monitor, i.e. background tasks)
+SHED_LOOP_LAG_SECONDS = float(os.environ.get('SHED_LOOP_LAG_MS', 500)) / 1000
+# Probes, scrapes and Stripe's webhook are never limited or shed
+ADMISSION_EXEMPT_PATHS = {"/api/health", "/api/health/ready", "/metrics", "/api/webhook/stripe"}
+
+def parse_rate_limits(spec: str) -> Dict[str, tuple]:
+    limits = dict(RATE_LIMIT_DEFAULTS)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        limits[name.strip()] = (float(rate), int(burst))
+    return limits
+
+RATE_LIMITS = parse_rate_limits(os.environ.get('RATE_LIMITS', ''))
+
+ADMISSION_REJECTIONS = Counter(
+    "pulse_admission_rejections_total", "Requests, handshakes and WebSocket messages refused by admission control",
+    ["route_class", "reason"], registry=metrics_registry
+)
+
+class RateLimiter:
+    """Token buckets per (route class, key).
+
+    Each bucket is stored as a single float (GCRA): the monotonic time at which it will be full again. A key
+    with tokens to spare holds `burst - (full_at - now) * rate` of them, so refilling needs no timer and an
+    idle key is indistinguishable from a missing one. Keys are stored as their 64-bit hash in an LRU per class
+    capped at `max_keys` (about 250 bytes each), which bounds memory however many distinct users or addresses
+    show up; eviction can only ever be lenient.
+    """
+    def __init__(self, limits: Dict[str, tuple], max_keys: int):
+        self.limits = limits
+        self.max_keys = max_keys
+        self.buckets: Dict[str, OrderedDict] = {name: OrderedDict() for name in limits}
+
+    def acquire(self, route_class: str, key: str, now: Optional[float] = None) -> Optional[float]:
+        """Take one token: None if admitted, otherwise seconds until the next token arrives"""
+        rate, burst = self.limits[route_class]
+        interval = 1.0 / rate
+        now = time.monotonic() if now is None else now
+        buckets = self.buckets[route_class]
+        key = hash(key)
+        full_at = max(buckets.get(key, now), now)
+        wait = full_at - now - (burst - 1) * interval
+        if wait > 0:
+            return wait
+        buckets[key] = full_at + interval
+        buckets.move_to_end(key)
+        if len(buckets) > self.max_keys:
+            buckets.popitem(last=False)
+        return None
+
+rate_limiter = RateLimiter(RATE_LIMITS, RATE_LIMIT_MAX_KEYS)
+requests_in_flight = 0
+
+def trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+def client_ip(scope) -> str:
+    """The caller's address: the socket peer or, when that is a trusted proxy, the nearest untrusted hop of
+    X-Forwarded-For (hops are appended left to right, so only the right end of the header can be believed)"""
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    if TRUSTED_PROXIES and trusted_proxy(address):
+        forwarded = b",".join(value for name, value in scope.get("headers", ()) if name == b"x-forwarded-for")
+        for hop in reversed(forwarded.decode("latin-1").split(",") if forwarded else []):
+            hop = hop.strip()
+            if hop:
+                address = hop
+                if not trusted_proxy(hop):
+                    break
+    return f"ip:{address}"
+
+def client_key(scope) -> str:
+    """`user:<id>` for a valid bearer token, else the client address; worked out once per request"""
+    state = scope.setdefault("state", {})
+    key = state.get("client_key")
+    if key is None:
+        key = state["client_key"] = client_ip(scope)
+        for name, value in scope.get("headers", ()):
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer":
+                    try:
+                        user_id = jwt.decode(token, get_settings().jwt_secret, algorithms=[ALGORITHM]).get("sub")
+                    except JWTError:
+                        user_id = None
+                    if user_id:
+                        key = state["client_key"] = f"user:{user_id}"
+                break
+    return key
+
+def throttle(route_class: str, key: str) -> Optional[float]:
+    """Take a token for `key`: None when admitted (or admission control is off), else seconds to wait"""
+    if not get_settings().admission_control:
+        return None
+    wait = rate_limiter.acquire(route_class, key)
+    if wait is not None:
+        ADMISSION_REJECTIONS.labels(route_class, "rate_limited").inc()
+    return wait
+
+def retry_after(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+def rate_limited(route_class: str):
+    """Route dependency: one token from `route_class` per call, 429 with Retry-After once the bucket is empty"""
+    async def take_token(request: Request):
+        scope = request.scope
+        wait = throttle(route_class, client_ip(scope) if route_class in RATE_LIMIT_BY_IP else client_key(scope))
+        if wait is not None:
+            raise HTTPException(status_code=429, detail="Too many requests, slow down", headers=retry_after(wait))
+    return Depends(take_token)
+
+async def admit_websocket(websocket: WebSocket) -> bool:
+    """Handshake limit per address; a refused socket is closed with 1013 (try again later)"""
+    if throttle("ws_connect", client_ip(websocket.scope)) is None:
+        return True
+    await websocket.close(code=1013)
+    return False
+
+class AdmissionMiddleware:
+    """Sheds requests with a 503 while the worker is saturated, then applies the `default` rate limit.
+
+    Saturation means MAX_CONCURRENT_REQUESTS already in flight, or an event loop running SHED_LOOP_LAG behind:
+    past either point extra requests only add queueing delay for everyone, so refusing them early keeps
+    latency flat for the ones admitted. Retry-After is spread over a few seconds so shed clients don't come
+    back in lockstep.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global requests_in_flight
+        if scope["type"] != "http" or scope["path"] in ADMISSION_EXEMPT_PATHS or not get_settings().admission_control:
+            return await self.app(scope, receive, send)
+        reason = None
+        if MAX_CONCURRENT_REQUESTS and requests_in_flight >= MAX_CONCURRENT_REQUESTS:
+            reason = "concurrency"
+        elif SHED_LOOP_LAG_SECONDS and loop_monitor.lag() >= SHED_LOOP_LAG_SECONDS:
+            reason = "loop_lag"
+        if reason is not None:
+            ADMISSION_REJECTIONS.labels("global", reason).inc()
+            response = JSONResponse({"detail": "Server busy, please retry"}, status_code=503,
+                                    headers=retry_after(random.uniform(1, 4)))
+            return await response(scope, receive, send)
+        wait = throttle("default", client_key(scope))
+        if wait is not None:
+            response = JSONResponse({"detail": "Too many requests, slow down"}, status_code=429,
+                                    headers=retry_after(wait))
+            return await response(scope, receive, send)
+        requests_in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            requests_in_flight -= 1
+
+class AdmissionCollector:
+    def collect(self):
+        in_flight = GaugeMetricFamily("pulse_http_requests_in_flight", "Requests being handled by this worker")
+        in_flight.add_metric([], requests_in_flight)
+        yield in_flight
+        keys = GaugeMetricFamily("pulse_rate_limit_keys", "Keys tracked by the rate limiter", labels=["route_class"])
+        for route_class, buckets in rate_limiter.buckets.items():
+            keys.add_metric([route_class], len(buckets))
+        yield keys
+
+metrics_registry.register(AdmissionCollector())
+
 # ============== AUTH ROUTES ==============
 
-@api_router.post("/auth/register")
+@api_router.post("/auth/register", dependencies=[rate_limited("register")])
 async def register(user: UserCreate):
     existing = await db.users.find_one({"email": user.email})
     if existing:
@@ -292,7 +1279,7 @@ async def register(user: UserCreate):
     if existing_username:
         raise HTTPException(status_code=400, detail="Username already taken")
     
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = password_context().hash(user.password)
     user_id = str(uuid.uuid4())
     
     user_doc = {
@@ -325,10 +1312,10 @@ async def register(user: UserCreate):
         }
     }
 
-@api_router.post("/auth/login")
+@api_router.post("/auth/login", dependencies=[rate_limited("login")])
 async def login(user: UserLogin):
     db_user = await db.users.find_one({"email": user.email})
-    if not db_user or not pwd_context.verify(user.password, db_user["password"]):
+    if not db_user or not password_context().verify(user.password, db_user["password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     token = create_access_token({"sub": db_user["id"]})
@@ -354,10 +1341,387 @@ async def get_me(user = Depends(get_current_user)):
 async def update_me(updates: UserUpdate, user = Depends(get_current_user)):
     update_dict = {k: v for k, v in updates.model_dump().items() if v is not None}
     if update_dict:
+        # updated_at lets other workers refresh the profile on chat sockets they hold
+        update_dict["updated_at"] = datetime.now(timezone.utc).isoformat()
         await db.users.update_one({"id": user["id"]}, {"$set": update_dict})
     updated_user = await db.users.find_one({"id": user["id"]}, {"_id": 0, "password": 0})
+    manager.refresh_sessions(updated_user)
     return updated_user
 
+# ============== EVENT INDEX ==============
+
+EVENT_INDEX_PAGE_SIZE = int(os.environ.get('EVENT_INDEX_PAGE_SIZE', 5000))
+# Catch-up interval for events inserted by other workers or scripts
+EVENT_INDEX_REFRESH_SECONDS = float(os.environ.get('EVENT_INDEX_REFRESH_SECONDS', 30))
+EVENT_INDEX_FIELDS = {
+    "_id": 0, "id": 1, "city": 1, "genre": 1, "vibe": 1, "date": 1, "is_featured": 1, "price": 1, "price_cents": 1,
+    "created_at": 1, "updated_at": 1
+}
+
+def bits_from_rows(rows: List[int]) -> int:
+    """Bitset with the given row numbers set, built in one pass instead of one big-int OR per row"""
+    if len(rows) <= 8:
+        bits = 0
+        for row in rows:
+            bits |= 1 << row
+        return bits
+    buffer = bytearray(max(rows) // 8 + 1)
+    for row in rows:
+        buffer[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(buffer, "little")
+
+def rows_of(bits: int):
+    """Set row numbers of a bitset, ascending: one conversion to 64-bit words, then bits are peeled off each word"""
+    if not bits:
+        return
+    words = array("Q", bits.to_bytes((bits.bit_length() + 63) // 64 * 8, "little"))
+    if sys.byteorder == "big":
+        words.byteswap()
+    for i, word in enumerate(words):
+        while word:
+            low = word & -word
+            yield (i << 6) + low.bit_length() - 1
+            word ^= low
+
+class EventIndex:
+    """Columnar, in-process copy of the event fields get_events filters and sorts on.
+
+    Each event is a row number. City, genre, vibe and date values each own a bitset (a Python int) of the rows
+    that have them, so any combination of filters is a few big-int ANDs. Day and price live in array columns.
+    Selective filters sort their few matching rows directly; broad ones take the first `limit` rows from a
+    presorted order (date buckets in key order, or a price-sorted row array), checking each against the filter
+    bitset. Ties are broken by event id, as in the Mongo fallback. The index answers with event ids only;
+    documents are then read by id, so mutable counters (attendees, stock) never go stale here.
+
+    There is one per app (see AppEventIndex), loaded at startup and updated by this worker's write paths. A
+    timer picks up events created elsewhere, and events whose mutable fields (featured flag, price) changed
+    elsewhere. Writers of those fields stamp `updated_at`. City, genre, vibe and date are never edited after
+    creation. Rows are never removed because events aren't deleted.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.loaded = False
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.days = array("i")  # date as a day number, for ordering
+        self.prices = array("q")  # cents, -1 when unknown
+        self.city_bits: Dict[str, int] = {}
+        self.genre_bits: Dict[str, int] = {}
+        self.vibe_bits: Dict[str, int] = {}
+        self.date_bits: Dict[str, int] = {}
+        self.date_keys: List[str] = []
+        self.day_numbers: Dict[str, int] = {}
+        self.featured_bits = 0
+        self.priced_bits = 0
+        self.by_price = array("i")  # priced rows by (price, day, id)
+        self.by_price_desc = array("i")  # priced rows by (-price, day, id)
+        self.orders_stale = False
+        self.created_through = ""
+        self.updated_through = ""
+
+    def day_number(self, date: str) -> int:
+        day = self.day_numbers.get(date)
+        if day is None:
+            try:
+                day = datetime.fromisoformat(date).toordinal()
+            except ValueError:
+                day = 0
+            self.day_numbers[date] = day
+        return day
+
+    def price_key(self, row: int) -> tuple:
+        return self.prices[row], self.days[row], self.ids[row]
+
+    def price_desc_key(self, row: int) -> tuple:
+        return -self.prices[row], self.days[row], self.ids[row]
+
+    def date_key(self, row: int) -> tuple:
+        return self.days[row], self.ids[row]
+
+    def add_many(self, docs: List[dict]):
+        """Append events not indexed yet; bitsets get one OR per distinct value for the whole batch"""
+        grouped = {"city": defaultdict(list), "genre": defaultdict(list), "vibe": defaultdict(list),
+                   "date": defaultdict(list), "featured": [], "priced": []}
+        for doc in docs:
+            if doc["id"] in self.rows:
+                continue
+            row = len(self.ids)
+            self.ids.append(doc["id"])
+            self.rows[doc["id"]] = row
+            date = doc.get("date") or ""
+            self.days.append(self.day_number(date))
+            price_cents = doc["price_cents"] if "price_cents" in doc else price_components(
+                doc.get("price"), doc.get("city"))[0]
+            self.prices.append(-1 if price_cents is None else price_cents)
+            grouped["city"][doc.get("city")].append(row)
+            for genre in set(doc.get("genre") or []):
+                grouped["genre"][genre].append(row)
+            grouped["vibe"][doc.get("vibe")].append(row)
+            grouped["date"][date].append(row)
+            if doc.get("is_featured"):
+                grouped["featured"].append(row)
+            if price_cents is not None:
+                grouped["priced"].append(row)
+            self.created_through = max(self.created_through, doc.get("created_at") or "")
+            self.updated_through = max(self.updated_through, doc.get("updated_at") or "")
+        for field, bitsets in (("city", self.city_bits), ("genre", self.genre_bits), ("vibe", self.vibe_bits),
+                               ("date", self.date_bits)):
+            for value, rows in grouped[field].items():
+                if field == "date" and value not in bitsets:
+                    bisect.insort(self.date_keys, value)
+                bitsets[value] = bitsets.get(value, 0) | bits_from_rows(rows)
+        if grouped["featured"]:
+            self.featured_bits |= bits_from_rows(grouped["featured"])
+        priced = grouped["priced"]
+        if priced:
+            self.priced_bits |= bits_from_rows(priced)
+            # A few rows are inserted in place; big batches re-sort once, on the next price-sorted query
+            if self.orders_stale or len(priced) > 64:
+                self.orders_stale = True
+            else:
+                for row in priced:
+                    bisect.insort(self.by_price, row, key=self.price_key)
+                    bisect.insort(self.by_price_desc, row, key=self.price_desc_key)
+
+    def add(self, doc: dict):
+        self.add_many([doc])
+
+    def set_featured(self, event_id: str):
+        row = self.rows.get(event_id)
+        if row is not None:
+            self.featured_bits |= 1 << row
+
+    def update(self, doc: dict):
+        """Re-apply the fields that change after creation (featured flag, price) to an indexed event"""
+        row = self.rows[doc["id"]]
+        bit = 1 << row
+        if doc.get("is_featured"):
+            self.featured_bits |= bit
+        elif self.featured_bits & bit:
+            self.featured_bits &= ~bit
+        price_cents = doc["price_cents"] if "price_cents" in doc else price_components(
+            doc.get("price"), doc.get("city"))[0]
+        price = -1 if price_cents is None else price_cents
+        if price != self.prices[row]:
+            keep_orders = not self.orders_stale
+            if self.prices[row] >= 0 and keep_orders:
+                del self.by_price[bisect.bisect_left(self.by_price, self.price_key(row), key=self.price_key)]
+                del self.by_price_desc[
+                    bisect.bisect_left(self.by_price_desc, self.price_desc_key(row), key=self.price_desc_key)
+                ]
+            self.prices[row] = price
+            if price >= 0:
+                self.priced_bits |= bit
+                if keep_orders:
+                    bisect.insort(self.by_price, row, key=self.price_key)
+                    bisect.insort(self.by_price_desc, row, key=self.price_desc_key)
+            else:
+                self.priced_bits &= ~bit
+        self.updated_through = max(self.updated_through, doc.get("updated_at") or "")
+
+    def price_orders(self):
+        if self.orders_stale:
+            priced = list(rows_of(self.priced_bits))
+            self.by_price = array("i", sorted(priced, key=self.price_key))
+            self.by_price_desc = array("i", sorted(priced, key=self.price_desc_key))
+            self.orders_stale = False
+        return self.by_price, self.by_price_desc
+
+    async def load(self):
+        """Read every event once, in _id pages, projected to the indexed fields"""
+        self.reset()
+        # Events created or edited while the pages are read are caught by the first refresh
+        self.created_through = self.updated_through = datetime.now(timezone.utc).isoformat()
+        last_id = None
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            page = await db.events.find(query, {**EVENT_INDEX_FIELDS, "_id": 1}).sort("_id", 1).limit(
+                EVENT_INDEX_PAGE_SIZE
+            ).to_list(EVENT_INDEX_PAGE_SIZE)
+            if not page:
+                break
+            last_id = page[-1]["_id"]
+            self.add_many(page)
+        self.price_orders()
+        self.loaded = True
+        logger.info(f"Event index loaded: {len(self.ids)} events, {self.memory_bytes() / 1e6:.1f} MB")
+
+    async def refresh(self) -> int:
+        """Index events created or edited since the newest ones seen (with slack for clock skew between writers);
+        returns how many rows were added or updated"""
+        def since(watermark: str) -> str:
+            return (datetime.fromisoformat(watermark) - timedelta(seconds=60)).isoformat()
+        docs = await db.events.find(
+            {"$or": [
+                {"created_at": {"$gte": since(self.created_through)}},
+                {"updated_at": {"$gte": since(self.updated_through)}}
+            ]},
+            EVENT_INDEX_FIELDS
+        ).to_list(None)
+        new = []
+        updated = 0
+        for doc in docs:
+            if doc["id"] not in self.rows:
+                new.append(doc)
+            elif doc.get("updated_at"):
+                self.update(doc)
+                updated += 1
+        self.add_many(new)
+        return len(new) + updated
+
+    def search(self, city: Optional[str] = None, genre: Optional[str] = None, vibe: Optional[str] = None,
+               dates: Optional[List[str]] = None, featured: bool = False, min_cents: Optional[int] = None,
+               max_cents: Optional[int] = None, sort: str = "date", limit: int = 50) -> List[str]:
+        """Ids of the first `limit` matching events in the order get_events returns them"""
+        mask = None
+        for bitsets, value in ((self.city_bits, city), (self.genre_bits, genre), (self.vibe_bits, vibe)):
+            if value is not None:
+                bits = bitsets.get(value, 0)
+                mask = bits if mask is None else mask & bits
+        if featured:
+            mask = self.featured_bits if mask is None else mask & self.featured_bits
+        priced = min_cents is not None or max_cents is not None or sort != "date"
+        if priced:
+            mask = self.priced_bits if mask is None else mask & self.priced_bits
+        date_keys = self.date_keys
+        if dates is not None:
+            date_keys = sorted(d for d in set(dates) if d in self.date_bits)
+            in_dates = 0
+            for date in date_keys:
+                in_dates |= self.date_bits[date]
+            mask = in_dates if mask is None else mask & in_dates
+        if mask == 0:
+            return []
+        low = min_cents or 0
+        high = max_cents if max_cents is not None else 2 ** 62
+        prices = self.prices
+
+        if mask is not None and self.sort_directly(mask.bit_count(), limit, sort, len(date_keys)):
+            if sort == "date":
+                key = self.date_key
+            else:
+                key = self.price_desc_key if sort == "-price" else self.price_key
+            matches = rows_of(mask)
+            if priced:
+                matches = (row for row in matches if low <= prices[row] <= high)
+            rows = heapq.nsmallest(limit, matches, key=key)
+            return [self.ids[row] for row in rows]
+
+        found = []
+        if sort == "date":
+            for date in date_keys:
+                hits = self.date_bits[date] if mask is None else self.date_bits[date] & mask
+                if priced:
+                    rows = (row for row in rows_of(hits) if low <= prices[row] <= high)
+                else:
+                    rows = rows_of(hits)
+                # Within a date, rows are in arrival order; the listing wants them by id
+                rows = heapq.nsmallest(limit - len(found), rows, key=self.ids.__getitem__)
+                found.extend(self.ids[row] for row in rows)
+                if len(found) >= limit:
+                    return found
+            return found
+
+        by_price, by_price_desc = self.price_orders()
+        member = mask.to_bytes(len(self.ids) // 8 + 1, "little")
+        if sort == "-price":
+            order, position = by_price_desc, bisect.bisect_left(by_price_desc, -high, key=lambda row: -prices[row])
+        else:
+            order, position = by_price, bisect.bisect_left(by_price, low, key=prices.__getitem__)
+        for position in range(position, len(order)):
+            row = order[position]
+            if not low <= prices[row] <= high:
+                break
+            if member[row >> 3] >> (row & 7) & 1:
+                found.append(self.ids[row])
+                if len(found) >= limit:
+                    break
+        return found
+
+    def sort_directly(self, matches: int, limit: int, sort: str, buckets: int) -> bool:
+        """Whether sorting every match beats walking a presorted order until `limit` matches turn up.
+
+        Rough costs, in bitset words scanned: extracting a matching row is ~5 words; the date walk scans the
+        whole bitset once per bucket it visits; the price walk checks ~3 words' worth per row it passes.
+        """
+        words = len(self.ids) // 64 + 1
+        direct = 5 * matches + words
+        if sort == "date":
+            walk = min(buckets, limit * buckets / matches + 1) * words
+        else:
+            walk = 3 * limit * len(self.by_price) / matches + words
+        return direct <= walk
+
+    def memory_bytes(self) -> int:
+        """Approximate resident size: columns, bitsets, sort orders, ids and the id lookup"""
+        total = sys.getsizeof(self.ids) + sys.getsizeof(self.rows) + sum(sys.getsizeof(i) for i in self.ids)
+        for column in (self.days, self.prices, self.by_price, self.by_price_desc):
+            total += sys.getsizeof(column)
+        for bitsets in (self.city_bits, self.genre_bits, self.vibe_bits, self.date_bits):
+            total += sys.getsizeof(bitsets) + sum(sys.getsizeof(key) + sys.getsizeof(bits) for key, bits in bitsets.items())
+        total += sys.getsizeof(self.featured_bits) + sys.getsizeof(self.priced_bits)
+        return total
+
+class AppEventIndex:
+    """`event_index` as used by the handlers: the index of whichever app is serving the current request"""
+
+    def __init__(self):
+        self.indexes: Dict[AppContext, EventIndex] = {}
+
+    def current(self) -> EventIndex:
+        context = app_context()
+        index = self.indexes.get(context)
+        if index is None:
+            index = self.indexes[context] = EventIndex()
+        return index
+
+    def discard(self, context: AppContext):
+        self.indexes.pop(context, None)
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+event_index = AppEventIndex()
+
+class EventIndexCollector:
+    def collect(self):
+        rows = GaugeMetricFamily("pulse_event_index_rows", "Events held in this worker's in-memory index")
+        rows.add_metric([], len(event_index.ids))
+        yield rows
+        size = GaugeMetricFamily("pulse_event_index_bytes", "Approximate memory used by the event index")
+        size.add_metric([], event_index.memory_bytes() if event_index.loaded else 0)
+        yield size
+
+metrics_registry.register(EventIndexCollector())
+
+async def load_event_index():
+    try:
+        await event_index.load()
+    except Exception as e:
+        logger.error(f"Event index load error: {e}")
+
+async def run_event_index_refresher():
+    while True:
+        await asyncio.sleep(EVENT_INDEX_REFRESH_SECONDS)
+        try:
+            if event_index.loaded:
+                await event_index.refresh()
+            else:
+                await event_index.load()  # the startup load failed; get_events is still on Mongo
+        except Exception as e:
+            logger.error(f"Event index refresh error: {e}")
+
+async def events_by_id(ids: List[str]) -> List[dict]:
+    """Full documents for `ids`, in that order"""
+    if not ids:
+        return []
+    docs = await db.events.find({"id": {"$in": ids}}, {"_id": 0}).to_list(len(ids))
+    by_id = {doc["id"]: doc for doc in docs}
+    return [by_id[event_id] for event_id in ids if event_id in by_id]
+
 # ============== EVENTS ROUTES ==============
 
 @api_router.get("/events", response_model=List[Event])
@@ -367,8 +1731,50 @@ async def get_events(
     vibe: Optional[str] = None,
     date_filter: Optional[str] = None,  # tonight, weekend, all
     featured: Optional[bool] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    sort: str = Query("date", pattern="^(date|price|-price)$"),
     limit: int = Query(50, le=100)
 ):
+    events = await find_events(city, genre, vibe, date_filter, featured, min_price, max_price, sort, limit)
+    analytics.add_impressions(events)
+    return events
+
+async def find_events(
+    city: Optional[str] = None,
+    genre: Optional[str] = None,
+    vibe: Optional[str] = None,
+    date_filter: Optional[str] = None,
+    featured: Optional[bool] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    sort: str = "date",
+    limit: int = 50
+) -> List[dict]:
+    """The get_events listing, without counting impressions"""
+    # Date filtering
+    dates = None
+    if date_filter == "tonight":
+        dates = [datetime.now(timezone.utc).strftime("%Y-%m-%d")]
+    elif date_filter == "weekend":
+        # Get next 3 days
+        dates = [(datetime.now(timezone.utc) + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(4)]
+
+    if event_index.loaded:
+        ids = event_index.search(
+            city=city.lower() if city else None,
+            genre=genre.lower() if genre else None,
+            vibe=vibe.lower() if vibe else None,
+            dates=dates,
+            featured=bool(featured),
+            min_cents=round(min_price * 100) if min_price is not None else None,
+            max_cents=round(max_price * 100) if max_price is not None else None,
+            sort=sort,
+            limit=limit
+        )
+        return await events_by_id(ids)
+
+    # Until this worker's index has loaded, the same query runs in Mongo
     query = {}
     if city:
         query["city"] = city.lower()
@@ -378,51 +1784,390 @@ async def get_events(
         query["vibe"] = vibe.lower()
     if featured:
         query["is_featured"] = True
-    
-    # Date filtering
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    if date_filter == "tonight":
-        query["date"] = today
-    elif date_filter == "weekend":
-        # Get next 3 days
-        dates = [(datetime.now(timezone.utc) + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(4)]
+    if dates:
         query["date"] = {"$in": dates}
-    
-    events = await db.events.find(query, {"_id": 0}).sort("date", 1).limit(limit).to_list(limit)
-    return events
+
+    # Price filters and price sorts only see events with a known price; (city, price_cents) serves both
+    order = [("date", 1), ("id", 1)]
+    if min_price is not None or max_price is not None or sort != "date":
+        price_range = {"$gte": round((min_price or 0) * 100)}
+        if max_price is not None:
+            price_range["$lte"] = round(max_price * 100)
+        query["price_cents"] = price_range
+    if sort != "date":
+        order = [("price_cents", -1 if sort == "-price" else 1), ("date", 1), ("id", 1)]
+
+    return await db.events.find(query, {"_id": 0}).sort(order).limit(limit).to_list(limit)
 
 @api_router.get("/events/{event_id}", response_model=Event)
 async def get_event(event_id: str):
-    event = await db.events.find_one({"id": event_id}, {"_id": 0})
+    event = await event_loader.load(event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
+    analytics.add_impressions([event])
     return event
 
-@api_router.post("/events", response_model=Event)
-async def create_event(event: EventCreate, user = Depends(get_current_user)):
-    event_id = str(uuid.uuid4())
-    event_doc = {
-        "id": event_id,
+PRICE_AMOUNT = re.compile(r"\d[\d,]*(?:\.\d+)?")
+PRICE_CURRENCY_CODES = {"usd", "jmd", "cad", "eur", "gbp", "ttd"}
+PRICE_CURRENCY_SYMBOLS = {"€": "eur", "£": "gbp"}
+# Letters written before "$": J$ and TT$ are how Jamaican and Trinidadian listings write their dollars
+PRICE_DOLLAR_PREFIXES = {"us": "usd", "ca": "cad", "c": "cad", "j": "jmd", "tt": "ttd"}
+# What a bare "$" means in each city
+CITY_CURRENCIES = {"kingston": "jmd", "miami": "usd", "nyc": "usd"}
+# A currency mark right before an amount: "J$", "US $", "€", or a code like "JMD "
+PRICE_MARK_BEFORE = re.compile(r"(?:(?<![A-Za-z])([A-Za-z]{1,3}) ?)?([$€£]) ?$|(?<![A-Za-z])([A-Za-z]{3}) ?$")
+# A currency code right after an amount
+PRICE_MARK_AFTER = re.compile(r" ?([A-Za-z]{3})(?![A-Za-z])")
+# A clock time ("11pm", "9:00") that only looks like an amount
+PRICE_TIME_AFTER = re.compile(r"\s*(?:[ap]\.?m\b|:\d)", re.IGNORECASE)
+DEFAULT_CURRENCY = "usd"
+PRICE_BACKFILL_BATCH = int(os.environ.get('PRICE_BACKFILL_BATCH', 500))
+
+def price_components(price: Optional[str], city: Optional[str] = None) -> tuple:
+    """Display price -> (cents, currency): "$1,250 USD" -> (125000, "usd"), "J$1,500" -> (150000, "jmd").
+
+    A bare "$" is the dollar of the event's city. Ranges like "$20 - $40" keep their lower bound, and amounts
+    written with a currency win over bare numbers, which may be dates or times. Cents is None when the text
+    doesn't give one price in one currency: no amount, mixed currencies, "free" next to an amount, or a bare
+    "$" or number in a city without a known currency. Those are left for a person to price.
+    """
+    city_currency = CITY_CURRENCIES.get((city or "").lower())
+    if not price:
+        return None, city_currency or DEFAULT_CURRENCY
+    marked, bare, currencies = [], [], set()
+    for match in PRICE_AMOUNT.finditer(price):
+        if PRICE_TIME_AFTER.match(price, match.end()):
+            continue
+        cents = round(float(match.group().replace(",", "")) * 100)
+        before = PRICE_MARK_BEFORE.search(price, 0, match.start())
+        after = PRICE_MARK_AFTER.match(price, match.end())
+        code_after = after.group(1).lower() if after and after.group(1).lower() in PRICE_CURRENCY_CODES else None
+        currency = None
+        if before and before.group(2):
+            letters = (before.group(1) or "").lower()
+            if before.group(2) != "$":
+                currency = PRICE_CURRENCY_SYMBOLS[before.group(2)]
+            elif letters in PRICE_DOLLAR_PREFIXES:
+                currency = PRICE_DOLLAR_PREFIXES[letters]
+            elif letters in PRICE_CURRENCY_CODES:
+                currency = letters
+        elif before and before.group(3) and before.group(3).lower() in PRICE_CURRENCY_CODES:
+            currency = before.group(3).lower()
+        currency = currency or code_after
+        if currency:
+            currencies.add(currency)
+        if currency or (before and before.group(2)):
+            marked.append(cents)
+        else:
+            bare.append(cents)
+    amounts = marked or bare
+    if len(currencies) > 1:
+        return None, DEFAULT_CURRENCY
+    currency = next(iter(currencies), city_currency)
+    free = "free" in price.lower()
+    if not amounts:
+        return (0 if free else None), currency or DEFAULT_CURRENCY
+    if free or currency is None:
+        return None, currency or DEFAULT_CURRENCY
+    return min(amounts), currency
+
+def event_document(event: EventCreate, user: dict, event_id: Optional[str] = None) -> dict:
+    price_cents, currency = price_components(event.price, event.city)
+    return {
+        "id": event_id or str(uuid.uuid4()),
         **event.model_dump(),
         "city": event.city.lower(),
+        "price_cents": event.price_cents if event.price_cents is not None else price_cents,
+        "currency": (event.currency or currency).lower(),
         "promoter_id": user["id"],
         "promoter_name": user["username"],
         "is_featured": user.get("is_promoter", False),
         "attendee_count": 0,
+        "tickets_available": event.capacity,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
+
+async def backfill_event_prices(batch_size: int = PRICE_BACKFILL_BATCH) -> int:
+    """Write price_cents/currency on events stored before they existed; safe to re-run or interrupt.
+
+    Unreadable prices are stored as price_cents None, so every batch shrinks the remaining set.
+    """
+    updated = 0
+    while True:
+        batch = await db.events.find(
+            {"price_cents": {"$exists": False}}, {"_id": 1, "price": 1, "city": 1}
+        ).limit(batch_size).to_list(batch_size)
+        if not batch:
+            return updated
+        ops = []
+        for doc in batch:
+            price_cents, currency = price_components(doc.get("price"), doc.get("city"))
+            ops.append(UpdateOne(
+                {"_id": doc["_id"], "price_cents": {"$exists": False}},
+                {"$set": {"price_cents": price_cents, "currency": currency}}
+            ))
+        result = await db.events.bulk_write(ops, ordered=False)
+        updated += result.modified_count
+
+@api_router.post("/events", response_model=Event, dependencies=[rate_limited("write")])
+async def create_event(event: EventCreate, user = Depends(get_current_user)):
+    event_doc = event_document(event, user)
     await db.events.insert_one(event_doc)
+    event_index.add(event_doc)
     return Event(**event_doc)
 
-@api_router.post("/events/{event_id}/attend")
+@api_router.post("/events/{event_id}/attend", dependencies=[rate_limited("write")])
 async def attend_event(event_id: str, user = Depends(get_current_user)):
-    event = await db.events.find_one({"id": event_id})
+    event = await event_loader.load(event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     
     await db.events.update_one({"id": event_id}, {"$inc": {"attendee_count": 1}})
+    analytics.add(event, "attends")
     return {"message": "You're attending this event!"}
 
+# ============== BULK EVENT IMPORT ==============
+
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', 1000))
+IMPORT_MAX_RECORD_BYTES = int(os.environ.get('IMPORT_MAX_RECORD_BYTES', 64 * 1024))
+# A "running" import whose uploader went quiet this long can be retried with the same key
+IMPORT_LOCK_SECONDS = int(os.environ.get('IMPORT_LOCK_SECONDS', 300))
+# Event ids for keyed imports are uuid5(promoter:key:row), so a re-upload hits the unique id index
+IMPORT_ID_NAMESPACE = uuid.UUID("5b0a4f8e-3c1d-4e7a-9f2b-6d8c1e0a7b34")
+
+def record_too_large():
+    return HTTPException(status_code=413, detail=f"A record exceeds {IMPORT_MAX_RECORD_BYTES} bytes")
+
+async def upload_lines(chunks):
+    """Decode an async byte stream into lines without holding more than one partial line"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        if "\n" not in pending:
+            if len(pending) > IMPORT_MAX_RECORD_BYTES:
+                raise record_too_large()
+            continue
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+async def ndjson_rows(lines):
+    row = 0
+    async for line in lines:
+        row += 1
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield row, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(data, dict):
+            yield row, None, "Expected a JSON object"
+            continue
+        yield row, data, None
+
+async def csv_rows(lines):
+    """Rows keyed by the header line; a quoted field may span lines, so lines are joined until quotes balance"""
+    header = None
+    record, size, quotes = [], 0, 0
+    row = 0
+    async for line in lines:
+        record.append(line)
+        size += len(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            if size > IMPORT_MAX_RECORD_BYTES:
+                raise record_too_large()
+            continue
+        text = "\n".join(record)
+        record, size, quotes = [], 0, 0
+        if not text.strip():
+            continue
+        fields = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip().lower() for name in fields]
+            continue
+        row += 1
+        if len(fields) != len(header):
+            yield row, None, f"Expected {len(header)} columns, got {len(fields)}"
+            continue
+        # Blank cells mean "not set" so optional fields fall back to their defaults
+        yield row, {name: value for name, value in zip(header, fields) if value != ""}, None
+    if record:
+        yield row + 1, None, "Unterminated quoted field"
+
+def validation_message(exc: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in exc.errors())
+
+def parse_import_row(data: dict) -> EventCreate:
+    genre = data.get("genre")
+    if isinstance(genre, str):
+        # CSV cells (and lazy NDJSON) list genres as "dancehall|reggae" or "dancehall, reggae"
+        data["genre"] = [g.strip().lower() for g in genre.replace("|", ",").split(",") if g.strip()]
+    return EventCreate(**data)
+
+async def claim_import(user_id: str, key: str) -> Optional[dict]:
+    """Start a keyed import, or return the stored record if that key already completed"""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.event_imports.insert_one({
+            "promoter_id": user_id,
+            "idempotency_key": key,
+            "status": "running",
+            "created_at": now.isoformat(),
+            "updated_at": now
+        })
+        return None
+    except DuplicateKeyError:
+        pass
+    existing = await db.event_imports.find_one({"promoter_id": user_id, "idempotency_key": key}, {"_id": 0})
+    if existing and existing["status"] == "completed":
+        return existing
+    # Failed or abandoned runs are resumed; deterministic event ids make the rows already inserted duplicates
+    taken = await db.event_imports.find_one_and_update(
+        {
+            "promoter_id": user_id,
+            "idempotency_key": key,
+            "$or": [
+                {"status": "failed"},
+                {"updated_at": {"$lt": now - timedelta(seconds=IMPORT_LOCK_SECONDS)}}
+            ]
+        },
+        {"$set": {"status": "running", "updated_at": now}}
+    )
+    if taken is None:
+        raise HTTPException(status_code=409, detail="An import with this Idempotency-Key is already running")
+    return None
+
+class EventImport:
+    """Counts and per-row errors for one upload; buffers at most one batch of documents"""
+
+    def __init__(self, user: dict, key: Optional[str]):
+        self.user = user
+        self.key = key
+        self.batch: List[dict] = []
+        self.batch_rows: List[int] = []
+        self.rows = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    def error(self, row: int, message: str):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def event_id(self, row: int) -> Optional[str]:
+        if self.key is None:
+            return None
+        return str(uuid.uuid5(IMPORT_ID_NAMESPACE, f"{self.user['id']}:{self.key}:{row}"))
+
+    async def add(self, row: int, data: Optional[dict], error: Optional[str]):
+        self.rows += 1
+        if error:
+            self.error(row, error)
+            return
+        try:
+            event = parse_import_row(data)
+        except ValidationError as e:
+            self.error(row, validation_message(e))
+            return
+        self.batch.append(event_document(event, self.user, self.event_id(row)))
+        self.batch_rows.append(row)
+        if len(self.batch) >= IMPORT_BATCH_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        if not self.batch:
+            return
+        batch, rows = self.batch, self.batch_rows
+        self.batch, self.batch_rows = [], []
+        rejected = set()
+        try:
+            result = await db.events.insert_many(batch, ordered=False)
+            self.inserted += len(result.inserted_ids)
+        except BulkWriteError as e:
+            self.inserted += e.details.get("nInserted", 0)
+            for write_error in e.details.get("writeErrors", []):
+                if write_error.get("code") == 11000:
+                    self.duplicates += 1
+                else:
+                    rejected.add(write_error["index"])
+                    self.error(rows[write_error["index"]], write_error.get("errmsg", "Insert failed"))
+        # Duplicates are rows a previous attempt stored; the index skips ids it already has
+        event_index.add_many([doc for i, doc in enumerate(batch) if i not in rejected])
+        if self.key is not None:
+            await db.event_imports.update_one(
+                {"promoter_id": self.user["id"], "idempotency_key": self.key},
+                {"$set": {"updated_at": datetime.now(timezone.utc)}}
+            )
+
+    def result(self) -> dict:
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors)
+        }
+
+def import_format(request: Request, format: Optional[str]) -> str:
+    if format:
+        return format
+    content_type = request.headers.get("content-type", "")
+    if "csv" in content_type:
+        return "csv"
+    if "ndjson" in content_type or "jsonl" in content_type or "json" in content_type:
+        return "ndjson"
+    raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson, or pass ?format=")
+
+@api_router.post("/events/import")
+async def import_events(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    idempotency_key: Optional[str] = Header(None, max_length=200),
+    user = Depends(get_current_user)
+):
+    """Bulk-create events from a CSV (header row required) or NDJSON upload, streamed and inserted in batches.
+
+    Rows are numbered from 1 (CSV data rows after the header, NDJSON lines). Re-sending a completed upload with
+    the same Idempotency-Key returns the original result; resuming a failed one skips rows already inserted.
+    """
+    parse_rows = csv_rows if import_format(request, format) == "csv" else ndjson_rows
+    if idempotency_key is not None:
+        previous = await claim_import(user["id"], idempotency_key)
+        if previous is not None:
+            return {**previous["result"], "replayed": True}
+
+    job = EventImport(user, idempotency_key)
+    try:
+        async for row, data, error in parse_rows(upload_lines(request.stream())):
+            await job.add(row, data, error)
+        await job.flush()
+    except Exception:
+        if idempotency_key is not None:
+            await db.event_imports.update_one(
+                {"promoter_id": user["id"], "idempotency_key": idempotency_key},
+                {"$set": {"status": "failed", "updated_at": datetime.now(timezone.utc)}}
+            )
+        raise
+
+    result = job.result()
+    if idempotency_key is not None:
+        await db.event_imports.update_one(
+            {"promoter_id": user["id"], "idempotency_key": idempotency_key},
+            {"$set": {"status": "completed", "result": result, "updated_at": datetime.now(timezone.utc)}}
+        )
+    return {**result, "replayed": False}
+
 # ============== FEED ROUTES ==============
 
 @api_router.get("/feed/{city}", response_model=List[FeedPost])
@@ -433,7 +2178,7 @@ async def get_city_feed(city: str, limit: int = Query(50, le=100)):
     ).sort("created_at", -1).limit(limit).to_list(limit)
     return posts
 
-@api_router.post("/feed", response_model=FeedPost)
+@api_router.post("/feed", response_model=FeedPost, dependencies=[rate_limited("write")])
 async def create_feed_post(post: FeedPostCreate, user = Depends(get_current_user)):
     post_id = str(uuid.uuid4())
     post_doc = {
@@ -448,24 +2193,104 @@ async def create_feed_post(post: FeedPostCreate, user = Depends(get_current_user
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.feed_posts.insert_one(post_doc)
+    if post.event_id:
+        event = await event_loader.load(post.event_id)
+        if event:
+            analytics.add(event, "feed_mentions")
     return FeedPost(**post_doc)
 
-@api_router.post("/feed/{post_id}/like")
+@api_router.post("/feed/{post_id}/like", dependencies=[rate_limited("write")])
 async def like_post(post_id: str, user = Depends(get_current_user)):
     await db.feed_posts.update_one({"id": post_id}, {"$inc": {"likes": 1}})
     return {"message": "Post liked"}
 
 # ============== CHAT ROUTES ==============
 
+class ChatHistory:
+    """Ring buffer of the most recent chat messages per city, oldest first.
+
+    Each worker appends its own messages as they are sent and pulls in everyone else's from Mongo on a
+    created_at watermark, the same way the event index catches up. The refresh also drops messages the
+    archiver has moved out of Mongo.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.buffers: dict[str, deque] = {city: deque(maxlen=size) for city in CITIES}
+        self.created_through = ""
+    
+    async def warm(self):
+        self.created_through = datetime.now(timezone.utc).isoformat()
+        for city in self.buffers:
+            messages = await db.chat_messages.find(
+                {"city": city},
+                {"_id": 0, "expires_at": 0}
+            ).sort("created_at", -1).limit(self.size).to_list(self.size)
+            self.buffers[city] = deque(reversed(messages), maxlen=self.size)
+    
+    async def refresh(self) -> int:
+        """Merge messages stored since the watermark (with slack for clock skew between writers) and drop
+        archived ones; returns how many messages were added"""
+        if not self.created_through:
+            await self.warm()
+            return 0
+        since = (datetime.fromisoformat(self.created_through) - timedelta(seconds=10)).isoformat()
+        self.created_through = datetime.now(timezone.utc).isoformat()
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=RETENTION_DAYS["chat_messages"])).isoformat()
+        added = 0
+        for city in list(self.buffers):
+            messages = await db.chat_messages.find(
+                {"city": city, "created_at": {"$gte": since}},
+                {"_id": 0, "expires_at": 0}
+            ).sort("created_at", -1).limit(self.size).to_list(self.size)
+            buffer = self.buffers[city]
+            known = {m["id"] for m in buffer}
+            new = [m for m in messages if m["id"] not in known]
+            if new:
+                added += len(new)
+                # Other workers' messages interleave with ours, so the merged buffer is re-sorted
+                buffer = self.buffers[city] = deque(
+                    sorted([*buffer, *new], key=lambda m: m["created_at"])[-self.size:], maxlen=self.size
+                )
+            while buffer and buffer[0]["created_at"] < cutoff:
+                buffer.popleft()
+        return added
+    
+    def append(self, message: dict):
+        buffer = self.buffers.get(message["city"])
+        if buffer is not None:
+            buffer.append(message)
+    
+    def recent(self, city: str, limit: int) -> Optional[List[dict]]:
+        """Last `limit` messages for a city, or None if the buffer can't answer"""
+        buffer = self.buffers.get(city)
+        if buffer is None or limit > self.size:
+            return None
+        if limit >= len(buffer):
+            return list(buffer)
+        return list(islice(buffer, len(buffer) - limit, None))
+
+chat_history = ChatHistory(CHAT_HISTORY_SIZE)
+
+async def run_chat_history_refresher():
+    while True:
+        await asyncio.sleep(CHAT_HISTORY_REFRESH_SECONDS)
+        try:
+            await chat_history.refresh()
+        except Exception as e:
+            logger.error(f"Chat history refresh error: {e}")
+
 @api_router.get("/chat/{city}/messages", response_model=List[ChatMessage])
 async def get_chat_messages(city: str, limit: int = Query(100, le=200)):
+    messages = chat_history.recent(city.lower(), limit)
+    if messages is not None:
+        return messages
     messages = await db.chat_messages.find(
         {"city": city.lower()}, 
         {"_id": 0}
     ).sort("created_at", -1).limit(limit).to_list(limit)
     return list(reversed(messages))
 
-@api_router.post("/chat/{city}/message", response_model=ChatMessage)
+@api_router.post("/chat/{city}/message", response_model=ChatMessage, dependencies=[rate_limited("chat")])
 async def send_chat_message(city: str, content: str = Query(...), user = Depends(get_current_user)):
     msg_id = str(uuid.uuid4())
     msg_doc = {
@@ -477,7 +2302,9 @@ async def send_chat_message(city: str, content: str = Query(...), user = Depends
         "content": content,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    await db.chat_messages.insert_one(msg_doc)
+    await db.chat_messages.insert_one({**msg_doc, "expires_at": retention_expiry("chat_messages")})
+    chat_history.append(msg_doc)
+    await manager.broadcast(msg_doc, msg_doc["city"])
     return ChatMessage(**msg_doc)
 
 # ============== VENUES ROUTES ==============
@@ -497,66 +2324,644 @@ async def get_venue(venue_id: str):
         raise HTTPException(status_code=404, detail="Venue not found")
     return venue
 
-@api_router.post("/venues", response_model=Venue)
-async def create_venue(venue: VenueCreate, user = Depends(get_current_user)):
-    venue_id = str(uuid.uuid4())
-    venue_doc = {
-        "id": venue_id,
-        **venue.model_dump(),
-        "city": venue.city.lower(),
-        "is_verified": user.get("is_promoter", False),
-        "owner_id": user["id"],
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    await db.venues.insert_one(venue_doc)
-    return Venue(**venue_doc)
+@api_router.post("/venues", response_model=Venue, dependencies=[rate_limited("write")])
+async def create_venue(venue: VenueCreate, user = Depends(get_current_user)):
+    venue_id = str(uuid.uuid4())
+    venue_doc = {
+        "id": venue_id,
+        **venue.model_dump(),
+        "city": venue.city.lower(),
+        "is_verified": user.get("is_promoter", False),
+        "owner_id": user["id"],
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    await db.venues.insert_one(venue_doc)
+    return Venue(**venue_doc)
+
+# ============== NOTIFICATIONS ROUTES ==============
+
+@api_router.get("/notifications", response_model=List[Notification])
+async def get_notifications(user = Depends(get_current_user), limit: int = Query(50, le=100)):
+    notifications = await db.notifications.find(
+        {"user_id": user["id"]}, 
+        {"_id": 0}
+    ).sort("created_at", -1).limit(limit).to_list(limit)
+    return notifications
+
+async def adjust_unread_count(user_id: str, delta: int) -> int:
+    """Atomically apply delta to a user's unread counter and push the new value to this worker's sockets.
+
+    Only increments create the counter. A decrement for a user without one is dropped: the first read seeds
+    the counter from the notifications themselves, which already reflects the change. A counter driven
+    below zero is clamped back to 0.
+    """
+    # updated_at lets the other workers find the change and push it to the user's sockets there
+    updated_at = datetime.now(timezone.utc).isoformat()
+    counter = await db.notification_counters.find_one_and_update(
+        {"user_id": user_id},
+        {"$inc": {"unread": delta}, "$set": {"updated_at": updated_at}},
+        upsert=delta > 0,
+        return_document=ReturnDocument.AFTER,
+        projection={"_id": 0}
+    )
+    if counter is None:
+        return 0
+    if counter.get("unread", 0) < 0:
+        await db.notification_counters.update_one(
+            {"user_id": user_id, "unread": {"$lt": 0}},
+            {"$set": {"unread": 0, "updated_at": updated_at}}
+        )
+    count = max(counter.get("unread", 0), 0)
+    await notification_manager.push_unread_count(user_id, count)
+    return count
+
+async def get_unread_counter(user_id: str) -> int:
+    """Read the maintained unread counter, seeding it once for users created before it existed"""
+    counter = await db.notification_counters.find_one({"user_id": user_id}, {"_id": 0})
+    if counter is not None:
+        return max(counter.get("unread", 0), 0)
+    count = await db.notifications.count_documents({"user_id": user_id, "is_read": False})
+    counter = await db.notification_counters.find_one_and_update(
+        {"user_id": user_id},
+        {"$setOnInsert": {"unread": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+        projection={"_id": 0}
+    )
+    return max(counter.get("unread", 0), 0)
+
+async def create_notification(user_id: str, title: str, message: str, notification_type: str,
+                              city: Optional[str] = None, event_id: Optional[str] = None) -> dict:
+    """Insert a notification and bump the owner's unread counter"""
+    notification = {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "title": title,
+        "message": message,
+        "notification_type": notification_type,
+        "city": city,
+        "event_id": event_id,
+        "is_read": False,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    await get_unread_counter(user_id)
+    await db.notifications.insert_one({**notification, "expires_at": retention_expiry("notifications")})
+    await adjust_unread_count(user_id, 1)
+    return notification
+
+@api_router.put("/notifications/read-all")
+async def mark_all_notifications_read(user = Depends(get_current_user)):
+    count = await get_unread_counter(user["id"])
+    result = await db.notifications.update_many(
+        {"user_id": user["id"], "is_read": False},
+        {"$set": {"is_read": True}}
+    )
+    if result.modified_count:
+        count = await adjust_unread_count(user["id"], -result.modified_count)
+    return {"message": "All marked as read", "count": count}
+
+@api_router.put("/notifications/{notification_id}/read")
+async def mark_notification_read(notification_id: str, user = Depends(get_current_user)):
+    await get_unread_counter(user["id"])
+    result = await db.notifications.update_one(
+        {"id": notification_id, "user_id": user["id"], "is_read": False}, 
+        {"$set": {"is_read": True}}
+    )
+    if result.modified_count:
+        await adjust_unread_count(user["id"], -1)
+    return {"message": "Marked as read"}
+
+@api_router.get("/notifications/unread-count")
+async def get_unread_count(user = Depends(get_current_user)):
+    count = await get_unread_counter(user["id"])
+    return {"count": count}
+
+# ============== UTILITY ROUTES ==============
+
+@api_router.get("/cities")
+async def get_cities():
+    return {
+        "cities": [
+            {"id": "kingston", "name": "Kingston", "country": "Jamaica", "flag": "🇯🇲"},
+            {"id": "miami", "name": "Miami", "country": "USA", "flag": "🇺🇸"},
+            {"id": "nyc", "name": "New York City", "country": "USA", "flag": "🇺🇸"}
+        ]
+    }
+
+@api_router.get("/genres")
+async def get_genres():
+    return {"genres": GENRES}
+
+@api_router.get("/vibes")
+async def get_vibes():
+    return {"vibes": VIBES}
+
+@api_router.get("/")
+async def root():
+    return {"message": "Pulse of the City API", "version": "1.0.0"}
+
+# ============== CITY SNAPSHOT ==============
+
+# Items per section of /cities/{city}/snapshot
+SNAPSHOT_LIMITS = {
+    "events": int(os.environ.get('SNAPSHOT_EVENTS', 20)),
+    "feed": int(os.environ.get('SNAPSHOT_FEED_POSTS', 20)),
+    "chat": int(os.environ.get('SNAPSHOT_CHAT_MESSAGES', 50)),
+    "venues": int(os.environ.get('SNAPSHOT_VENUES', 20))
+}
+# Anonymous snapshots are the same for everyone: each worker builds one per city per window, and shared caches
+# (CDN, proxies) may keep it that long too
+SNAPSHOT_CACHE_SECONDS = float(os.environ.get('SNAPSHOT_CACHE_SECONDS', 10))
+SNAPSHOT_CACHE_MAX_CITIES = int(os.environ.get('SNAPSHOT_CACHE_MAX_CITIES', 256))
+
+class CitySnapshot(BaseModel):
+    city: str
+    events: List[Event]
+    feed: List[FeedPost]
+    chat: List[ChatMessage]
+    venues: List[Venue]
+    unread_count: Optional[int] = None
+
+async def build_city_snapshot(city: str, user: Optional[dict] = None) -> tuple:
+    """All sections from one concurrent round of queries, serialized; returns (body, etag, events)"""
+    sections = [
+        find_events(city, limit=SNAPSHOT_LIMITS["events"]),
+        get_city_feed(city, limit=SNAPSHOT_LIMITS["feed"]),
+        get_chat_messages(city, limit=SNAPSHOT_LIMITS["chat"]),
+        get_venues(city, limit=SNAPSHOT_LIMITS["venues"])
+    ]
+    if user is not None:
+        sections.append(get_unread_counter(user["id"]))
+    events, feed, chat, venues, *unread = await asyncio.gather(*sections)
+    snapshot = CitySnapshot(city=city, events=events, feed=feed, chat=chat, venues=venues,
+                            unread_count=unread[0] if unread else None)
+    body = snapshot.model_dump_json().encode()
+    return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"', events
+
+class SnapshotCache:
+    """Anonymous snapshots per (app, city) for SNAPSHOT_CACHE_SECONDS; concurrent misses share one build"""
+    def __init__(self, ttl: float, max_cities: int):
+        self.ttl = ttl
+        self.max_cities = max_cities
+        self.entries: OrderedDict = OrderedDict()  # key -> (expires at, body, etag, events)
+        self.building: Dict[tuple, asyncio.Task] = {}
+
+    async def get(self, city: str) -> tuple:
+        key = (app_context(), city)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry
+        build = self.building.get(key)
+        if build is None:
+            build = self.building[key] = asyncio.create_task(self.build(key, city))
+        return await asyncio.shield(build)
+
+    async def build(self, key: tuple, city: str) -> tuple:
+        try:
+            entry = (time.monotonic() + self.ttl, *await build_city_snapshot(city))
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_cities:
+                self.entries.popitem(last=False)
+            return entry
+        finally:
+            del self.building[key]
+
+snapshot_cache = SnapshotCache(SNAPSHOT_CACHE_SECONDS, SNAPSHOT_CACHE_MAX_CITIES)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+@api_router.get("/cities/{city}/snapshot", response_model=CitySnapshot)
+async def get_city_snapshot(
+    city: str,
+    if_none_match: Optional[str] = Header(None),
+    user = Depends(get_optional_user)
+):
+    """Events, feed, chat, venues and (logged in) the unread count for a city screen in one round trip.
+
+    The ETag covers the whole body, so a client revalidating with If-None-Match gets a bodiless 304 until any
+    section changes. Anonymous callers are served from the shared snapshot cache.
+    """
+    city = city.lower()
+    if user is None:
+        _, body, etag, events = await snapshot_cache.get(city)
+        cache_control = f"public, max-age={int(SNAPSHOT_CACHE_SECONDS)}"
+    else:
+        body, etag, events = await build_city_snapshot(city, user)
+        cache_control = "private, no-cache"
+    analytics.add_impressions(events)
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Authorization"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# ============== TICKET INVENTORY ==============
+
+# How long a buyer has to finish Stripe checkout before their tickets go back on sale
+TICKET_HOLD_SECONDS = int(os.environ.get('TICKET_HOLD_SECONDS', 600))
+HOLD_SWEEP_SECONDS = float(os.environ.get('HOLD_SWEEP_SECONDS', 5))
+HOLD_SWEEP_BATCH = int(os.environ.get('HOLD_SWEEP_BATCH', 500))
+# Released holds are kept this long for support lookups, then dropped by TTL
+HOLD_RETENTION_SECONDS = int(os.environ.get('HOLD_RETENTION_SECONDS', 7 * 86400))
+
+async def reserve_tickets(event_id: str, user_id: str, quantity: int):
+    """Take `quantity` tickets off an event's stock and record a hold; returns (event, hold or None).
+
+    The decrement is one conditional update on the event, so concurrent buyers can never take more than is
+    left. Stock is taken before the hold is written: a crash in between can only undersell, never oversell.
+    Events without a capacity are unlimited and get no hold.
+    """
+    event = await db.events.find_one_and_update(
+        {"id": event_id, "tickets_available": {"$gte": quantity}},
+        {"$inc": {"tickets_available": -quantity}},
+        projection={"_id": 0}
+    )
+    if event is None:
+        event = await db.events.find_one({"id": event_id}, {"_id": 0})
+        if not event:
+            raise HTTPException(status_code=404, detail="Event not found")
+        if event.get("capacity") is not None:
+            left = event.get("tickets_available", 0)
+            raise HTTPException(status_code=409, detail="Sold out" if left <= 0 else f"Only {left} ticket(s) left")
+        return event, None
+    now = datetime.now(timezone.utc)
+    hold = {
+        "id": str(uuid.uuid4()),
+        "event_id": event_id,
+        "user_id": user_id,
+        "quantity": quantity,
+        "status": "held",
+        "expires_at": now + timedelta(seconds=TICKET_HOLD_SECONDS),
+        "created_at": now.isoformat()
+    }
+    await db.ticket_holds.insert_one(dict(hold))
+    return event, hold
+
+async def release_hold(hold_id: str, reason: str) -> bool:
+    """Return a live hold's tickets to stock; only the first caller for a hold wins"""
+    hold = await db.ticket_holds.find_one_and_update(
+        {"id": hold_id, "status": "held"},
+        {"$set": {"status": reason, "released_at": datetime.now(timezone.utc)}}
+    )
+    if hold is None:
+        return False
+    await db.events.update_one({"id": hold["event_id"]}, {"$inc": {"tickets_available": hold["quantity"]}})
+    return True
+
+async def confirm_hold(hold_id: str) -> bool:
+    """Turn a hold into sold tickets; False if it was already confirmed (an earlier attempt at the payment)"""
+    now = datetime.now(timezone.utc)
+    hold = await db.ticket_holds.find_one_and_update(
+        {"id": hold_id, "status": "held"},
+        {"$set": {"status": "confirmed", "confirmed_at": now}}
+    )
+    if hold is not None:
+        return True
+    # Paid after the hold lapsed (Stripe sessions outlive holds): claim the hold back, then re-take the stock
+    hold = await db.ticket_holds.find_one_and_update(
+        {"id": hold_id, "status": {"$in": ["expired", "cancelled"]}},
+        {"$set": {"status": "confirmed", "confirmed_at": now}, "$unset": {"released_at": ""}}
+    )
+    if hold is None:
+        return False
+    taken = await db.events.update_one(
+        {"id": hold["event_id"], "tickets_available": {"$gte": hold["quantity"]}},
+        {"$inc": {"tickets_available": -hold["quantity"]}}
+    )
+    if not taken.modified_count:
+        await db.ticket_holds.update_one({"id": hold_id}, {"$set": {"oversold": True}})
+        logger.error(f"Hold {hold_id} was paid after expiring and the event has sold out; needs a refund")
+    return True
+
+async def release_expired_holds() -> int:
+    """Release holds past their expiry, found through the partial expires_at index over live holds only"""
+    expired = await db.ticket_holds.find(
+        {"status": "held", "expires_at": {"$lte": datetime.now(timezone.utc)}},
+        {"_id": 0, "id": 1}
+    ).sort("expires_at", 1).limit(HOLD_SWEEP_BATCH).to_list(HOLD_SWEEP_BATCH)
+    released = 0
+    for hold in expired:
+        released += await release_hold(hold["id"], "expired")
+    return released
+
+async def run_hold_releaser():
+    while True:
+        try:
+            while await release_expired_holds() >= HOLD_SWEEP_BATCH:
+                pass
+        except Exception as e:
+            logger.error(f"Hold release error: {e}")
+        await asyncio.sleep(HOLD_SWEEP_SECONDS)
+
+# ============== WAITING ROOM ==============
+
+# How long a worker trusts its copy of a room; a room switched on or off elsewhere takes effect here within this
+WAITING_ROOM_CACHE_SECONDS = float(os.environ.get('WAITING_ROOM_CACHE_SECONDS', 2))
+WAITING_ROOM_CACHE_MAX = int(os.environ.get('WAITING_ROOM_CACHE_MAX', 10000))
+QUEUE_TOKEN_TTL_SECONDS = int(os.environ.get('QUEUE_TOKEN_TTL_SECONDS', 4 * 3600))
+
+class WaitingRoom:
+    """FIFO admission for one event without storing the line itself.
+
+    Arrivals get consecutive sequence numbers; everyone up to `admitted_through(now)` may check out. Admission
+    advances with time at `admit_per_minute`, so position is one subtraction. When the line is fully admitted the
+    next arrival rebases the clock, so idle minutes never bank up into a burst.
+
+    This is a worker's read-only copy of the room's `waiting_rooms` document, which every worker shares:
+    sequence numbers come from an atomic $inc there, never from this copy.
+    """
+    __slots__ = ("event_id", "admit_per_minute", "next_seq", "base_admitted", "base_time")
+
+    def __init__(self, doc: dict):
+        self.event_id = doc["event_id"]
+        self.admit_per_minute = doc["admit_per_minute"]
+        self.next_seq = doc["next_seq"]
+        self.base_admitted = doc["base_admitted"]
+        self.base_time = doc["base_time"]
+
+    def allowance(self, now: float) -> int:
+        return self.base_admitted + int((now - self.base_time) * self.admit_per_minute / 60)
+
+    def admitted_through(self, now: float) -> int:
+        return min(self.allowance(now), self.next_seq)
+
+    def status(self, seq: int, now: float) -> dict:
+        position = max(0, seq - self.admitted_through(now))
+        return {
+            "admitted": position == 0,
+            "position": position,
+            "estimated_wait_seconds": round(position * 60 / self.admit_per_minute)
+        }
+
+class WaitingRooms:
+    """Rooms live in `waiting_rooms` and places in line in `waiting_room_members`; each worker caches the rooms
+    briefly, including the events that have none, so polls and the checkout gate rarely touch Mongo
+    """
+
+    def __init__(self):
+        self.rooms: OrderedDict[str, tuple] = OrderedDict()  # event_id -> (fetched at, room or None)
+
+    def remember(self, event_id: str, doc: Optional[dict]) -> Optional[WaitingRoom]:
+        room = WaitingRoom(doc) if doc is not None else None
+        self.rooms[event_id] = (time.monotonic(), room)
+        self.rooms.move_to_end(event_id)
+        while len(self.rooms) > WAITING_ROOM_CACHE_MAX:
+            self.rooms.popitem(last=False)
+        return room
+
+    async def get(self, event_id: str, seq: int = 0) -> Optional[WaitingRoom]:
+        """The event's room if it has one switched on; re-read when stale or older than the caller's place in line"""
+        cached = self.rooms.get(event_id)
+        if cached is not None and time.monotonic() - cached[0] < WAITING_ROOM_CACHE_SECONDS:
+            room = cached[1]
+            # A seq past our copy's counter was handed out by another worker since we read the room
+            if room is None or seq <= room.next_seq:
+                return room
+        doc = await db.waiting_rooms.find_one({"event_id": event_id, "enabled": True}, {"_id": 0})
+        return self.remember(event_id, doc)
+
+    async def configure(self, event_id: str, config: WaitingRoomConfig) -> Optional[WaitingRoom]:
+        if not config.enabled:
+            await db.waiting_rooms.update_one({"event_id": event_id}, {"$set": {"enabled": False}})
+            return self.remember(event_id, None)
+        now = time.time()
+        doc = await db.waiting_rooms.find_one({"event_id": event_id}, {"_id": 0})
+        if doc is None:
+            base_admitted = 0
+        elif doc["enabled"]:
+            # Re-anchor at the current admission point so a rate change doesn't admit or un-admit anyone
+            base_admitted = WaitingRoom(doc).admitted_through(now)
+        else:
+            # Switched back on: whoever held a place in the old line is in
+            base_admitted = doc["next_seq"]
+        # The counter is left alone so joins racing this keep their places
+        doc = await db.waiting_rooms.find_one_and_update(
+            {"event_id": event_id},
+            {
+                "$set": {"enabled": True, "admit_per_minute": config.admit_per_minute,
+                         "base_admitted": base_admitted, "base_time": now},
+                "$setOnInsert": {"next_seq": 0}
+            },
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return self.remember(event_id, doc)
+
+    async def join(self, event_id: str, user_id: str) -> Optional[tuple]:
+        """(room, seq) with the user's place in line, taking the next one on their first join; None without a room"""
+        member = await db.waiting_room_members.find_one({"event_id": event_id, "user_id": user_id}, {"_id": 0})
+        while True:
+            room = await self.get(event_id, member["seq"] if member else 0)
+            if room is None or member is not None:
+                return (room, member["seq"]) if room is not None else None
+            now = time.time()
+            query = {"event_id": event_id, "enabled": True}
+            update = {"$inc": {"next_seq": 1}}
+            if room.allowance(now) >= room.next_seq:
+                # Everyone is in: restart the clock at this arrival. Conditional on the counter, so a concurrent
+                # join can't be rebased past; the loser re-reads and retries
+                query["next_seq"] = room.next_seq
+                update["$set"] = {"base_admitted": room.next_seq, "base_time": now}
+            doc = await db.waiting_rooms.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+            if doc is not None:
+                break
+            self.rooms.pop(event_id, None)
+        room = self.remember(event_id, doc)
+        seq = doc["next_seq"]
+        try:
+            await db.waiting_room_members.insert_one({
+                "event_id": event_id, "user_id": user_id, "seq": seq,
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=QUEUE_TOKEN_TTL_SECONDS)
+            })
+        except DuplicateKeyError:
+            # The same user joined on another worker at the same moment; theirs stands, this seq goes unused
+            member = await db.waiting_room_members.find_one({"event_id": event_id, "user_id": user_id}, {"_id": 0})
+            seq = member["seq"]
+        return room, seq
+
+    def issue_token(self, room: WaitingRoom, user_id: str, seq: int) -> str:
+        expire = datetime.now(timezone.utc) + timedelta(seconds=QUEUE_TOKEN_TTL_SECONDS)
+        # "uid" rather than "sub" so a queue token can never pass as an access token
+        claims = {"typ": "queue", "event_id": room.event_id, "uid": user_id, "seq": seq, "exp": expire}
+        return jwt.encode(claims, get_settings().jwt_secret, algorithm=ALGORITHM)
+
+    def token_seq(self, token: str, event_id: str, user_id: str) -> int:
+        try:
+            claims = jwt.decode(token, get_settings().jwt_secret, algorithms=[ALGORITHM])
+        except JWTError:
+            raise HTTPException(status_code=403, detail="Invalid or expired queue token")
+        if claims.get("typ") != "queue" or claims.get("event_id") != event_id or claims.get("uid") != user_id:
+            raise HTTPException(status_code=403, detail="Queue token is for a different event or user")
+        return claims["seq"]
+
+    async def check_admitted(self, event_id: str, user_id: str, token: Optional[str]):
+        """Gate for checkout creation; a no-op for events without a waiting room"""
+        if await self.get(event_id) is None:
+            return
+        if not token:
+            raise HTTPException(status_code=403, detail="This event has a waiting room; join the queue first")
+        seq = self.token_seq(token, event_id, user_id)
+        room = await self.get(event_id, seq)
+        if room is None:
+            return
+        status = room.status(seq, time.time())
+        if not status["admitted"]:
+            raise HTTPException(
+                status_code=403,
+                detail=f"Still in the queue at position {status['position']}",
+                headers={"Retry-After": str(max(1, status["estimated_wait_seconds"]))}
+            )
+
+waiting_rooms = WaitingRooms()
+
+@api_router.put("/events/{event_id}/waiting-room")
+async def configure_waiting_room(event_id: str, config: WaitingRoomConfig, user = Depends(get_current_user)):
+    """Switch an event's waiting room on or off, or change its admission rate"""
+    event = await event_loader.load(event_id)
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found")
+    if event.get("promoter_id") != user["id"] and not is_admin(user):
+        raise HTTPException(status_code=403, detail="Not your event")
+    room = await waiting_rooms.configure(event_id, config)
+    return {"enabled": room is not None, "admit_per_minute": room.admit_per_minute if room else None}
+
+@api_router.post("/events/{event_id}/queue")
+async def join_queue(event_id: str, token: Optional[str] = None, user = Depends(get_current_user)):
+    """Take a place in line; joining again, or with the old token, keeps the same place"""
+    if token:
+        seq = waiting_rooms.token_seq(token, event_id, user["id"])
+        room = await waiting_rooms.get(event_id, seq)
+        joined = (room, seq) if room is not None else None
+    else:
+        joined = await waiting_rooms.join(event_id, user["id"])
+    if joined is None:
+        return {"enabled": False, "admitted": True, "token": None}
+    room, seq = joined
+    token = waiting_rooms.issue_token(room, user["id"], seq)
+    return {"enabled": True, "token": token, **room.status(seq, time.time())}
 
-# ============== NOTIFICATIONS ROUTES ==============
+@api_router.get("/events/{event_id}/queue")
+async def queue_position(event_id: str, token: str, user = Depends(get_current_user)):
+    """Cheap poll: verifies the token and does O(1) arithmetic on the briefly cached room"""
+    seq = waiting_rooms.token_seq(token, event_id, user["id"])
+    room = await waiting_rooms.get(event_id, seq)
+    if room is None:
+        return {"enabled": False, "admitted": True, "position": 0, "estimated_wait_seconds": 0}
+    return {"enabled": True, **room.status(seq, time.time())}
 
-@api_router.get("/notifications", response_model=List[Notification])
-async def get_notifications(user = Depends(get_current_user), limit: int = Query(50, le=100)):
-    notifications = await db.notifications.find(
-        {"user_id": user["id"]}, 
-        {"_id": 0}
-    ).sort("created_at", -1).limit(limit).to_list(limit)
-    return notifications
+# ============== IDEMPOTENCY ==============
 
-@api_router.put("/notifications/{notification_id}/read")
-async def mark_notification_read(notification_id: str, user = Depends(get_current_user)):
-    await db.notifications.update_one(
-        {"id": notification_id, "user_id": user["id"]}, 
-        {"$set": {"is_read": True}}
-    )
-    return {"message": "Marked as read"}
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 86400))
+# How long a duplicate waits for the original request before giving up with 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 30))
+# An in-flight claim older than this belongs to a request that died; a retry may take it over
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', 120))
 
-@api_router.get("/notifications/unread-count")
-async def get_unread_count(user = Depends(get_current_user)):
-    count = await db.notifications.count_documents({"user_id": user["id"], "is_read": False})
-    return {"count": count}
+class IdempotencyStore:
+    """First response per (user_id, Idempotency-Key), kept in `idempotency_keys` until its TTL.
 
-# ============== UTILITY ROUTES ==============
+    Failed requests are not stored: the claim is dropped so the client's retry runs for real. Queue tokens are
+    left out of the fingerprint, since they are refreshed while the buyer waits in line. Duplicates that
+    arrive while the original is running wait for it (on a local future, or by polling when another worker has
+    it) and then replay its response.
+    """
 
-@api_router.get("/cities")
-async def get_cities():
-    return {
-        "cities": [
-            {"id": "kingston", "name": "Kingston", "country": "Jamaica", "flag": "🇯🇲"},
-            {"id": "miami", "name": "Miami", "country": "USA", "flag": "🇺🇸"},
-            {"id": "nyc", "name": "New York City", "country": "USA", "flag": "🇺🇸"}
-        ]
-    }
+    def __init__(self):
+        self.inflight: Dict[tuple, asyncio.Future] = {}
 
-@api_router.get("/genres")
-async def get_genres():
-    return {"genres": GENRES}
+    async def run(self, user_id: str, key: Optional[str], scope: str, request: BaseModel, response: Response, handler):
+        if key is None:
+            return await handler()
+        # The queue token is refreshed while the buyer waits; a retry with a newer one is still the same request
+        body = request.model_dump_json(exclude={"queue_token"})
+        fingerprint = hashlib.sha256(f"{scope}:{body}".encode()).hexdigest()
+        ident = (user_id, key)
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            claimed, stored = await self.claim(user_id, key, fingerprint)
+            if claimed:
+                break
+            if stored is not None:
+                response.headers["Idempotent-Replayed"] = "true"
+                return stored
+            await self.wait(ident, deadline)
 
-@api_router.get("/vibes")
-async def get_vibes():
-    return {"vibes": VIBES}
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[ident] = future
+        try:
+            try:
+                result = await handler()
+            except BaseException:
+                await db.idempotency_keys.delete_one({"user_id": user_id, "key": key, "status": "in_flight"})
+                raise
+            try:
+                await db.idempotency_keys.update_one(
+                    {"user_id": user_id, "key": key},
+                    {"$set": {"status": "done", "response": result}}
+                )
+            except Exception as e:
+                # The handler's effects (a Stripe session) exist, so the claim must not be dropped: a retry then
+                # waits out IDEMPOTENCY_LOCK_SECONDS as it would after a crash, instead of running again at once
+                logger.error(f"Idempotent response for key {key} not stored: {e}")
+            return result
+        finally:
+            self.inflight.pop(ident, None)
+            future.set_result(None)
 
-@api_router.get("/")
-async def root():
-    return {"message": "Pulse of the City API", "version": "1.0.0"}
+    async def claim(self, user_id: str, key: str, fingerprint: str):
+        """(True, None) if this request owns the key, (False, response) to replay, (False, None) to keep waiting"""
+        now = datetime.now(timezone.utc)
+        try:
+            await db.idempotency_keys.insert_one({
+                "user_id": user_id,
+                "key": key,
+                "fingerprint": fingerprint,
+                "status": "in_flight",
+                "locked_at": now,
+                "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+                "created_at": now.isoformat()
+            })
+            return True, None
+        except DuplicateKeyError:
+            pass
+        doc = await db.idempotency_keys.find_one({"user_id": user_id, "key": key}, {"_id": 0})
+        if doc is None:
+            return False, None
+        if doc["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if doc["status"] == "done":
+            return False, doc["response"]
+        taken = await db.idempotency_keys.find_one_and_update(
+            {
+                "user_id": user_id,
+                "key": key,
+                "status": "in_flight",
+                "locked_at": {"$lt": now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}
+            },
+            {"$set": {"locked_at": now}}
+        )
+        return taken is not None, None
+
+    async def wait(self, ident: tuple, deadline: float):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        future = self.inflight.get(ident)
+        if future is None:
+            # Running in another worker (or just finished): poll
+            await asyncio.sleep(min(0.1, remaining))
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(future), remaining)
+        except asyncio.TimeoutError:
+            pass
+
+idempotency = IdempotencyStore()
 
 # ============== PAYMENT ROUTES ==============
 
@@ -570,33 +2975,43 @@ async def get_boost_pricing():
     """Get event boost packages"""
     return {"boosts": EVENT_BOOST_PACKAGES}
 
-@api_router.post("/payments/ticket")
-async def purchase_ticket(request: TicketPurchaseRequest, http_request: Request, user = Depends(get_current_user)):
+@api_router.post("/payments/ticket", dependencies=[rate_limited("checkout")])
+async def purchase_ticket(
+    request: TicketPurchaseRequest,
+    http_request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=200),
+    user = Depends(get_current_user)
+):
     """Purchase tickets for an event"""
-    # Get event
-    event = await db.events.find_one({"id": request.event_id}, {"_id": 0})
-    if not event:
-        raise HTTPException(status_code=404, detail="Event not found")
-    
-    # Parse price (e.g., "$20 USD" -> 20.00)
-    price_str = event.get("price", "$0")
-    try:
-        price = float(price_str.replace("$", "").replace("USD", "").replace(",", "").strip())
-    except:
-        price = 20.00  # Default price
-    
-    total_amount = price * request.quantity
+    return await idempotency.run(
+        user["id"], idempotency_key, "payments.ticket", request, response,
+        lambda: create_ticket_checkout(request, http_request, user)
+    )
+
+async def create_ticket_checkout(request: TicketPurchaseRequest, http_request: Request, user: dict):
+    await waiting_rooms.check_admitted(request.event_id, user["id"], request.queue_token)
+    # Hold the tickets before talking to Stripe so a sold-out event never gets a checkout session
+    event, hold = await reserve_tickets(request.event_id, user["id"], request.quantity)
+
+    price_cents = event.get("price_cents")
+    if not price_cents:
+        if hold:
+            await release_hold(hold["id"], "cancelled")
+        raise HTTPException(status_code=400, detail="This event has no ticket price set")
+    currency = event.get("currency") or DEFAULT_CURRENCY
+    total_amount = price_cents * request.quantity / 100
     
     # Create Stripe checkout
     webhook_url = f"{str(http_request.base_url).rstrip('/')}/api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+    stripe_checkout = stripe_checkout_client(webhook_url)
     
     success_url = f"{request.origin_url}/events/{request.event_id}?payment=success&session_id={{CHECKOUT_SESSION_ID}}"
     cancel_url = f"{request.origin_url}/events/{request.event_id}?payment=cancelled"
     
-    checkout_request = CheckoutSessionRequest(
+    checkout_request = stripe_integration().CheckoutSessionRequest(
         amount=total_amount,
-        currency="usd",
+        currency=currency,
         success_url=success_url,
         cancel_url=cancel_url,
         metadata={
@@ -604,11 +3019,17 @@ async def purchase_ticket(request: TicketPurchaseRequest, http_request: Request,
             "event_id": request.event_id,
             "event_title": event.get("title", ""),
             "user_id": user["id"],
-            "quantity": str(request.quantity)
+            "quantity": str(request.quantity),
+            "hold_id": hold["id"] if hold else ""
         }
     )
     
-    session = await stripe_checkout.create_checkout_session(checkout_request)
+    try:
+        session = await stripe_call("create_checkout_session", stripe_checkout.create_checkout_session(checkout_request))
+    except Exception:
+        if hold:
+            await release_hold(hold["id"], "cancelled")
+        raise
     
     # Save transaction
     transaction_id = str(uuid.uuid4())
@@ -617,24 +3038,57 @@ async def purchase_ticket(request: TicketPurchaseRequest, http_request: Request,
         "user_id": user["id"],
         "session_id": session.session_id,
         "amount": total_amount,
-        "currency": "usd",
+        "currency": currency,
         "payment_type": "ticket",
         "payment_status": "pending",
+        "fulfilled": False,
         "metadata": {
             "event_id": request.event_id,
             "event_title": event.get("title", ""),
-            "quantity": str(request.quantity)
+            "quantity": str(request.quantity),
+            "hold_id": hold["id"] if hold else None
         },
         "created_at": datetime.now(timezone.utc).isoformat(),
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
     await db.payment_transactions.insert_one(transaction)
     
-    return {"checkout_url": session.url, "session_id": session.session_id}
+    return {
+        "checkout_url": session.url,
+        "session_id": session.session_id,
+        "hold_expires_at": hold["expires_at"].isoformat() if hold else None
+    }
 
-@api_router.post("/payments/boost")
-async def purchase_boost(request: BoostPurchaseRequest, http_request: Request, user = Depends(get_current_user)):
+@api_router.post("/payments/ticket/{session_id}/cancel")
+async def cancel_ticket_checkout(session_id: str, user = Depends(get_current_user)):
+    """Give up a pending ticket checkout and put its held tickets back on sale"""
+    transaction = await db.payment_transactions.find_one(
+        {"session_id": session_id, "user_id": user["id"], "payment_type": "ticket"},
+        {"_id": 0}
+    )
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    if transaction["payment_status"] == "paid":
+        raise HTTPException(status_code=409, detail="Payment already completed")
+    hold_id = transaction["metadata"].get("hold_id")
+    released = bool(hold_id) and await release_hold(hold_id, "cancelled")
+    return {"released": released}
+
+@api_router.post("/payments/boost", dependencies=[rate_limited("checkout")])
+async def purchase_boost(
+    request: BoostPurchaseRequest,
+    http_request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=200),
+    user = Depends(get_current_user)
+):
     """Purchase an event boost package"""
+    return await idempotency.run(
+        user["id"], idempotency_key, "payments.boost", request, response,
+        lambda: create_boost_checkout(request, http_request, user)
+    )
+
+async def create_boost_checkout(request: BoostPurchaseRequest, http_request: Request, user: dict):
     # Validate package
     if request.package_id not in EVENT_BOOST_PACKAGES:
         raise HTTPException(status_code=400, detail="Invalid boost package")
@@ -642,7 +3096,7 @@ async def purchase_boost(request: BoostPurchaseRequest, http_request: Request, u
     package = EVENT_BOOST_PACKAGES[request.package_id]
     
     # Get event
-    event = await db.events.find_one({"id": request.event_id}, {"_id": 0})
+    event = await event_loader.load(request.event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     
@@ -652,12 +3106,12 @@ async def purchase_boost(request: BoostPurchaseRequest, http_request: Request, u
     
     # Create Stripe checkout
     webhook_url = f"{str(http_request.base_url).rstrip('/')}/api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+    stripe_checkout = stripe_checkout_client(webhook_url)
     
     success_url = f"{request.origin_url}/events/{request.event_id}?boost=success&session_id={{CHECKOUT_SESSION_ID}}"
     cancel_url = f"{request.origin_url}/events/{request.event_id}"
     
-    checkout_request = CheckoutSessionRequest(
+    checkout_request = stripe_integration().CheckoutSessionRequest(
         amount=package["price"],
         currency="usd",
         success_url=success_url,
@@ -672,7 +3126,7 @@ async def purchase_boost(request: BoostPurchaseRequest, http_request: Request, u
         }
     )
     
-    session = await stripe_checkout.create_checkout_session(checkout_request)
+    session = await stripe_call("create_checkout_session", stripe_checkout.create_checkout_session(checkout_request))
     
     # Save transaction
     transaction_id = str(uuid.uuid4())
@@ -684,6 +3138,7 @@ async def purchase_boost(request: BoostPurchaseRequest, http_request: Request, u
         "currency": "usd",
         "payment_type": "boost",
         "payment_status": "pending",
+        "fulfilled": False,
         "metadata": {
             "package_id": request.package_id,
             "package_name": package["name"],
@@ -696,9 +3151,21 @@ async def purchase_boost(request: BoostPurchaseRequest, http_request: Request, u
     
     return {"checkout_url": session.url, "session_id": session.session_id}
 
-@api_router.post("/payments/subscription")
-async def purchase_subscription(request: SubscriptionPurchaseRequest, http_request: Request, user = Depends(get_current_user)):
+@api_router.post("/payments/subscription", dependencies=[rate_limited("checkout")])
+async def purchase_subscription(
+    request: SubscriptionPurchaseRequest,
+    http_request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=200),
+    user = Depends(get_current_user)
+):
     """Purchase a promoter subscription"""
+    return await idempotency.run(
+        user["id"], idempotency_key, "payments.subscription", request, response,
+        lambda: create_subscription_checkout(request, http_request, user)
+    )
+
+async def create_subscription_checkout(request: SubscriptionPurchaseRequest, http_request: Request, user: dict):
     # Validate plan
     if request.plan_id not in PROMOTER_SUBSCRIPTIONS:
         raise HTTPException(status_code=400, detail="Invalid subscription plan")
@@ -707,12 +3174,12 @@ async def purchase_subscription(request: SubscriptionPurchaseRequest, http_reque
     
     # Create Stripe checkout
     webhook_url = f"{str(http_request.base_url).rstrip('/')}/api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+    stripe_checkout = stripe_checkout_client(webhook_url)
     
     success_url = f"{request.origin_url}/profile?subscription=success&session_id={{CHECKOUT_SESSION_ID}}"
     cancel_url = f"{request.origin_url}/profile"
     
-    checkout_request = CheckoutSessionRequest(
+    checkout_request = stripe_integration().CheckoutSessionRequest(
         amount=plan["price"],
         currency="usd",
         success_url=success_url,
@@ -725,7 +3192,7 @@ async def purchase_subscription(request: SubscriptionPurchaseRequest, http_reque
         }
     )
     
-    session = await stripe_checkout.create_checkout_session(checkout_request)
+    session = await stripe_call("create_checkout_session", stripe_checkout.create_checkout_session(checkout_request))
     
     # Save transaction
     transaction_id = str(uuid.uuid4())
@@ -737,6 +3204,7 @@ async def purchase_subscription(request: SubscriptionPurchaseRequest, http_reque
         "currency": "usd",
         "payment_type": "subscription",
         "payment_status": "pending",
+        "fulfilled": False,
         "metadata": {
             "plan_id": request.plan_id,
             "plan_name": plan["name"]
@@ -762,16 +3230,17 @@ async def get_payment_status(session_id: str, http_request: Request, user = Depe
     
     # Get status from Stripe
     webhook_url = f"{str(http_request.base_url).rstrip('/')}/api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+    stripe_checkout = stripe_checkout_client(webhook_url)
     
-    status = await stripe_checkout.get_checkout_status(session_id)
+    status = await stripe_call("get_checkout_status", stripe_checkout.get_checkout_status(session_id))
     
-    # Update transaction
+    # Only terminal outcomes are stored; anything else stays "pending" for the reconciler to revisit
     new_status = status.payment_status if status.payment_status else "pending"
+    stored_status = "paid" if new_status == "paid" else "expired" if status.status == "expired" else "pending"
     await db.payment_transactions.update_one(
         {"session_id": session_id},
         {"$set": {
-            "payment_status": new_status,
+            "payment_status": stored_status,
             "updated_at": datetime.now(timezone.utc).isoformat()
         }}
     )
@@ -779,6 +3248,8 @@ async def get_payment_status(session_id: str, http_request: Request, user = Depe
     # Process successful payment
     if new_status == "paid" and transaction["payment_status"] != "paid":
         await process_successful_payment(transaction)
+    elif status.status == "expired" and transaction["metadata"].get("hold_id"):
+        await release_hold(transaction["metadata"]["hold_id"], "expired")
     
     return {
         "status": status.status,
@@ -787,21 +3258,56 @@ async def get_payment_status(session_id: str, http_request: Request, user = Depe
         "currency": status.currency
     }
 
+# How long one attempt at fulfilling a payment may run before another worker or the reconciler takes it over
+FULFILMENT_LEASE_SECONDS = int(os.environ.get('FULFILMENT_LEASE_SECONDS', 120))
+
 async def process_successful_payment(transaction: dict):
-    """Process a successful payment based on type"""
+    """Process a successful payment based on type, at most once per transaction.
+
+    The transaction is claimed under a lease and only marked fulfilled once its effects are in place. If an
+    attempt fails or its worker dies, the lease runs out and the reconciler's next pass picks the payment up
+    again. Ticket issue is idempotent on transaction_id, so a retry never issues twice.
+    """
+    now = datetime.now(timezone.utc)
+    lease = (now + timedelta(seconds=FULFILMENT_LEASE_SECONDS)).isoformat()
+    claimed = await db.payment_transactions.update_one(
+        {
+            "id": transaction["id"],
+            "fulfilled_at": {"$exists": False},
+            "$or": [{"fulfilling_until": {"$exists": False}}, {"fulfilling_until": {"$lt": now.isoformat()}}]
+        },
+        {"$set": {"fulfilling_until": lease}}
+    )
+    if not claimed.modified_count:
+        return  # fulfilled already, or the webhook, a status poll or the reconciler is on it
+    try:
+        await fulfil_payment(transaction)
+    except Exception:
+        # Let the next attempt in at once rather than after the lease
+        await db.payment_transactions.update_one(
+            {"id": transaction["id"], "fulfilling_until": lease}, {"$unset": {"fulfilling_until": ""}}
+        )
+        raise
+    await db.payment_transactions.update_one(
+        {"id": transaction["id"], "fulfilling_until": lease},
+        {
+            "$set": {"fulfilled": True, "fulfilled_at": datetime.now(timezone.utc).isoformat()},
+            "$unset": {"fulfilling_until": ""}
+        }
+    )
+
+async def fulfil_payment(transaction: dict):
+    """The effects of one paid transaction; may run again after an attempt that died part way"""
     payment_type = transaction["payment_type"]
     metadata = transaction["metadata"]
     user_id = transaction["user_id"]
     
     if payment_type == "ticket":
-        # Add user to event attendees
         event_id = metadata.get("event_id")
         quantity = int(metadata.get("quantity", 1))
-        await db.events.update_one(
-            {"id": event_id},
-            {"$inc": {"attendee_count": quantity}}
-        )
-        # Create ticket record
+        if metadata.get("hold_id"):
+            await confirm_hold(metadata["hold_id"])  # False on a retry: an earlier attempt confirmed it
+        # Ticket first, so the buyer has it even if a later step fails; a retry finds it and stops here
         ticket = {
             "id": str(uuid.uuid4()),
             "event_id": event_id,
@@ -810,7 +3316,28 @@ async def process_successful_payment(transaction: dict):
             "transaction_id": transaction["id"],
             "created_at": datetime.now(timezone.utc).isoformat()
         }
-        await db.tickets.insert_one(ticket)
+        try:
+            await db.tickets.insert_one(ticket)
+        except DuplicateKeyError:
+            return
+        # Add user to event attendees
+        event = await db.events.find_one_and_update(
+            {"id": event_id},
+            {"$inc": {"attendee_count": quantity}},
+            projection={"_id": 0, "id": 1, "promoter_id": 1}
+        )
+        if event:
+            await analytics.apply(event, {
+                "tickets_sold": quantity,
+                "revenue_cents": int(round(float(transaction["amount"]) * 100))
+            })
+        await create_notification(
+            user_id,
+            "Tickets confirmed",
+            f"Your {quantity} ticket(s) for {metadata.get('event_title', 'your event')} are confirmed.",
+            "event",
+            event_id=event_id
+        )
         
     elif payment_type == "boost":
         # Activate event boost
@@ -823,9 +3350,18 @@ async def process_successful_payment(transaction: dict):
             {"$set": {
                 "is_featured": True,
                 "boost_until": boost_until.isoformat(),
-                "boost_package": metadata.get("package_name")
+                "boost_package": metadata.get("package_name"),
+                "updated_at": datetime.now(timezone.utc).isoformat()
             }}
         )
+        event_index.set_featured(event_id)
+        await create_notification(
+            user_id,
+            "Boost activated",
+            f"{metadata.get('package_name', 'Your boost')} is live for the next {duration_hours} hours.",
+            "event",
+            event_id=event_id
+        )
         
     elif payment_type == "subscription":
         # Upgrade user to promoter
@@ -841,6 +3377,12 @@ async def process_successful_payment(transaction: dict):
                 "subscription_until": subscription_until.isoformat()
             }}
         )
+        await create_notification(
+            user_id,
+            "Subscription active",
+            f"Welcome to {metadata.get('plan_name', 'your new plan')}! Your promoter tools are unlocked.",
+            "system"
+        )
 
 @api_router.post("/webhook/stripe")
 async def stripe_webhook(request: Request):
@@ -850,8 +3392,15 @@ async def stripe_webhook(request: Request):
     
     try:
         webhook_url = f"{str(request.base_url).rstrip('/')}/api/webhook/stripe"
-        stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
-        webhook_response = await stripe_checkout.handle_webhook(body, signature)
+        stripe_checkout = stripe_checkout_client(webhook_url)
+        # Signature checks are local work on unauthenticated input: kept out of the breaker and bulkhead so
+        # forged deliveries can't trip them for checkout
+        try:
+            webhook_response = await asyncio.wait_for(
+                stripe_checkout.handle_webhook(body, signature), STRIPE_TIMEOUTS["handle_webhook"]
+            )
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Webhook verification timed out")
         
         if webhook_response.payment_status == "paid":
             # Find and process transaction
@@ -870,6 +3419,9 @@ async def stripe_webhook(request: Request):
                 await process_successful_payment(transaction)
         
         return {"status": "success"}
+    except HTTPException:
+        # Timed out: a 5xx makes Stripe redeliver the event later
+        raise
     except Exception as e:
         logger.error(f"Webhook error: {e}")
         return {"status": "error", "message": str(e)}
@@ -879,9 +3431,9 @@ async def get_user_tickets(user = Depends(get_current_user)):
     """Get user's purchased tickets"""
     tickets = await db.tickets.find({"user_id": user["id"]}, {"_id": 0}).to_list(100)
     
-    # Enrich with event data
-    for ticket in tickets:
-        event = await db.events.find_one({"id": ticket["event_id"]}, {"_id": 0})
+    # Enrich with event data; concurrent loads go out as one query
+    events = await asyncio.gather(*(event_loader.load(ticket["event_id"]) for ticket in tickets))
+    for ticket, event in zip(tickets, events):
         if event:
             ticket["event"] = event
     
@@ -896,54 +3448,1029 @@ async def get_user_transactions(user = Depends(get_current_user)):
     ).sort("created_at", -1).to_list(50)
     return {"transactions": transactions}
 
+# ============== PAYMENT RECONCILIATION ==============
+
+RECONCILE_INTERVAL_SECONDS = float(os.environ.get('RECONCILE_INTERVAL_SECONDS', 60))
+# Fresh checkouts are left to the buyer's status poll and the webhook
+RECONCILE_MIN_AGE_SECONDS = int(os.environ.get('RECONCILE_MIN_AGE_SECONDS', 300))
+RECONCILE_PAGE_SIZE = int(os.environ.get('RECONCILE_PAGE_SIZE', 200))
+RECONCILE_MAX_PER_PASS = int(os.environ.get('RECONCILE_MAX_PER_PASS', 2000))
+RECONCILE_CONCURRENCY = int(os.environ.get('RECONCILE_CONCURRENCY', 8))
+RECONCILE_RATE_PER_SECOND = float(os.environ.get('RECONCILE_RATE_PER_SECOND', 20))
+# Statuses of transactions not settled yet; older status polls stored Stripe's raw "unpaid"/"open"
+RECONCILE_OPEN_STATUSES = ["pending", "unpaid", "open"]
+# Stripe expires checkout sessions after 24h, so anything Stripe can't settle past this was abandoned
+RECONCILE_ABANDON_HOURS = int(os.environ.get('RECONCILE_ABANDON_HOURS', 48))
+
+PAYMENTS_RECONCILED = Counter(
+    "pulse_payment_reconciled_total", "Stale pending transactions checked against Stripe, by result",
+    ["result"], registry=metrics_registry
+)
+
+class PaymentReconciler:
+    """Settles `pending` transactions nobody is polling for and whose webhook never arrived.
+
+    Each pass walks stale pending rows in (created_at, id) order through the payment_status index, asks Stripe
+    for each session's status under a concurrency cap and a request rate, then applies every status change of a
+    page with one unordered bulk_write. Newly paid rows are fulfilled through process_successful_payment, which
+    is idempotent, so racing the webhook or a poll is harmless. The cursor survives between passes, so open
+    sessions at the head of the backlog can't starve the rows behind them. Each pass first retries paid
+    transactions whose fulfilment didn't finish.
+    """
+
+    def __init__(self):
+        self.cursor = None  # (created_at, id) of the last row looked at
+        self.next_start = 0.0
+        self.backlog = 0
+        self.oldest_pending = None
+
+    def stale_query(self, cutoff: str) -> dict:
+        query = {"payment_status": {"$in": RECONCILE_OPEN_STATUSES}, "created_at": {"$lt": cutoff}}
+        if self.cursor:
+            created_at, transaction_id = self.cursor
+            query["$or"] = [
+                {"created_at": {"$gt": created_at}},
+                {"created_at": created_at, "id": {"$gt": transaction_id}}
+            ]
+        return query
+
+    async def paced(self):
+        """Space lookup starts at RECONCILE_RATE_PER_SECOND"""
+        now = time.monotonic()
+        wait = self.next_start - now
+        self.next_start = max(now, self.next_start) + 1 / RECONCILE_RATE_PER_SECOND
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def lookup(self, stripe_checkout, transaction: dict, slots: asyncio.Semaphore):
+        """Stripe's view of one session: "paid", "expired", "pending", "error", or "deferred" if Stripe is shedding"""
+        async with slots:
+            await self.paced()
+            try:
+                status = await stripe_call("get_checkout_status", stripe_checkout.get_checkout_status(transaction["session_id"]))
+            except HTTPException as e:
+                return "deferred" if e.status_code == 503 else "error"
+            except Exception as e:
+                logger.warning(f"Reconcile lookup failed for {transaction['session_id']}: {e}")
+                status = None
+        abandoned = transaction["created_at"] < (
+            datetime.now(timezone.utc) - timedelta(hours=RECONCILE_ABANDON_HOURS)
+        ).isoformat()
+        if status is None:
+            return "expired" if abandoned else "error"
+        if status.payment_status == "paid":
+            return "paid"
+        if status.status == "expired" or abandoned:
+            return "expired"
+        return "pending"
+
+    async def reconcile_page(self, stripe_checkout, page: List[dict]) -> dict:
+        slots = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+        results = await asyncio.gather(*(self.lookup(stripe_checkout, t, slots) for t in page))
+        now = datetime.now(timezone.utc).isoformat()
+        ops = []
+        counts = {}
+        for transaction, result in zip(page, results):
+            counts[result] = counts.get(result, 0) + 1
+            if result in ("paid", "expired"):
+                ops.append(UpdateOne(
+                    {"id": transaction["id"], "payment_status": {"$in": RECONCILE_OPEN_STATUSES}},
+                    {"$set": {"payment_status": result, "updated_at": now, "reconciled_at": now}}
+                ))
+        if ops:
+            await db.payment_transactions.bulk_write(ops, ordered=False)
+        for transaction, result in zip(page, results):
+            try:
+                if result == "paid":
+                    await process_successful_payment(transaction)
+                elif result == "expired" and transaction["metadata"].get("hold_id"):
+                    await release_hold(transaction["metadata"]["hold_id"], "expired")
+            except Exception as e:
+                logger.error(f"Reconcile fulfilment failed for {transaction['id']}: {e}")
+        for result, count in counts.items():
+            PAYMENTS_RECONCILED.labels(result).inc(count)
+        return counts
+
+    async def fulfil_unfinished(self) -> int:
+        """Retry paid transactions whose fulfilment failed or whose worker died mid-way; returns how many"""
+        now = datetime.now(timezone.utc).isoformat()
+        unfinished = await db.payment_transactions.find(
+            {
+                "payment_status": "paid",
+                "fulfilled": False,
+                "$or": [{"fulfilling_until": {"$exists": False}}, {"fulfilling_until": {"$lt": now}}]
+            },
+            {"_id": 0, "id": 1, "payment_type": 1, "user_id": 1, "amount": 1, "metadata": 1}
+        ).sort("updated_at", 1).limit(RECONCILE_PAGE_SIZE).to_list(RECONCILE_PAGE_SIZE)
+        for transaction in unfinished:
+            try:
+                await process_successful_payment(transaction)
+            except Exception as e:
+                logger.error(f"Fulfilment retry failed for {transaction['id']}: {e}")
+        return len(unfinished)
+
+    async def reconcile(self) -> dict:
+        """One pass of at most RECONCILE_MAX_PER_PASS transactions; returns counts by result"""
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=RECONCILE_MIN_AGE_SECONDS)).isoformat()
+        stale = {"payment_status": {"$in": RECONCILE_OPEN_STATUSES}, "created_at": {"$lt": cutoff}}
+        self.backlog = await db.payment_transactions.count_documents(stale)
+        oldest = await db.payment_transactions.find_one(stale, {"_id": 0, "created_at": 1}, sort=[("created_at", 1)])
+        self.oldest_pending = datetime.fromisoformat(oldest["created_at"]) if oldest else None
+
+        # Status lookups never touch the webhook URL
+        stripe_checkout = stripe_checkout_client("")
+        totals = {}
+        retried = await self.fulfil_unfinished()
+        if retried:
+            totals["fulfilment_retried"] = retried
+        seen = 0
+        while seen < RECONCILE_MAX_PER_PASS:
+            page = await db.payment_transactions.find(
+                self.stale_query(cutoff),
+                {"_id": 0, "id": 1, "session_id": 1, "payment_type": 1, "user_id": 1, "amount": 1,
+                 "metadata": 1, "created_at": 1}
+            ).sort([("created_at", 1), ("id", 1)]).limit(RECONCILE_PAGE_SIZE).to_list(RECONCILE_PAGE_SIZE)
+            if not page:
+                self.cursor = None  # reached the end; next pass starts from the oldest again
+                break
+            counts = await self.reconcile_page(stripe_checkout, page)
+            for result, count in counts.items():
+                totals[result] = totals.get(result, 0) + count
+            if counts.get("deferred"):
+                break  # Stripe is unhealthy; retry this page next pass
+            self.cursor = (page[-1]["created_at"], page[-1]["id"])
+            seen += len(page)
+        return totals
+
+class ReconcilerCollector:
+    """Backlog size as of the last pass and the age of its oldest row, aged at scrape time"""
+    def collect(self):
+        backlog = GaugeMetricFamily("pulse_payment_reconcile_backlog", "Stale pending transactions at the last pass")
+        backlog.add_metric([], payment_reconciler.backlog)
+        yield backlog
+        age = GaugeMetricFamily(
+            "pulse_payment_reconcile_backlog_age_seconds", "Age of the oldest stale pending transaction"
+        )
+        oldest = payment_reconciler.oldest_pending
+        age.add_metric([], (datetime.now(timezone.utc) - oldest).total_seconds() if oldest else 0)
+        yield age
+
+payment_reconciler = PaymentReconciler()
+metrics_registry.register(ReconcilerCollector())
+
+async def run_payment_reconciler():
+    while True:
+        await asyncio.sleep(RECONCILE_INTERVAL_SECONDS)
+        try:
+            totals = await payment_reconciler.reconcile()
+            if totals:
+                logger.info(f"Payment reconciliation: {totals}")
+        except Exception as e:
+            logger.error(f"Payment reconciliation error: {e}")
+
+# ============== ANALYTICS ROLLUPS ==============
+
+ANALYTICS_FLUSH_SECONDS = float(os.environ.get('ANALYTICS_FLUSH_SECONDS', 10))
+ANALYTICS_METRICS = ("attends", "tickets_sold", "revenue_cents", "boost_impressions", "feed_mentions")
+ANALYTICS_BUCKET_FORMATS = {"hour": "%Y-%m-%dT%H", "day": "%Y-%m-%d"}
+# Widest range one request can ask for, which caps the buckets returned
+ANALYTICS_MAX_RANGE = {"hour": timedelta(days=31), "day": timedelta(days=366)}
+ANALYTICS_DEFAULT_RANGE = {"hour": timedelta(hours=48), "day": timedelta(days=30)}
+
+def rollup_keys(event: dict, at: datetime):
+    """Every (scope, scope_id, granularity, bucket) a happening on `event` at `at` counts towards"""
+    for scope, scope_id in (("event", event["id"]), ("promoter", event.get("promoter_id"))):
+        if not scope_id:
+            continue
+        for granularity, bucket_format in ANALYTICS_BUCKET_FORMATS.items():
+            yield scope, scope_id, granularity, at.strftime(bucket_format)
+
+def rollup_update(key, deltas: dict) -> UpdateOne:
+    scope, scope_id, granularity, bucket = key
+    return UpdateOne(
+        {"scope": scope, "scope_id": scope_id, "granularity": granularity, "bucket": bucket},
+        {"$inc": deltas},
+        upsert=True
+    )
+
+class AnalyticsRollups:
+    """Hourly and daily counters per event and per promoter in `analytics_rollups`.
+
+    High-volume counts (impressions, attends, mentions) collect in memory and are flushed as one bulk_write;
+    ticket sales write through so revenue never waits on a flush.
+    """
+
+    def __init__(self):
+        self.pending = defaultdict(lambda: defaultdict(int))
+
+    def add(self, event: dict, metric: str, amount: int = 1):
+        for key in rollup_keys(event, datetime.now(timezone.utc)):
+            self.pending[key][metric] += amount
+
+    def add_impressions(self, events: List[dict]):
+        now = datetime.now(timezone.utc).isoformat()
+        for event in events:
+            if event.get("boost_until", "") > now:
+                self.add(event, "boost_impressions")
+
+    async def apply(self, event: dict, deltas: dict):
+        updates = [rollup_update(key, deltas) for key in rollup_keys(event, datetime.now(timezone.utc))]
+        await db.analytics_rollups.bulk_write(updates, ordered=False)
+
+    async def flush(self) -> int:
+        if not self.pending:
+            return 0
+        pending, self.pending = self.pending, defaultdict(lambda: defaultdict(int))
+        try:
+            await db.analytics_rollups.bulk_write(
+                [rollup_update(key, dict(deltas)) for key, deltas in pending.items()],
+                ordered=False
+            )
+        except Exception:
+            # Put the counts back so the next flush retries them ($inc is only applied by successful writes)
+            for key, deltas in pending.items():
+                for metric, amount in deltas.items():
+                    self.pending[key][metric] += amount
+            raise
+        return len(pending)
+
+    async def series(self, scope: str, scope_id: str, granularity: str, start: datetime, end: datetime) -> dict:
+        bucket_format = ANALYTICS_BUCKET_FORMATS[granularity]
+        docs = await db.analytics_rollups.find(
+            {
+                "scope": scope,
+                "scope_id": scope_id,
+                "granularity": granularity,
+                "bucket": {"$gte": start.strftime(bucket_format), "$lte": end.strftime(bucket_format)}
+            },
+            {"_id": 0, "scope": 0, "scope_id": 0, "granularity": 0}
+        ).sort("bucket", 1).to_list(None)
+        buckets = [{"bucket": doc["bucket"], **{metric: doc.get(metric, 0) for metric in ANALYTICS_METRICS}} for doc in docs]
+        return {
+            "scope": scope,
+            "scope_id": scope_id,
+            "granularity": granularity,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "buckets": buckets,
+            "totals": {metric: sum(bucket[metric] for bucket in buckets) for metric in ANALYTICS_METRICS}
+        }
+
+analytics = AnalyticsRollups()
+
+async def run_analytics_flusher():
+    while True:
+        await asyncio.sleep(ANALYTICS_FLUSH_SECONDS)
+        try:
+            await analytics.flush()
+        except Exception as e:
+            logger.error(f"Analytics flush error: {e}")
+
+def analytics_granularities(user: dict) -> List[str]:
+    """Granularities the user's plan includes: Pro gets daily rollups, Premium adds hourly"""
+    if is_admin(user):
+        return list(ANALYTICS_BUCKET_FORMATS)
+    plan = PROMOTER_SUBSCRIPTIONS.get(user.get("subscription_plan") or "")
+    if plan is None or user.get("subscription_until", "") < datetime.now(timezone.utc).isoformat():
+        return []
+    return plan["analytics"]
+
+def analytics_range(granularity: str, start: Optional[str], end: Optional[str]):
+    try:
+        end_at = datetime.fromisoformat(end) if end else datetime.now(timezone.utc)
+        start_at = datetime.fromisoformat(start) if start else end_at - ANALYTICS_DEFAULT_RANGE[granularity]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be ISO dates or datetimes")
+    if end_at.tzinfo is None:
+        end_at = end_at.replace(tzinfo=timezone.utc)
+    if start_at.tzinfo is None:
+        start_at = start_at.replace(tzinfo=timezone.utc)
+    if start_at > end_at:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if end_at - start_at > ANALYTICS_MAX_RANGE[granularity]:
+        raise HTTPException(status_code=400, detail=f"{granularity} rollups cover at most {ANALYTICS_MAX_RANGE[granularity].days} days per request")
+    return start_at, end_at
+
+def check_granularity(user: dict, granularity: str):
+    allowed = analytics_granularities(user)
+    if not allowed:
+        raise HTTPException(status_code=403, detail="Analytics are included in the Pro and Premium plans")
+    if granularity not in allowed:
+        raise HTTPException(status_code=403, detail=f"{granularity.capitalize()}ly analytics require the Premium plan")
+
+@api_router.get("/analytics/events/{event_id}")
+async def get_event_analytics(
+    event_id: str,
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    user = Depends(get_current_user)
+):
+    """Rollups for one of the caller's events; reads one document per bucket"""
+    check_granularity(user, granularity)
+    event = await event_loader.load(event_id)
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found")
+    if event.get("promoter_id") != user["id"] and not is_admin(user):
+        raise HTTPException(status_code=403, detail="Not your event")
+    start_at, end_at = analytics_range(granularity, start, end)
+    return await analytics.series("event", event_id, granularity, start_at, end_at)
+
+@api_router.get("/analytics/promoter")
+async def get_promoter_analytics(
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    promoter_id: Optional[str] = None,
+    user = Depends(get_current_user)
+):
+    """Rollups across all of the caller's events (admins may pass promoter_id)"""
+    check_granularity(user, granularity)
+    if promoter_id and promoter_id != user["id"] and not is_admin(user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    start_at, end_at = analytics_range(granularity, start, end)
+    return await analytics.series("promoter", promoter_id or user["id"], granularity, start_at, end_at)
+
+# ============== EXPORTS ==============
+
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+# Rows are encoded into chunks of roughly this size before being handed to the transport
+EXPORT_CHUNK_BYTES = int(os.environ.get('EXPORT_CHUNK_BYTES', 64 * 1024))
+
+EXPORT_COLLECTIONS = {
+    "transactions": "payment_transactions",
+    "tickets": "tickets",
+    "events": "events"
+}
+
+# CSV columns; dotted names reach into sub-documents, lists are joined with "|" (the import format)
+EXPORT_COLUMNS = {
+    "transactions": [
+        "id", "created_at", "updated_at", "user_id", "session_id", "payment_type", "payment_status", "amount",
+        "currency", "metadata.event_id", "metadata.event_title", "metadata.quantity", "metadata.package_id",
+        "metadata.plan_id"
+    ],
+    "tickets": [
+        "id", "created_at", "event_id", "event_title", "event_date", "event_city", "user_id", "quantity",
+        "transaction_id"
+    ],
+    "events": [
+        "id", "created_at", "title", "city", "venue_name", "venue_address", "date", "time", "genre", "vibe",
+        "price", "price_cents", "currency", "promoter_id", "promoter_name", "is_featured", "attendee_count"
+    ]
+}
+
+def column_value(doc: dict, column: str):
+    value = doc
+    for part in column.split("."):
+        if not isinstance(value, dict):
+            return ""
+        value = value.get(part)
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "|".join(str(v) for v in value)
+    return value
+
+def created_at_range(start: Optional[str], end: Optional[str]) -> dict:
+    """created_at bounds from ISO dates/datetimes; a bare end date includes that whole day"""
+    bounds = {}
+    try:
+        if start:
+            parsed = datetime.fromisoformat(start)
+            bounds["$gte"] = parsed.isoformat() if "T" in start else parsed.strftime("%Y-%m-%d")
+        if end:
+            if "T" in end:
+                bounds["$lte"] = datetime.fromisoformat(end).isoformat()
+            else:
+                bounds["$lt"] = (datetime.fromisoformat(end) + timedelta(days=1)).strftime("%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be ISO dates (YYYY-MM-DD) or datetimes")
+    return {"created_at": bounds} if bounds else {}
+
+async def export_scope(dataset: str, user: dict) -> dict:
+    """Admins export everything; promoters export rows tied to their own events"""
+    if is_admin(user):
+        return {}
+    if not user.get("is_promoter"):
+        raise HTTPException(status_code=403, detail="Exports are available to promoters and admins")
+    if dataset == "events":
+        return {"promoter_id": user["id"]}
+    event_ids = await db.events.distinct("id", {"promoter_id": user["id"]})
+    if dataset == "tickets":
+        return {"event_id": {"$in": event_ids}}
+    return {"metadata.event_id": {"$in": event_ids}}
+
+async def export_batches(dataset: str, query: dict):
+    """Cursor in created_at order, regrouped into lists of at most EXPORT_BATCH_SIZE documents"""
+    cursor = db[EXPORT_COLLECTIONS[dataset]].find(query, {"_id": 0, "expires_at": 0}).sort("created_at", 1)
+    cursor.batch_size(EXPORT_BATCH_SIZE)
+    batch = []
+    try:
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        await cursor.close()
+
+async def with_ticket_events(batches):
+    """Add event title/date/city to each ticket with one events query per batch"""
+    async for batch in batches:
+        event_ids = list({ticket["event_id"] for ticket in batch})
+        events = {
+            event["id"]: event
+            async for event in db.events.find({"id": {"$in": event_ids}}, {"_id": 0, "id": 1, "title": 1, "date": 1, "city": 1})
+        }
+        for ticket in batch:
+            event = events.get(ticket["event_id"], {})
+            ticket["event_title"] = event.get("title")
+            ticket["event_date"] = event.get("date")
+            ticket["event_city"] = event.get("city")
+        yield batch
+
+async def encode_ndjson(batches):
+    chunk = []
+    size = 0
+    async for batch in batches:
+        for doc in batch:
+            line = json.dumps(doc, default=str) + "\n"
+            chunk.append(line)
+            size += len(line)
+            if size >= EXPORT_CHUNK_BYTES:
+                yield "".join(chunk).encode()
+                chunk, size = [], 0
+    if chunk:
+        yield "".join(chunk).encode()
+
+async def encode_csv(batches, columns: List[str]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for batch in batches:
+        for doc in batch:
+            writer.writerow([column_value(doc, column) for column in columns])
+            if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+@api_router.get("/exports/{dataset}")
+async def export_dataset(
+    dataset: str,
+    format: str = Query("ndjson", pattern="^(csv|ndjson)$"),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    user = Depends(get_current_user)
+):
+    """Stream every matching transaction, ticket or event as NDJSON or CSV, oldest first.
+
+    Filters on created_at (served by the created_at indexes); memory use does not depend on the export size.
+    """
+    if dataset not in EXPORT_COLLECTIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown export; choose one of {', '.join(EXPORT_COLLECTIONS)}")
+    query = {**await export_scope(dataset, user), **created_at_range(start, end)}
+    batches = export_batches(dataset, query)
+    if dataset == "tickets":
+        batches = with_ticket_events(batches)
+    if format == "csv":
+        body, media_type = encode_csv(batches, EXPORT_COLUMNS[dataset]), "text/csv"
+    else:
+        body, media_type = encode_ndjson(batches), "application/x-ndjson"
+    filename = f"pulse-{dataset}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}.{format}"
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 # ============== WEBSOCKET FOR REAL-TIME CHAT ==============
 
+# Negotiated via Sec-WebSocket-Protocol; clients that offer nothing get plain JSON frames.
+# Compression (permessage-deflate) is negotiated by uvicorn's websockets implementation, on by default.
+#
+# msgpack frames are arrays tagged by their first element:
+#   [1, ref, id(16-byte uuid), content, created_at(epoch ms)]                          chat message
+#   [1, ref, id, content, created_at, user_id, username, user_avatar]                  ... first use of `ref`
+#   [3, [chat message frames...]]                                                       history backlog
+#   [2, {...}]                                                                          any other JSON payload
+# `ref` interns the sender's user fields per connection; a nil ref means "don't cache".
+WS_PROTOCOL_JSON = "pulse.json.v1"
+WS_PROTOCOL_MSGPACK = "pulse.msgpack.v1"
+WS_MAX_INTERNED_USERS = int(os.environ.get('WS_MAX_INTERNED_USERS', 4096))
+# Clients ping every ~20s; sockets silent for longer than the timeout are pruned
+PRESENCE_TIMEOUT_SECONDS = float(os.environ.get('PRESENCE_TIMEOUT_SECONDS', 60))
+PRESENCE_BROADCAST_INTERVAL_SECONDS = float(os.environ.get('PRESENCE_BROADCAST_INTERVAL_SECONDS', 2))
+
+def _created_at_ms(created_at: str) -> int:
+    return int(datetime.fromisoformat(created_at).timestamp() * 1000)
+
+def _packed_id(message_id: str):
+    try:
+        return uuid.UUID(message_id).bytes
+    except (ValueError, AttributeError, TypeError):
+        return message_id
+
+class EncodedChatMessage:
+    """A chat message serialized once per broadcast and shared by every connection"""
+    __slots__ = ("message", "_json", "_body", "_user")
+    
+    def __init__(self, message: dict):
+        self.message = message
+        self._json = None
+        self._body = None
+        self._user = None
+    
+    @property
+    def json(self) -> str:
+        if self._json is None:
+            self._json = json.dumps(self.message)
+        return self._json
+    
+    def msgpack_parts(self):
+        if self._body is None:
+            m = self.message
+            self._body = (
+                msgpack.packb(_packed_id(m["id"]))
+                + msgpack.packb(m.get("content", ""))
+                + msgpack.packb(_created_at_ms(m["created_at"]))
+            )
+            self._user = (
+                msgpack.packb(m.get("user_id"))
+                + msgpack.packb(m.get("username"))
+                + msgpack.packb(m.get("user_avatar"))
+            )
+        return self._body, self._user
+
+class ChatSession:
+    """Sender profile resolved once at handshake; chat messages are stamped from here, never from the payload"""
+    __slots__ = ("user_id", "username", "user_avatar")
+    
+    def __init__(self, user_id: str, username: str, user_avatar: Optional[str] = None):
+        self.user_id = user_id
+        self.username = username
+        self.user_avatar = user_avatar
+
+class ChatConnection:
+    __slots__ = ("websocket", "city", "binary", "user_refs", "presence_key", "session")
+    
+    def __init__(self, websocket: WebSocket, city: str, binary: bool, session: Optional[ChatSession] = None):
+        self.websocket = websocket
+        self.city = city
+        self.binary = binary
+        self.user_refs: dict[bytes, int] = {}
+        self.session = session
+        self.presence_key = session.user_id if session else f"anon:{id(self)}"
+    
+    def pack_message(self, encoded: EncodedChatMessage) -> bytes:
+        body, user = encoded.msgpack_parts()
+        ref = self.user_refs.get(user)
+        if ref is not None:
+            return b"\x95\x01" + msgpack.packb(ref) + body
+        if len(self.user_refs) < WS_MAX_INTERNED_USERS:
+            ref = self.user_refs[user] = len(self.user_refs)
+        return b"\x98\x01" + msgpack.packb(ref) + body + user
+    
+    async def send_message(self, encoded: EncodedChatMessage):
+        if self.binary:
+            await self.websocket.send_bytes(self.pack_message(encoded))
+        else:
+            await self.websocket.send_text(encoded.json)
+    
+    async def send_history(self, messages: List[dict]):
+        if not self.binary:
+            await self.websocket.send_json({"type": "history", "messages": messages})
+            return
+        packer = msgpack.Packer()
+        frames = [self.pack_message(EncodedChatMessage(m)) for m in messages]
+        await self.websocket.send_bytes(b"\x92\x03" + packer.pack_array_header(len(frames)) + b"".join(frames))
+    
+    async def send_payload(self, payload: dict):
+        if self.binary:
+            await self.websocket.send_bytes(msgpack.packb([2, payload]))
+        else:
+            await self.websocket.send_json(payload)
+    
+    async def receive(self) -> Optional[dict]:
+        """The next frame, or None when it isn't a map in this socket's encoding"""
+        try:
+            if self.binary:
+                data = msgpack.unpackb(await self.websocket.receive_bytes())
+            else:
+                data = await self.websocket.receive_json()
+        except (ValueError, TypeError, KeyError, msgpack.UnpackException):
+            # Bad JSON or msgpack, or a text frame where bytes were negotiated (and vice versa)
+            return None
+        return data if isinstance(data, dict) else None
+
 class ConnectionManager:
+    """Chat sockets per city plus heartbeat-based presence.
+
+    Presence counts users, not sockets: `presence[city]` maps a user key to its open tab count, so joins and
+    leaves are O(1). `last_seen` is kept in heartbeat order, so the sweeper only touches expired sockets.
+    Online-count changes are coalesced and broadcast by `flush_presence` at most once per interval.
+    Profile edits made on other workers reach open sessions through `refresh_profiles`.
+    """
     def __init__(self):
-        self.active_connections: dict[str, list[WebSocket]] = {city: [] for city in CITIES}
+        self.active_connections: dict[str, set[ChatConnection]] = {city: set() for city in CITIES}
+        self.presence: dict[str, dict[str, int]] = {city: {} for city in CITIES}
+        self.last_seen: OrderedDict[ChatConnection, float] = OrderedDict()
+        self.dirty_cities: set[str] = set()
+        self.broadcast_counts: dict[str, int] = {}
+        self.user_connections: dict[str, set[ChatConnection]] = {}
+        self.profiles_through = datetime.now(timezone.utc).isoformat()
     
-    async def connect(self, websocket: WebSocket, city: str):
-        await websocket.accept()
+    async def connect(self, websocket: WebSocket, city: str, session: Optional[ChatSession] = None) -> ChatConnection:
+        offered = websocket.scope.get("subprotocols", [])
+        if WS_PROTOCOL_MSGPACK in offered:
+            subprotocol = WS_PROTOCOL_MSGPACK
+        elif WS_PROTOCOL_JSON in offered:
+            subprotocol = WS_PROTOCOL_JSON
+        else:
+            subprotocol = None
+        await websocket.accept(subprotocol=subprotocol)
+        connection = ChatConnection(websocket, city, binary=subprotocol == WS_PROTOCOL_MSGPACK, session=session)
+        if session is not None:
+            self.user_connections.setdefault(session.user_id, set()).add(connection)
         if city not in self.active_connections:
-            self.active_connections[city] = []
-        self.active_connections[city].append(websocket)
+            self.active_connections[city] = set()
+            self.presence[city] = {}
+        self.active_connections[city].add(connection)
+        users = self.presence[city]
+        users[connection.presence_key] = users.get(connection.presence_key, 0) + 1
+        self.last_seen[connection] = time.monotonic()
+        self.dirty_cities.add(city)
+        return connection
     
-    def disconnect(self, websocket: WebSocket, city: str):
-        if city in self.active_connections:
-            self.active_connections[city].remove(websocket)
+    def disconnect(self, connection: ChatConnection):
+        connections = self.active_connections.get(connection.city)
+        if connections is None or connection not in connections:
+            return
+        connections.discard(connection)
+        self.last_seen.pop(connection, None)
+        if connection.session is not None:
+            sessions = self.user_connections.get(connection.session.user_id)
+            if sessions is not None:
+                sessions.discard(connection)
+                if not sessions:
+                    del self.user_connections[connection.session.user_id]
+        users = self.presence[connection.city]
+        remaining = users.get(connection.presence_key, 1) - 1
+        if remaining > 0:
+            users[connection.presence_key] = remaining
+        else:
+            users.pop(connection.presence_key, None)
+        self.dirty_cities.add(connection.city)
+    
+    def refresh_sessions(self, user: dict):
+        """Apply a profile change to every open socket of that user"""
+        for connection in self.user_connections.get(user["id"], ()):
+            connection.session.username = user["username"]
+            connection.session.user_avatar = user.get("avatar_url")
+    
+    async def refresh_profiles(self) -> int:
+        """Re-apply profiles edited since the watermark (with slack for clock skew between writers) to the
+        sessions of connected users; returns how many users were refreshed"""
+        since = (datetime.fromisoformat(self.profiles_through) - timedelta(seconds=10)).isoformat()
+        self.profiles_through = datetime.now(timezone.utc).isoformat()
+        if not self.user_connections:
+            return 0
+        refreshed = 0
+        users = db.users.find({"updated_at": {"$gte": since}}, {"_id": 0, "id": 1, "username": 1, "avatar_url": 1})
+        async for user in users:
+            if user["id"] in self.user_connections:
+                self.refresh_sessions(user)
+                refreshed += 1
+        return refreshed
+    
+    def heartbeat(self, connection: ChatConnection):
+        if connection in self.last_seen:
+            self.last_seen[connection] = time.monotonic()
+            self.last_seen.move_to_end(connection)
+    
+    def online_count(self, city: str) -> int:
+        return len(self.presence.get(city, ()))
+    
+    async def sweep(self):
+        """Drop sockets that stopped heartbeating without sending a close frame"""
+        deadline = time.monotonic() - PRESENCE_TIMEOUT_SECONDS
+        while self.last_seen:
+            connection, seen = next(iter(self.last_seen.items()))
+            if seen > deadline:
+                break
+            self.disconnect(connection)
+            try:
+                await connection.websocket.close(code=1001)
+            except:
+                pass
+    
+    async def flush_presence(self):
+        dirty, self.dirty_cities = self.dirty_cities, set()
+        for city in dirty:
+            online = self.online_count(city)
+            previous = self.broadcast_counts.get(city, 0)
+            if online == previous:
+                continue
+            self.broadcast_counts[city] = online
+            await self.broadcast_payload({"type": "presence", "online": online, "delta": online - previous}, city)
     
     async def broadcast(self, message: dict, city: str):
         if city in self.active_connections:
-            for connection in self.active_connections[city]:
+            start = time.perf_counter()
+            encoded = EncodedChatMessage(message)
+            for connection in list(self.active_connections[city]):
                 try:
-                    await connection.send_json(message)
+                    await connection.send_message(encoded)
                 except:
-                    pass
+                    self.disconnect(connection)
+            WS_BROADCAST_SECONDS.observe(time.perf_counter() - start)
+    
+    async def broadcast_payload(self, payload: dict, city: str):
+        for connection in list(self.active_connections.get(city, ())):
+            try:
+                await connection.send_payload(payload)
+            except:
+                self.disconnect(connection)
 
 manager = ConnectionManager()
 
-@app.websocket("/ws/chat/{city}")
-async def websocket_chat(websocket: WebSocket, city: str):
-    await manager.connect(websocket, city.lower())
+async def run_presence():
+    while True:
+        await asyncio.sleep(PRESENCE_BROADCAST_INTERVAL_SECONDS)
+        try:
+            await manager.sweep()
+            await manager.flush_presence()
+        except Exception as e:
+            logger.error(f"Presence error: {e}")
+
+# How often each worker picks up profile edits made on other workers for its chat sessions
+SESSION_REFRESH_SECONDS = float(os.environ.get('SESSION_REFRESH_SECONDS', 5))
+
+async def run_session_refresher():
+    while True:
+        await asyncio.sleep(SESSION_REFRESH_SECONDS)
+        try:
+            await manager.refresh_profiles()
+        except Exception as e:
+            logger.error(f"Session refresh error: {e}")
+
+# How often each worker pushes unread counts changed on other workers to its own sockets
+UNREAD_COUNT_REFRESH_SECONDS = float(os.environ.get('UNREAD_COUNT_REFRESH_SECONDS', 2))
+
+class NotificationManager:
+    """Notification sockets per user on this worker.
+
+    Counts changed here are pushed at once; counts changed on other workers (the Stripe webhook, the archiver)
+    are found by `refresh` on the counters' updated_at watermark. `last_pushed` keeps a count from being sent
+    twice when both see it.
+    """
+    def __init__(self):
+        self.active_connections: dict[str, list[WebSocket]] = {}
+        self.last_pushed: dict[str, int] = {}
+        self.updated_through = datetime.now(timezone.utc).isoformat()
+    
+    async def connect(self, websocket: WebSocket, user_id: str):
+        await websocket.accept()
+        self.active_connections.setdefault(user_id, []).append(websocket)
+    
+    def disconnect(self, websocket: WebSocket, user_id: str):
+        connections = self.active_connections.get(user_id)
+        if connections and websocket in connections:
+            connections.remove(websocket)
+            if not connections:
+                del self.active_connections[user_id]
+                self.last_pushed.pop(user_id, None)
+    
+    async def push_unread_count(self, user_id: str, count: int):
+        connections = self.active_connections.get(user_id)
+        if not connections or self.last_pushed.get(user_id) == count:
+            return
+        self.last_pushed[user_id] = count
+        for connection in list(connections):
+            try:
+                await connection.send_json({"type": "unread_count", "count": count})
+            except:
+                self.disconnect(connection, user_id)
+    
+    async def refresh(self) -> int:
+        """Push counters updated since the watermark (with slack for clock skew between writers) to connected
+        users; returns how many were pushed"""
+        since = (datetime.fromisoformat(self.updated_through) - timedelta(seconds=10)).isoformat()
+        self.updated_through = datetime.now(timezone.utc).isoformat()
+        if not self.active_connections:
+            return 0
+        pushed = 0
+        async for counter in db.notification_counters.find({"updated_at": {"$gte": since}}, {"_id": 0}):
+            user_id = counter["user_id"]
+            count = max(counter.get("unread", 0), 0)
+            if user_id in self.active_connections and self.last_pushed.get(user_id) != count:
+                await self.push_unread_count(user_id, count)
+                pushed += 1
+        return pushed
+
+notification_manager = NotificationManager()
+
+async def run_unread_count_refresher():
+    while True:
+        await asyncio.sleep(UNREAD_COUNT_REFRESH_SECONDS)
+        try:
+            await notification_manager.refresh()
+        except Exception as e:
+            logger.error(f"Unread count refresh error: {e}")
+
+@root_router.websocket("/ws/notifications")
+async def websocket_notifications(websocket: WebSocket, token: Optional[str] = None):
+    if not await admit_websocket(websocket):
+        return
+    user = await get_websocket_user(token)
+    if user is None:
+        await websocket.close(code=1008)
+        return
+    user_id = user["id"]
+    socket_key = f"socket:{uuid.uuid4().hex}"
+    
+    await notification_manager.connect(websocket, user_id)
+    try:
+        # Send the current value once, then only push on change
+        count = await get_unread_counter(user_id)
+        notification_manager.last_pushed[user_id] = count
+        await websocket.send_json({"type": "unread_count", "count": count})
+        while True:
+            # Any frame is only a keepalive; its content is never read
+            if (await websocket.receive())["type"] == "websocket.disconnect":
+                return
+            if throttle("ws_message", socket_key) is not None:
+                await websocket.close(code=1008)
+                return
+    except WebSocketDisconnect:
+        pass
+    finally:
+        notification_manager.disconnect(websocket, user_id)
+
+@root_router.websocket("/ws/chat/{city}")
+async def websocket_chat(websocket: WebSocket, city: str, token: Optional[str] = None):
+    if not await admit_websocket(websocket):
+        return
+    # Authenticate once at handshake; without a token the socket can only listen
+    session = None
+    if token:
+        user = await get_websocket_user(token)
+        if user is None:
+            await websocket.close(code=1008)
+            return
+        session = ChatSession(user["id"], user["username"], user.get("avatar_url"))
+    # Frames are limited per socket (tabs behind one address don't share), chat messages per user
+    socket_key = f"socket:{uuid.uuid4().hex}"
+    connection = await manager.connect(websocket, city.lower(), session)
     try:
+        # Backfill the room in the same round trip as the handshake
+        backlog = chat_history.recent(city.lower(), chat_history.size)
+        if backlog is None:
+            backlog = list(reversed(await db.chat_messages.find(
+                {"city": city.lower()},
+                {"_id": 0}
+            ).sort("created_at", -1).limit(chat_history.size).to_list(chat_history.size)))
+        await connection.send_history(backlog)
+        await connection.send_payload({"type": "presence", "online": manager.online_count(city.lower()), "delta": 0})
         while True:
-            data = await websocket.receive_json()
+            data = await connection.receive()
+            # Flooding any frame type, pings included, gets the socket closed
+            if throttle("ws_message", socket_key) is not None:
+                await websocket.close(code=1008)
+                return
+            if data is None:
+                await websocket.close(code=1003)
+                return
+            manager.heartbeat(connection)
+            if data.get("type") == "ping":
+                continue
+            if session is None:
+                await connection.send_payload({"type": "error", "detail": "Login required to chat"})
+                continue
+            content = data.get("content", "")
+            if not isinstance(content, str):
+                await connection.send_payload({"type": "error", "detail": "Message content must be text"})
+                continue
+            wait = throttle("chat", f"user:{session.user_id}")
+            if wait is not None:
+                await connection.send_payload({"type": "error", "detail": "Slow down", "retry_after": math.ceil(wait)})
+                continue
             # Save message to DB
             msg_id = str(uuid.uuid4())
             msg_doc = {
                 "id": msg_id,
                 "city": city.lower(),
-                "user_id": data.get("user_id", "anonymous"),
-                "username": data.get("username", "Anonymous"),
-                "user_avatar": data.get("user_avatar"),
-                "content": data.get("content", ""),
+                "user_id": session.user_id,
+                "username": session.username,
+                "user_avatar": session.user_avatar,
+                "content": content,
                 "created_at": datetime.now(timezone.utc).isoformat()
             }
-            await db.chat_messages.insert_one(msg_doc)
+            await db.chat_messages.insert_one({**msg_doc, "expires_at": retention_expiry("chat_messages")})
+            chat_history.append(msg_doc)
             # Broadcast to all connected clients
             await manager.broadcast(msg_doc, city.lower())
     except WebSocketDisconnect:
-        manager.disconnect(websocket, city.lower())
+        pass
+    finally:
+        # Whatever ends the socket, it leaves the room and the presence count now rather than at the next sweep
+        manager.disconnect(connection)
+
+# ============== RETENTION & ARCHIVE ==============
+
+def retention_expiry(collection: str) -> datetime:
+    """TTL timestamp for a new document: retention window plus the archiver's grace period"""
+    return datetime.now(timezone.utc) + timedelta(days=RETENTION_DAYS[collection] + ARCHIVE_GRACE_DAYS)
+
+def archive_path(collection: str, day: str) -> Path:
+    return ARCHIVE_DIR / collection / f"{day}.ndjson.gz"
+
+def write_archive_batch(collection: str, documents: List[dict]):
+    """Append documents to their date partitions; each call adds one gzip member per file"""
+    by_day = defaultdict(list)
+    for doc in documents:
+        by_day[doc["created_at"][:10]].append(json.dumps(doc, default=str))
+    for day, lines in by_day.items():
+        path = archive_path(collection, day)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+async def archive_collection(collection: str) -> int:
+    """Move documents older than the retention window from Mongo to disk, oldest first"""
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=RETENTION_DAYS[collection])).isoformat()
+    archived = 0
+    while True:
+        batch = await db[collection].find(
+            {"created_at": {"$lt": cutoff}},
+            {"expires_at": 0}
+        ).sort("created_at", 1).limit(ARCHIVE_BATCH_SIZE).to_list(ARCHIVE_BATCH_SIZE)
+        if not batch:
+            return archived
+        # Deleted by _id: neither collection indexes `id`, so deleting by it would scan the collection per batch
+        object_ids = [doc.pop("_id") for doc in batch]
+        # Write before delete: a crash in between can only duplicate lines, never lose them
+        await asyncio.to_thread(write_archive_batch, collection, batch)
+        await db[collection].delete_many({"_id": {"$in": object_ids}})
+        if collection == "notifications":
+            unread = defaultdict(int)
+            for doc in batch:
+                if not doc.get("is_read"):
+                    unread[doc["user_id"]] += 1
+            for user_id, count in unread.items():
+                await adjust_unread_count(user_id, -count)
+        archived += len(batch)
+
+async def run_archiver():
+    while True:
+        for collection in RETENTION_DAYS:
+            try:
+                archived = await archive_collection(collection)
+                if archived:
+                    logger.info(f"Archived {archived} {collection} documents")
+            except Exception as e:
+                logger.error(f"Archive error for {collection}: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+def read_archive(collection: str, start_date: str, end_date: str):
+    """Yield archived documents with start_date <= day <= end_date (YYYY-MM-DD), de-duplicated by id"""
+    directory = ARCHIVE_DIR / collection
+    if not directory.exists():
+        return
+    for path in sorted(directory.glob("*.ndjson.gz")):
+        day = path.name[:10]
+        if day < start_date or day > end_date:
+            continue
+        seen = set()
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                doc = json.loads(line)
+                if doc["id"] in seen:
+                    continue
+                seen.add(doc["id"])
+                yield doc
+
+async def restore_archive(collection: str, start_date: str, end_date: str, target: Optional[str] = None) -> int:
+    """Load an archived date range back into Mongo.
+
+    Restores go to `<collection>_restored` by default so the archiver doesn't move them straight back out.
+    """
+    target = target or f"{collection}_restored"
+    restored = 0
+    batch = []
+    for doc in read_archive(collection, start_date, end_date):
+        batch.append(doc)
+        if len(batch) >= ARCHIVE_BATCH_SIZE:
+            await db[target].insert_many(batch, ordered=False)
+            restored += len(batch)
+            batch = []
+    if batch:
+        await db[target].insert_many(batch, ordered=False)
+        restored += len(batch)
+    return restored
 
 # ============== SEED DATA ==============
 
@@ -1063,7 +4590,10 @@ async def seed_data():
         }
     ]
     
+    for event in events:
+        event["price_cents"], event["currency"] = price_components(event["price"], event["city"])
     await db.events.insert_many(events)
+    event_index.add_many(events)
     
     # Seed venues
     venues = [
@@ -1148,17 +4678,167 @@ async def seed_data():
     
     return {"message": "Data seeded successfully", "events": len(events), "venues": len(venues), "posts": len(posts)}
 
-# Include router
-app.include_router(api_router)
+@api_router.get("/admin/slow-queries")
+async def get_slow_queries(limit: int = Query(20, le=200), user = Depends(get_admin_user)):
+    """Worst Mongo query shapes by total time, with their latest sampled explain plan"""
+    return {
+        "threshold_ms": slow_query_log.threshold_micros / 1000,
+        "shapes": slow_query_log.summary(limit)
+    }
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+@api_router.get("/admin/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10, gt=0, le=120),
+    interval_ms: float = Query(5, ge=1, le=100),
+    all_threads: bool = False,
+    user = Depends(get_admin_user)
+):
+    """Sample stacks for `seconds` and return them collapsed, ready for flamegraph.pl or speedscope"""
+    if profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with profile_lock:
+        thread_ids = None if all_threads else {threading.get_ident()}
+        samples = await asyncio.to_thread(sample_stacks, seconds, interval_ms / 1000, thread_ids)
+    ranked = sorted(samples.items(), key=lambda item: item[1], reverse=True)
+    body = "\n".join(f"{stack} {count}" for stack, count in ranked)
+    filename = f"pulse-profile-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}.collapsed"
+    return PlainTextResponse(body + "\n", headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@api_router.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@api_router.get("/health/ready")
+async def readiness(request: Request):
+    """200 once indexes exist and the Mongo pool is warm; load balancers should route on this"""
+    if not request.app.state.ready:
+        raise HTTPException(status_code=503, detail="Starting up")
+    return {"status": "ready"}
+
+@root_router.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(generate_latest(metrics_registry), media_type=CONTENT_TYPE_LATEST)
+
+# ============== APP FACTORY ==============
+
+async def startup(app: FastAPI, context: AppContext):
+    db = context.db
+    await warm_mongo_pool(context)
+    await db.events.create_index("id", unique=True)
+    await db.event_imports.create_index([("promoter_id", 1), ("idempotency_key", 1)], unique=True)
+    # Export range scans: plain created_at for admins, scoped prefixes for promoter exports
+    for collection in EXPORT_COLLECTIONS.values():
+        await db[collection].create_index("created_at")
+    await db.events.create_index([("promoter_id", 1), ("created_at", 1)])
+    await db.events.create_index([("city", 1), ("price_cents", 1)])
+    # Event index refresh: edits of featured flag and price made on other workers
+    await db.events.create_index("updated_at", sparse=True)
+    await db.tickets.create_index([("event_id", 1), ("created_at", 1)])
+    await db.tickets.create_index(
+        "transaction_id",
+        unique=True,
+        partialFilterExpression={"transaction_id": {"$type": "string"}}
+    )
+    await db.payment_transactions.create_index([("metadata.event_id", 1), ("created_at", 1)])
+    await db.payment_transactions.create_index([("payment_status", 1), ("created_at", 1), ("id", 1)])
+    # Only paid, unfulfilled transactions are indexed, so the reconciler's retry query reads just those
+    await db.payment_transactions.create_index(
+        "updated_at",
+        name="unfulfilled_payments",
+        partialFilterExpression={"payment_status": "paid", "fulfilled": False}
+    )
+    await db.analytics_rollups.create_index(
+        [("scope", 1), ("scope_id", 1), ("granularity", 1), ("bucket", 1)],
+        unique=True
+    )
+    await db.ticket_holds.create_index("id", unique=True)
+    # Only live holds are indexed, so the release sweep reads exactly the holds that are due
+    await db.ticket_holds.create_index(
+        "expires_at",
+        name="live_hold_expiry",
+        partialFilterExpression={"status": "held"}
+    )
+    await db.ticket_holds.create_index("released_at", expireAfterSeconds=HOLD_RETENTION_SECONDS)
+    await db.waiting_rooms.create_index("event_id", unique=True)
+    await db.waiting_room_members.create_index([("event_id", 1), ("user_id", 1)], unique=True)
+    await db.waiting_room_members.create_index("expires_at", expireAfterSeconds=0)
+    await db.idempotency_keys.create_index([("user_id", 1), ("key", 1)], unique=True)
+    await db.idempotency_keys.create_index("expires_at", expireAfterSeconds=0)
+    await db.notifications.create_index([("user_id", 1), ("created_at", -1)])
+    await db.notification_counters.create_index("user_id", unique=True)
+    await db.notification_counters.create_index("updated_at", sparse=True)
+    await db.users.create_index("updated_at", sparse=True)
+    await db.chat_messages.create_index([("city", 1), ("created_at", -1)])
+    for collection in RETENTION_DAYS:
+        await db[collection].create_index("created_at")
+    await db.chat_messages.create_index("expires_at", expireAfterSeconds=0)
+    # Unread notifications are only removed by the archiver so the unread counters stay exact
+    await db.notifications.create_index(
+        "expires_at",
+        expireAfterSeconds=0,
+        partialFilterExpression={"is_read": True}
+    )
+    slow_query_log.start(asyncio.get_running_loop())
+    await chat_history.warm()
+    # Loads in the background; get_events queries Mongo until it's ready
+    app.state.background_tasks.append(asyncio.create_task(load_event_index()))
+    if context.settings.run_background_tasks:
+        app.state.background_tasks.append(asyncio.create_task(run_archiver()))
+        app.state.background_tasks.append(asyncio.create_task(run_presence()))
+        app.state.background_tasks.append(asyncio.create_task(loop_monitor.heartbeat()))
+        app.state.background_tasks.append(asyncio.create_task(run_analytics_flusher()))
+        app.state.background_tasks.append(asyncio.create_task(run_hold_releaser()))
+        app.state.background_tasks.append(asyncio.create_task(run_payment_reconciler()))
+        app.state.background_tasks.append(asyncio.create_task(run_event_index_refresher()))
+        app.state.background_tasks.append(asyncio.create_task(run_chat_history_refresher()))
+        app.state.background_tasks.append(asyncio.create_task(run_unread_count_refresher()))
+        app.state.background_tasks.append(asyncio.create_task(run_session_refresher()))
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """Build the API. Nothing connects at construction; settings default to the environment, read at startup.
+
+    Apps built here keep their own database and settings, but share the process-wide state listed on
+    AppContext.
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        context = open_app_context(settings or Settings.from_env())
+        app.state.context = context
+        # Tasks started here inherit the context, so background work always hits this app's database
+        token = current_app_context.set(context)
+        try:
+            await startup(app, context)
+            app.state.ready = True
+            yield
+        finally:
+            app.state.ready = False
+            for task in app.state.background_tasks:
+                task.cancel()
+            app.state.background_tasks.clear()
+            event_index.discard(context)
+            try:
+                await analytics.flush()
+            except Exception as e:
+                logger.error(f"Shutdown flush error: {e}")
+            current_app_context.reset(token)
+            close_app_context(context)
+
+    app = FastAPI(title="Pulse of the City API", lifespan=lifespan)
+    app.state.ready = False
+    app.state.background_tasks = []
+    app.include_router(api_router)
+    app.include_router(root_router)
+    app.add_middleware(AdmissionMiddleware)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(AppContextMiddleware)
+    app.add_middleware(MetricsMiddleware)
+    return app
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+app = create_app()
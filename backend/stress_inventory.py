@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Concurrency stress test for ticket inventory: thousands of buyers racing for one event.
+
+Runs the app in-process against a scratch Mongo database and the Stripe stand-in. Every buyer fires at once;
+winners then pay, cancel or walk away (their holds expire), and a second wave competes for the stock that
+came back. Afterwards the inventory is audited and the script exits 1 if any invariant broke:
+
+    sold + held + available == capacity, available >= 0, tickets issued == tickets sold
+
+    cd backend && python stress_inventory.py --buyers 3000 --capacity 500
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+
+
+async def buy(client, token, event_id, quantity):
+    start = time.perf_counter()
+    response = await client.post(
+        "/api/payments/ticket",
+        json={"event_id": event_id, "quantity": quantity, "origin_url": "http://stress.test"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    return response, time.perf_counter() - start
+
+
+async def finish(client, token, session_id, outcome):
+    headers = {"Authorization": f"Bearer {token}"}
+    if outcome == "pay":
+        await client.get(f"/api/payments/status/{session_id}", headers=headers)
+    elif outcome == "cancel":
+        await client.post(f"/api/payments/ticket/{session_id}/cancel", headers=headers)
+
+
+async def wave(client, tokens, event_id, max_quantity, mix, rng):
+    """All buyers at once, then each winner pays, cancels or abandons per `mix`"""
+    quantities = [rng.randint(1, max_quantity) for _ in tokens]
+    results = await asyncio.gather(*(buy(client, t, event_id, q) for t, q in zip(tokens, quantities)))
+    codes = {}
+    latencies = []
+    followups = []
+    for token, (response, latency) in zip(tokens, results):
+        codes[response.status_code] = codes.get(response.status_code, 0) + 1
+        latencies.append(latency)
+        if response.status_code == 200:
+            outcome = rng.choices(list(mix), weights=list(mix.values()))[0]
+            followups.append(finish(client, token, response.json()["session_id"], outcome))
+    await asyncio.gather(*followups)
+    latencies.sort()
+    return {
+        "buyers": len(tokens),
+        "status_codes": codes,
+        "reserve_p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "reserve_p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1)
+    }
+
+
+async def audit(db, event_id, capacity):
+    event = await db.events.find_one({"id": event_id})
+    holds = await db.ticket_holds.find({"event_id": event_id}).to_list(None)
+    tickets = await db.tickets.find({"event_id": event_id}).to_list(None)
+    sold = sum(h["quantity"] for h in holds if h["status"] == "confirmed")
+    held = sum(h["quantity"] for h in holds if h["status"] == "held")
+    issued = sum(t["quantity"] for t in tickets)
+    available = event["tickets_available"]
+    checks = {
+        "stock_conserved": sold + held + available == capacity,
+        "never_negative": available >= 0,
+        "tickets_match_sales": issued == sold,
+        "no_oversold_holds": not any(h.get("oversold") for h in holds)
+    }
+    by_status = {}
+    for h in holds:
+        by_status[h["status"]] = by_status.get(h["status"], 0) + h["quantity"]
+    stock = {"capacity": capacity, "sold": sold, "held": held, "available": available, "issued": issued,
+             "hold_quantities_by_status": by_status}
+    return stock, checks
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Ticket inventory concurrency stress test")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="pulse_stress_inventory")
+    parser.add_argument("--buyers", type=int, default=3000)
+    parser.add_argument("--capacity", type=int, default=500)
+    parser.add_argument("--max-quantity", type=int, default=4)
+    parser.add_argument("--hold-seconds", type=float, default=2, help="hold lifetime for this run")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+    import server
+    from stripe_standin import StripeStandIn
+
+    scratch = AsyncIOMotorClient(args.mongo_url)
+    await scratch.drop_database(args.db_name)
+    scratch.close()
+
+    server.TICKET_HOLD_SECONDS = args.hold_seconds
+    app = server.create_app(server.Settings(
+        mongo_url=args.mongo_url,
+        db_name=args.db_name,
+        jwt_secret="stress-secret",
+        stripe_integration=StripeStandIn(latency=0.01, jitter=0.005).integration(),
+        run_background_tasks=False,
+        admission_control=False
+    ))
+    async with app.router.lifespan_context(app):
+        db = app.state.context.db
+        now = datetime.now(timezone.utc).isoformat()
+        users = [
+            {"id": str(uuid.uuid4()), "email": f"buyer{i}@example.com", "username": f"buyer{i}", "city": "kingston",
+             "password": "x", "created_at": now}
+            for i in range(args.buyers)
+        ]
+        await db.users.insert_many([dict(u) for u in users])
+        tokens = [server.create_access_token({"sub": u["id"]}) for u in users]
+        event_id = str(uuid.uuid4())
+        await db.events.insert_one({
+            "id": event_id, "title": "Flash Drop", "description": "stress", "city": "kingston",
+            "venue_name": "v", "venue_address": "a", "date": now[:10], "time": "10 PM", "genre": ["dancehall"],
+            "vibe": "lit", "price": "$20", "price_cents": 2000, "currency": "usd", "promoter_id": users[0]["id"], "promoter_name": "buyer0",
+            "is_featured": False, "attendee_count": 0, "capacity": args.capacity,
+            "tickets_available": args.capacity, "created_at": now
+        })
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://stress.test", timeout=None) as client:
+            started = time.perf_counter()
+            first = await wave(client, tokens, event_id, args.max_quantity,
+                               {"pay": 0.6, "cancel": 0.2, "abandon": 0.2}, rng)
+            await asyncio.sleep(args.hold_seconds)
+            released = await server.release_expired_holds()
+            after_release, _ = await audit(db, event_id, args.capacity)
+            second = await wave(client, tokens, event_id, args.max_quantity, {"pay": 1.0}, rng)
+            elapsed = time.perf_counter() - started
+
+        stock, checks = await audit(db, event_id, args.capacity)
+        report = {
+            "first_wave": first,
+            "expired_holds_released": released,
+            "available_after_release": after_release["available"],
+            "second_wave": second,
+            "final": stock,
+            "checks": checks,
+            "elapsed_s": round(elapsed, 2)
+        }
+        print(json.dumps(report, indent=2))
+    return 0 if all(checks.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
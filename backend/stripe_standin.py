@@ -0,0 +1,129 @@
+"""Local stand-in for emergentintegrations' StripeCheckout, used by the load test and benchmarks.
+
+    create_app(Settings(..., stripe_integration=StripeStandIn().integration()))
+
+Implements the three calls server.py makes with the same return shapes, plus configurable latency so
+checkout traffic costs roughly what a real round trip to Stripe would. Faults can be injected (and changed
+mid-run) to exercise the circuit breaker and deadlines:
+
+    standin = StripeStandIn(failure_rate=0.5, hang_rate=0.1, hang_seconds=30)
+    standin.failure_rate = 0  # Stripe "recovers"
+"""
+
+import asyncio
+import random
+import uuid
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+
+class StandInError(Exception):
+    """What an injected Stripe failure raises: a 500 from the API, as the real client would surface it"""
+    http_status = 500
+
+
+@dataclass
+class StandInCheckoutRequest:
+    amount: float
+    currency: str
+    success_url: str
+    cancel_url: str
+    metadata: Optional[Dict[str, str]] = None
+
+
+@dataclass
+class StandInSession:
+    url: str
+    session_id: str
+
+
+@dataclass
+class StandInStatus:
+    status: str
+    payment_status: str
+    amount_total: int
+    currency: str
+    metadata: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class StandInWebhook:
+    event_type: str
+    event_id: str
+    session_id: str
+    payment_status: str
+    metadata: Dict[str, str] = field(default_factory=dict)
+
+
+class StripeStandIn:
+    """Shared state for every StandInCheckout the app creates (it builds one per request)"""
+
+    def __init__(self, latency: float = 0.15, jitter: float = 0.05, paid_ratio: float = 1.0,
+                 failure_rate: float = 0.0, hang_rate: float = 0.0, hang_seconds: float = 60.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.paid_ratio = paid_ratio
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.sessions: Dict[str, StandInStatus] = {}
+        self.calls = 0
+        self.failures = 0
+        self.hangs = 0
+
+    async def delay(self):
+        """Simulated round trip; with the configured probabilities it hangs first, or fails after responding"""
+        self.calls += 1
+        if random.random() < self.hang_rate:
+            self.hangs += 1
+            await asyncio.sleep(self.hang_seconds)
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.failure_rate:
+            self.failures += 1
+            raise StandInError("Injected Stripe API error")
+
+    def checkout_class(self):
+        standin = self
+
+        class StandInCheckout:
+            def __init__(self, api_key: Optional[str] = None, webhook_url: Optional[str] = None):
+                self.webhook_url = webhook_url
+
+            async def create_checkout_session(self, request):
+                await standin.delay()
+                session_id = f"cs_test_{uuid.uuid4().hex}"
+                paid = random.random() < standin.paid_ratio
+                standin.sessions[session_id] = StandInStatus(
+                    status="complete" if paid else "open",
+                    payment_status="paid" if paid else "unpaid",
+                    amount_total=int(round(request.amount * 100)),
+                    currency=request.currency,
+                    metadata=dict(request.metadata or {}),
+                )
+                return StandInSession(url=f"https://checkout.stripe.test/{session_id}", session_id=session_id)
+
+            async def get_checkout_status(self, session_id: str):
+                await standin.delay()
+                status = standin.sessions.get(session_id)
+                if status is None:
+                    raise ValueError(f"No such checkout session: {session_id}")
+                return status
+
+            async def handle_webhook(self, body: bytes, signature: Optional[str]):
+                await standin.delay()
+                session_id = body.decode("utf-8").strip()
+                status = standin.sessions.get(session_id)
+                return StandInWebhook(
+                    event_type="checkout.session.completed",
+                    event_id=f"evt_{uuid.uuid4().hex}",
+                    session_id=session_id,
+                    payment_status=status.payment_status if status else "unpaid",
+                    metadata=status.metadata if status else {},
+                )
+
+        return StandInCheckout
+
+    def integration(self):
+        """Drop-in for `Settings.stripe_integration`"""
+        return SimpleNamespace(StripeCheckout=self.checkout_class(), CheckoutSessionRequest=StandInCheckoutRequest)
@@ -1,7 +1,6 @@
 import { useState, useEffect, useRef } from "react";
 import { useNavigate } from "react-router-dom";
-import { useCity, useAuth, API } from "@/App";
-import axios from "axios";
+import { useCity, useAuth } from "@/App";
 import { motion, AnimatePresence } from "framer-motion";
 import { 
   Send, 
@@ -46,7 +45,7 @@ export default function Chat() {
       return;
     }
     
-    fetchMessages();
+    setLoading(true);
     connectWebSocket();
 
     return () => {
@@ -60,39 +59,45 @@ export default function Chat() {
     scrollToBottom();
   }, [messages]);
 
-  const fetchMessages = async () => {
-    setLoading(true);
-    try {
-      const response = await axios.get(`${API}/chat/${selectedCity}/messages`);
-      setMessages(response.data);
-    } catch (error) {
-      console.error("Error fetching messages:", error);
-    } finally {
-      setLoading(false);
-    }
-  };
-
   const connectWebSocket = () => {
     const wsUrl = process.env.REACT_APP_BACKEND_URL.replace('https://', 'wss://').replace('http://', 'ws://');
-    const ws = new WebSocket(`${wsUrl}/ws/chat/${selectedCity}`);
+    const token = localStorage.getItem("pulse_token");
+    const query = token ? `?token=${encodeURIComponent(token)}` : "";
+    const ws = new WebSocket(`${wsUrl}/ws/chat/${selectedCity}${query}`);
 
     ws.onopen = () => {
       setConnected(true);
-      // Random online count for demo
-      setOnlineCount(Math.floor(Math.random() * 50) + 10);
+      // Heartbeat keeps this tab counted as online
+      ws.heartbeat = setInterval(() => {
+        if (ws.readyState === WebSocket.OPEN) {
+          ws.send(JSON.stringify({ type: "ping" }));
+        }
+      }, 20000);
     };
 
     ws.onmessage = (event) => {
       const message = JSON.parse(event.data);
-      setMessages(prev => [...prev, message]);
+      if (message.type === "history") {
+        // Backlog arrives as the first frame after connecting
+        setMessages(message.messages);
+        setLoading(false);
+      } else if (message.type === "presence") {
+        setOnlineCount(message.online);
+      } else if (message.type === "error") {
+        toast.error(message.detail);
+      } else if (!message.type) {
+        setMessages(prev => [...prev, message]);
+      }
     };
 
     ws.onerror = (error) => {
       console.error("WebSocket error:", error);
       setConnected(false);
+      setLoading(false);
     };
 
     ws.onclose = () => {
+      clearInterval(ws.heartbeat);
       setConnected(false);
       // Try to reconnect after 3 seconds
       setTimeout(() => {
@@ -119,10 +124,8 @@ export default function Chat() {
     }
 
     if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+      // Sender identity comes from the token the socket was opened with
       wsRef.current.send(JSON.stringify({
-        user_id: user.id,
-        username: user.username,
-        user_avatar: user.avatar_url,
         content: newMessage.trim()
       }));
       setNewMessage("");
@@ -81,6 +81,39 @@ export default function Profile() {
     }
   }, [user]);
 
+  useEffect(() => {
+    if (!user) return;
+    // The server pushes the unread count whenever it changes, on whichever worker it changed
+    const wsUrl = process.env.REACT_APP_BACKEND_URL.replace('https://', 'wss://').replace('http://', 'ws://');
+    const token = localStorage.getItem("pulse_token");
+    let ws;
+    let retry;
+    let closed = false;
+
+    const connect = () => {
+      ws = new WebSocket(`${wsUrl}/ws/notifications?token=${encodeURIComponent(token)}`);
+      ws.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.type === "unread_count") {
+          setUnreadCount(message.count);
+        }
+      };
+      ws.onclose = () => {
+        // Try to reconnect after 3 seconds
+        if (!closed) {
+          retry = setTimeout(connect, 3000);
+        }
+      };
+    };
+    connect();
+
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      ws.close();
+    };
+  }, [user]);
+
   const pollPaymentStatus = async (sessionId, attempts = 0) => {
     if (attempts >= 5) return;
     
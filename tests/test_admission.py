@@ -0,0 +1,128 @@
+import ipaddress
+
+import pytest
+
+import server
+from server import AppContext, RateLimiter, Settings, client_ip, client_key, create_access_token, throttle
+
+
+@pytest.fixture
+def settings():
+    """A current app context with admission control on, and a rate limiter of its own"""
+    settings = Settings(mongo_url="mongodb://localhost", db_name="test", jwt_secret="secret")
+    token = server.current_app_context.set(AppContext(settings))
+    limiter = server.rate_limiter
+    server.rate_limiter = RateLimiter(server.RATE_LIMITS, 100)
+    yield settings
+    server.rate_limiter = limiter
+    server.current_app_context.reset(token)
+
+
+@pytest.fixture
+def proxies(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8"), ipaddress.ip_network("127.0.0.1")])
+
+
+def scope(peer, forwarded=None, authorization=None):
+    headers = []
+    if forwarded is not None:
+        headers.append((b"x-forwarded-for", forwarded.encode()))
+    if authorization is not None:
+        headers.append((b"authorization", authorization.encode()))
+    return {"type": "http", "client": (peer, 12345), "headers": headers}
+
+
+def test_burst_then_one_token_per_interval():
+    limiter = RateLimiter({"login": (2.0, 3)}, 100)
+    assert [limiter.acquire("login", "ip:a", now=100.0) for _ in range(3)] == [None, None, None]
+    assert limiter.acquire("login", "ip:a", now=100.0) == pytest.approx(0.5)
+    assert limiter.acquire("login", "ip:a", now=100.25) == pytest.approx(0.25)
+    assert limiter.acquire("login", "ip:a", now=100.5) is None
+    assert limiter.acquire("login", "ip:a", now=100.5) == pytest.approx(0.5)
+
+
+def test_refused_calls_take_no_tokens():
+    limiter = RateLimiter({"login": (1.0, 1)}, 100)
+    assert limiter.acquire("login", "ip:a", now=0.0) is None
+    for _ in range(5):
+        assert limiter.acquire("login", "ip:a", now=0.5) == pytest.approx(0.5)
+    assert limiter.acquire("login", "ip:a", now=1.0) is None
+
+
+def test_idle_bucket_refills_to_burst_only():
+    limiter = RateLimiter({"chat": (1.0, 2)}, 100)
+    limiter.acquire("chat", "user:u", now=0.0)
+    results = [limiter.acquire("chat", "user:u", now=3600.0) for _ in range(3)]
+    assert results[:2] == [None, None]
+    assert results[2] == pytest.approx(1.0)
+
+
+def test_keys_and_classes_have_separate_buckets():
+    limiter = RateLimiter({"login": (1.0, 1), "chat": (1.0, 1)}, 100)
+    assert limiter.acquire("login", "ip:a", now=0.0) is None
+    assert limiter.acquire("login", "ip:a", now=0.0) is not None
+    assert limiter.acquire("login", "ip:b", now=0.0) is None
+    assert limiter.acquire("chat", "ip:a", now=0.0) is None
+
+
+def test_least_recently_seen_keys_are_dropped_past_the_cap():
+    limiter = RateLimiter({"login": (1.0, 1)}, 2)
+    for key in ("ip:a", "ip:b", "ip:c"):
+        assert limiter.acquire("login", key, now=0.0) is None
+    assert len(limiter.buckets["login"]) == 2
+    # "ip:a" was evicted, so it starts full again; "ip:c" was kept and is still empty
+    assert limiter.acquire("login", "ip:a", now=0.0) is None
+    assert limiter.acquire("login", "ip:c", now=0.0) is not None
+
+
+def test_untrusted_peer_ignores_forwarded_for(proxies):
+    assert client_ip(scope("203.0.113.9", forwarded="198.51.100.1")) == "ip:203.0.113.9"
+
+
+def test_trusted_peer_takes_nearest_untrusted_hop(proxies):
+    # The client can write anything at the left end; only hops added by trusted proxies are believed
+    forwarded = "1.1.1.1, 198.51.100.7, 10.0.0.2"
+    assert client_ip(scope("10.0.0.1", forwarded=forwarded)) == "ip:198.51.100.7"
+
+
+def test_trusted_peer_joins_repeated_headers(proxies):
+    request = scope("127.0.0.1", forwarded="198.51.100.7")
+    request["headers"].append((b"x-forwarded-for", b"10.0.0.3"))
+    assert client_ip(request) == "ip:198.51.100.7"
+
+
+def test_trusted_peer_without_header_is_itself(proxies):
+    assert client_ip(scope("10.0.0.1")) == "ip:10.0.0.1"
+    assert client_ip(scope("10.0.0.1", forwarded="10.0.0.2, 10.0.0.3")) == "ip:10.0.0.2"
+
+
+def test_no_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXIES", [])
+    assert client_ip(scope("127.0.0.1", forwarded="198.51.100.7")) == "ip:127.0.0.1"
+
+
+def test_client_key_prefers_a_valid_bearer_token(settings, proxies):
+    token = create_access_token({"sub": "user-1"})
+    assert client_key(scope("10.0.0.1", forwarded="198.51.100.7", authorization=f"Bearer {token}")) == "user:user-1"
+    assert client_key(scope("10.0.0.1", forwarded="198.51.100.7", authorization="Bearer forged")) == "ip:198.51.100.7"
+
+
+def test_client_key_is_worked_out_once_per_request(settings):
+    request = scope("203.0.113.9")
+    assert client_key(request) == "ip:203.0.113.9"
+    request["client"] = ("203.0.113.10", 1)
+    assert client_key(request) == "ip:203.0.113.9"
+
+
+def test_frames_are_limited_per_connection(settings):
+    _, burst = server.RATE_LIMITS["ws_message"]
+    assert all(throttle("ws_message", "socket:first") is None for _ in range(burst))
+    assert throttle("ws_message", "socket:first") is not None
+    # Another socket from the same address or user has a full bucket of its own
+    assert throttle("ws_message", "socket:second") is None
+
+
+def test_throttle_admits_everything_with_admission_control_off(settings):
+    settings.admission_control = False
+    _, burst = server.RATE_LIMITS["ws_message"]
+    assert all(throttle("ws_message", "socket:first") is None for _ in range(burst + 10))
@@ -0,0 +1,102 @@
+import pytest
+
+from server import CircuitBreaker, stripe_outage
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker(window=30, min_calls=4, error_ratio=0.5, cooldown=10)
+
+
+def fail(breaker, times, now=0.0):
+    for _ in range(times):
+        assert breaker.allow(now) is None
+        breaker.record(now, failed=True)
+
+
+def test_stays_closed_below_min_calls(breaker):
+    fail(breaker, 3)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_stays_closed_below_error_ratio(breaker):
+    for failed in (False, False, False, True, False, True, False):
+        breaker.record(0.0, failed)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_opens_at_error_ratio(breaker):
+    breaker.record(0.0, False)
+    breaker.record(0.0, False)
+    fail(breaker, 2)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_old_outcomes_leave_the_window(breaker):
+    fail(breaker, 3, now=0.0)
+    breaker.record(31.0, False)
+    breaker.record(31.0, True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert len(breaker.outcomes) == 2 and breaker.failures == 1
+
+
+def test_open_refuses_until_cooldown(breaker):
+    fail(breaker, 4, now=100.0)
+    assert breaker.allow(104.0) == pytest.approx(6.0)
+    # Calls started before the trip don't change anything when they finish
+    breaker.record(105.0, False)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_half_open_lets_one_probe_through(breaker):
+    fail(breaker, 4, now=100.0)
+    assert breaker.allow(110.0) is None
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow(110.0) is not None
+
+
+def test_successful_probe_closes(breaker):
+    fail(breaker, 4, now=100.0)
+    breaker.allow(110.0)
+    breaker.record(110.5, False)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow(110.5) is None
+    assert not breaker.outcomes
+
+
+def test_failed_probe_reopens_for_another_cooldown(breaker):
+    fail(breaker, 4, now=100.0)
+    breaker.allow(110.0)
+    breaker.record(111.0, True)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow(112.0) == pytest.approx(9.0)
+
+
+def test_released_probe_frees_the_slot(breaker):
+    fail(breaker, 4, now=100.0)
+    breaker.allow(110.0)
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow(110.0) is None
+
+
+class StripeError(Exception):
+    def __init__(self, http_status=None):
+        super().__init__("stripe")
+        self.http_status = http_status
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+@pytest.mark.parametrize("error, outage", [
+    (ConnectionResetError(), True),
+    (APIConnectionError(), True),
+    (StripeError(502), True),
+    (StripeError(404), False),
+    (StripeError(400), False),
+    (ValueError("bad signature"), False),
+])
+def test_only_stripe_outages_count_against_the_breaker(error, outage):
+    assert stripe_outage(error) is outage
@@ -0,0 +1,125 @@
+import random
+import uuid
+
+import pytest
+
+from server import EventIndex
+
+CITIES = ["kingston", "miami", "nyc"]
+GENRES = ["dancehall", "edm", "jazz", "reggae"]
+VIBES = ["chill", "lit"]
+DATES = [f"2026-11-{day:02d}" for day in range(1, 8)]
+PRICES = [None, 0, 1000, 1000, 2500, 5000]
+
+
+def make_event(rng):
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "city": rng.choice(CITIES),
+        "genre": rng.sample(GENRES, rng.randint(1, 2)),
+        "vibe": rng.choice(VIBES),
+        "date": rng.choice(DATES),
+        "is_featured": rng.random() < 0.2,
+        "price_cents": rng.choice(PRICES)
+    }
+
+
+def fallback(events, city=None, genre=None, vibe=None, dates=None, featured=False, min_cents=None, max_cents=None,
+             sort="date", limit=50):
+    """What find_events' Mongo query returns: the same filters, sorted by the same keys with id last"""
+    priced = min_cents is not None or max_cents is not None or sort != "date"
+    matches = [
+        event for event in events
+        if (city is None or event["city"] == city)
+        and (genre is None or genre in event["genre"])
+        and (vibe is None or event["vibe"] == vibe)
+        and (dates is None or event["date"] in dates)
+        and (not featured or event["is_featured"])
+        and (not priced or (event["price_cents"] is not None and event["price_cents"] >= (min_cents or 0)
+                            and (max_cents is None or event["price_cents"] <= max_cents)))
+    ]
+    if sort == "date":
+        matches.sort(key=lambda event: (event["date"], event["id"]))
+    else:
+        direction = -1 if sort == "-price" else 1
+        matches.sort(key=lambda event: (direction * event["price_cents"], event["date"], event["id"]))
+    return [event["id"] for event in matches[:limit]]
+
+
+def random_query(rng):
+    query = {"sort": rng.choice(["date", "price", "-price"]), "limit": rng.choice([1, 5, 50, 100])}
+    if rng.random() < 0.5:
+        query["city"] = rng.choice(CITIES + ["london"])
+    if rng.random() < 0.3:
+        query["genre"] = rng.choice(GENRES)
+    if rng.random() < 0.3:
+        query["vibe"] = rng.choice(VIBES)
+    if rng.random() < 0.3:
+        query["dates"] = rng.sample(DATES, 3)
+    if rng.random() < 0.2:
+        query["featured"] = True
+    if rng.random() < 0.3:
+        query["min_cents"] = rng.choice([0, 1000, 3000])
+    if rng.random() < 0.3:
+        query["max_cents"] = rng.choice([0, 1000, 5000])
+    return query
+
+
+def assert_matches_fallback(index, events, rng, queries=200):
+    for _ in range(queries):
+        query = random_query(rng)
+        assert index.search(**query) == fallback(events, **query), query
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_search_matches_the_mongo_fallback(seed):
+    rng = random.Random(seed)
+    events = [make_event(rng) for _ in range(2000)]
+    index = EventIndex()
+    index.add_many(events)
+    assert_matches_fallback(index, events, rng)
+
+
+def test_search_after_small_and_large_additions():
+    # A few rows are inserted into the price orders in place; big batches mark them for a re-sort
+    rng = random.Random(4)
+    events = []
+    index = EventIndex()
+    for size in (1, 3, 500, 2, 200, 1):
+        batch = [make_event(rng) for _ in range(size)]
+        events.extend(batch)
+        index.add_many(batch)
+        assert_matches_fallback(index, events, rng, queries=50)
+
+
+def test_search_after_price_and_featured_edits():
+    rng = random.Random(5)
+    events = [make_event(rng) for _ in range(1000)]
+    index = EventIndex()
+    index.add_many(events)
+    index.price_orders()
+    for event in rng.sample(events, 100):
+        event["price_cents"] = rng.choice(PRICES)
+        event["is_featured"] = not event["is_featured"]
+        index.update(event)
+    assert_matches_fallback(index, events, rng)
+
+
+def test_ties_are_broken_by_id_whatever_the_arrival_order():
+    events = [{"id": event_id, "city": "nyc", "genre": ["edm"], "vibe": "lit", "date": "2026-11-01",
+               "is_featured": False, "price_cents": 1000} for event_id in ("c", "a", "b")]
+    index = EventIndex()
+    for event in events:
+        index.add(event)
+    for sort in ("date", "price", "-price"):
+        assert index.search(sort=sort) == ["a", "b", "c"]
+        assert index.search(city="nyc", sort=sort, limit=2) == ["a", "b"]
+
+
+def test_unknown_values_match_nothing():
+    rng = random.Random(6)
+    index = EventIndex()
+    index.add_many([make_event(rng) for _ in range(100)])
+    assert index.search(city="london") == []
+    assert index.search(dates=["2030-01-01"]) == []
+    assert index.search(min_cents=10 ** 6) == []
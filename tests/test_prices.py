@@ -0,0 +1,43 @@
+import pytest
+
+from server import price_components
+
+
+@pytest.mark.parametrize("price, city, expected", [
+    ("J$1,500", "kingston", (150000, "jmd")),
+    ("J$1,500", None, (150000, "jmd")),
+    ("TT$100", None, (10000, "ttd")),
+    ("US$20", "kingston", (2000, "usd")),
+    ("CA$30", None, (3000, "cad")),
+    ("$1,250 USD", "kingston", (125000, "usd")),
+    ("JMD 1500", None, (150000, "jmd")),
+    ("€25", None, (2500, "eur")),
+    ("Free", None, (0, "usd")),
+    ("$20 - $40", "nyc", (2000, "usd")),
+    ("Doors 9:00 PM, J$2,000", "kingston", (200000, "jmd")),
+])
+def test_reads_explicit_currencies(price, city, expected):
+    assert price_components(price, city) == expected
+
+
+def test_bare_dollar_is_the_city_currency():
+    assert price_components("$15", "kingston") == (1500, "jmd")
+    assert price_components("$15", "Miami") == (1500, "usd")
+
+
+@pytest.mark.parametrize("price, city", [
+    ("$15", "london"),
+    ("$15", None),
+    ("1500", None),
+    ("Free before 11pm, $15 after", "miami"),
+    ("J$1000 / US$10", "kingston"),
+    ("TBA", "nyc"),
+    ("", "kingston"),
+    (None, None),
+])
+def test_ambiguous_prices_have_no_cents(price, city):
+    assert price_components(price, city)[0] is None
+
+
+def test_times_are_not_amounts():
+    assert price_components("$15 after 11pm", "miami") == (1500, "usd")
@@ -0,0 +1,64 @@
+import pytest
+from fastapi import HTTPException
+
+import server
+from server import AppContext, Settings, WaitingRoom, WaitingRooms
+
+
+def room(admit_per_minute=30, next_seq=100, base_admitted=10, base_time=1000.0):
+    return WaitingRoom({"event_id": "e1", "admit_per_minute": admit_per_minute, "next_seq": next_seq,
+                        "base_admitted": base_admitted, "base_time": base_time})
+
+
+@pytest.fixture
+def settings():
+    settings = Settings(mongo_url="mongodb://localhost", db_name="test", jwt_secret="secret")
+    token = server.current_app_context.set(AppContext(settings))
+    yield settings
+    server.current_app_context.reset(token)
+
+
+def test_allowance_grows_at_the_admission_rate():
+    assert room().allowance(1000.0) == 10
+    assert room().allowance(1001.9) == 10
+    assert room().allowance(1002.0) == 11
+    assert room().allowance(1060.0) == 40
+
+
+def test_admission_stops_at_the_end_of_the_line():
+    assert room().admitted_through(1060.0) == 40
+    assert room().admitted_through(2000.0) == 100
+
+
+def test_status_of_someone_still_waiting():
+    assert room().status(25, 1010.0) == {"admitted": False, "position": 10, "estimated_wait_seconds": 20}
+
+
+def test_status_once_admitted():
+    for seq in (1, 15, 30):
+        assert room().status(seq, 1040.0) == {"admitted": True, "position": 0, "estimated_wait_seconds": 0}
+
+
+def test_wait_estimate_follows_the_rate():
+    assert room(admit_per_minute=600).status(70, 1000.0)["estimated_wait_seconds"] == 6
+
+
+def test_queue_token_round_trip(settings):
+    rooms = WaitingRooms()
+    token = rooms.issue_token(room(), "u1", 42)
+    assert rooms.token_seq(token, "e1", "u1") == 42
+
+
+@pytest.mark.parametrize("event_id, user_id", [("e2", "u1"), ("e1", "u2")])
+def test_queue_token_is_bound_to_event_and_user(settings, event_id, user_id):
+    rooms = WaitingRooms()
+    token = rooms.issue_token(room(), "u1", 42)
+    with pytest.raises(HTTPException) as error:
+        rooms.token_seq(token, event_id, user_id)
+    assert error.value.status_code == 403
+
+
+def test_access_token_is_not_a_queue_token(settings):
+    token = server.create_access_token({"sub": "u1", "event_id": "e1", "uid": "u1", "seq": 1})
+    with pytest.raises(HTTPException):
+        WaitingRooms().token_seq(token, "e1", "u1")